@@ -16,7 +16,7 @@ sys.path.insert(0, str(Path(__file__).resolve().parent))
 
 # Import your models and database configuration
 from app.database import Base
-from app.models import User, Category, Expense, Translation  # noqa: F401
+from app.models import User, Category, CategoryClosure, Expense, ExpenseMonthlyRollup, Translation  # noqa: F401
 from app.config import config
 
 # this is the Alembic Config object
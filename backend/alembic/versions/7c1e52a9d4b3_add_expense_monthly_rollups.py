@@ -0,0 +1,53 @@
+"""add expense monthly rollups
+
+Revision ID: 7c1e52a9d4b3
+Revises: 032ca5d6ab81
+Create Date: 2026-10-18 09:12:44.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1e52a9d4b3'
+down_revision = '032ca5d6ab81'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    # La table peut déjà exister si init_db() (create_all) a tourné avant la migration
+    if 'expense_monthly_rollups' not in inspector.get_table_names():
+        op.create_table(
+            'expense_monthly_rollups',
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('month', sa.Date(), nullable=False),
+            sa.Column('category_id', sa.Integer(), sa.ForeignKey('categories.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('currency', sa.String(length=3), nullable=False),
+            sa.Column('total', sa.Numeric(14, 2), nullable=False),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('user_id', 'month', 'category_id', 'currency'),
+        )
+
+    # Backfill depuis les dépenses existantes
+    if bind.dialect.name == 'postgresql':
+        month_expr = "CAST(date_trunc('month', created_at) AS DATE)"
+    else:
+        month_expr = "date(created_at, 'start of month')"
+    op.execute(sa.text('DELETE FROM expense_monthly_rollups'))
+    op.execute(sa.text(
+        f"""
+        INSERT INTO expense_monthly_rollups (user_id, month, category_id, currency, total, count)
+        SELECT user_id, {month_expr}, category_id, currency, SUM(amount), COUNT(*)
+        FROM expenses
+        GROUP BY user_id, {month_expr}, category_id, currency
+        """
+    ))
+
+
+def downgrade() -> None:
+    op.drop_table('expense_monthly_rollups')
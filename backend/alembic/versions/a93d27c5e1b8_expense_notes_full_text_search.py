@@ -0,0 +1,86 @@
+"""full-text search index on expense notes
+
+Revision ID: a93d27c5e1b8
+Revises: e61f0b9c4a27
+Create Date: 2026-10-18 23:41:15.502113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a93d27c5e1b8'
+down_revision = 'e61f0b9c4a27'
+branch_labels = None
+depends_on = None
+
+SQLITE_STATEMENTS = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5(
+        note, content='expenses', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS expenses_fts_insert AFTER INSERT ON expenses
+    WHEN new.note IS NOT NULL BEGIN
+        INSERT INTO expenses_fts(rowid, note) VALUES (new.id, new.note);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS expenses_fts_delete AFTER DELETE ON expenses
+    WHEN old.note IS NOT NULL BEGIN
+        INSERT INTO expenses_fts(expenses_fts, rowid, note) VALUES ('delete', old.id, old.note);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS expenses_fts_update AFTER UPDATE OF note ON expenses BEGIN
+        INSERT INTO expenses_fts(expenses_fts, rowid, note)
+            SELECT 'delete', old.id, old.note WHERE old.note IS NOT NULL;
+        INSERT INTO expenses_fts(rowid, note) SELECT new.id, new.note WHERE new.note IS NOT NULL;
+    END
+    """,
+)
+
+
+# unaccent n'est que STABLE : l'enveloppe IMMUTABLE le rend utilisable dans
+# l'expression indexée, comme remove_diacritics côté SQLite
+POSTGRESQL_STATEMENTS = (
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    """
+    CREATE OR REPLACE FUNCTION expenses_unaccent(text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_expenses_note_fts ON expenses "
+    "USING gin ((to_tsvector('simple'::regconfig, expenses_unaccent(COALESCE(note, ''::text)))))",
+)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        for statement in POSTGRESQL_STATEMENTS:
+            op.execute(statement)
+        return
+
+    # La table peut déjà exister si init_db() (create_all) a tourné avant la migration
+    exists = bind.execute(sa.text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'expenses_fts'"
+    )).first()
+    for statement in SQLITE_STATEMENTS:
+        op.execute(statement)
+    if not exists:
+        # Indexer les notes déjà présentes
+        op.execute("INSERT INTO expenses_fts(expenses_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS idx_expenses_note_fts")
+        op.execute("DROP FUNCTION IF EXISTS expenses_unaccent(text)")
+        return
+    for trigger in ('expenses_fts_insert', 'expenses_fts_delete', 'expenses_fts_update'):
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.execute("DROP TABLE IF EXISTS expenses_fts")
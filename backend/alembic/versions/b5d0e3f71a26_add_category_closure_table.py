@@ -0,0 +1,58 @@
+"""add category closure table
+
+Revision ID: b5d0e3f71a26
+Revises: 7c1e52a9d4b3
+Create Date: 2026-10-18 11:03:27.550931
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d0e3f71a26'
+down_revision = '7c1e52a9d4b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    # La table peut déjà exister si init_db() (create_all) a tourné avant la migration
+    if 'category_closure' not in inspector.get_table_names():
+        op.create_table(
+            'category_closure',
+            sa.Column('ancestor_id', sa.Integer(), sa.ForeignKey('categories.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('descendant_id', sa.Integer(), sa.ForeignKey('categories.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('depth', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id'),
+        )
+        op.create_index(
+            'idx_category_closure_descendant_depth',
+            'category_closure',
+            ['descendant_id', 'depth'],
+        )
+
+    # Backfill : une ligne par couple (ancêtre, descendant), y compris le lien à soi-même.
+    # La profondeur est bornée pour ne pas boucler sur d'éventuels cycles parent_id.
+    op.execute(sa.text('DELETE FROM category_closure'))
+    op.execute(sa.text(
+        """
+        WITH RECURSIVE tree(ancestor_id, descendant_id, depth) AS (
+            SELECT id, id, 0 FROM categories
+            UNION ALL
+            SELECT tree.ancestor_id, categories.id, tree.depth + 1
+            FROM tree JOIN categories ON categories.parent_id = tree.descendant_id
+            WHERE tree.depth < 100
+        )
+        INSERT INTO category_closure (ancestor_id, descendant_id, depth)
+        SELECT ancestor_id, descendant_id, MIN(depth) FROM tree GROUP BY ancestor_id, descendant_id
+        """
+    ))
+
+
+def downgrade() -> None:
+    op.drop_index('idx_category_closure_descendant_depth', table_name='category_closure')
+    op.drop_table('category_closure')
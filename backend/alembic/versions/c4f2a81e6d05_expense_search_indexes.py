@@ -0,0 +1,34 @@
+"""composite indexes for expense category and amount filters
+
+Revision ID: c4f2a81e6d05
+Revises: a93d27c5e1b8
+Create Date: 2026-10-18 23:41:12.504118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4f2a81e6d05'
+down_revision = 'a93d27c5e1b8'
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    'idx_expenses_user_category_created': ['user_id', 'category_id', 'created_at'],
+    'idx_expenses_user_amount': ['user_id', 'amount'],
+}
+
+
+def upgrade() -> None:
+    # Les index peuvent déjà exister si init_db() (create_all) a tourné avant la migration
+    existing_indexes = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('expenses')}
+    for name, columns in INDEXES.items():
+        if name not in existing_indexes:
+            op.create_index(name, 'expenses', columns)
+
+
+def downgrade() -> None:
+    for name in INDEXES:
+        op.drop_index(name, table_name='expenses')
@@ -0,0 +1,59 @@
+"""store category full_path and depth
+
+Revision ID: d8a4c6e2f913
+Revises: b5d0e3f71a26
+Create Date: 2026-10-18 14:20:51.204117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8a4c6e2f913'
+down_revision = 'b5d0e3f71a26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    # Les colonnes peuvent déjà exister si init_db() (create_all) a tourné avant la migration
+    columns = {column['name'] for column in inspector.get_columns('categories')}
+    if 'full_path' not in columns:
+        op.add_column('categories', sa.Column('full_path', sa.Text(), nullable=False, server_default=''))
+    if 'depth' not in columns:
+        op.add_column('categories', sa.Column('depth', sa.Integer(), nullable=False, server_default='0'))
+
+    # Backfill : chemin et profondeur calculés depuis les racines.
+    # La profondeur est bornée pour ne pas boucler sur d'éventuels cycles parent_id.
+    op.execute(sa.text(
+        """
+        WITH RECURSIVE paths(id, full_path, depth) AS (
+            SELECT id, CAST(name AS TEXT), 0 FROM categories WHERE parent_id IS NULL
+            UNION ALL
+            SELECT categories.id, paths.full_path || ' / ' || categories.name, paths.depth + 1
+            FROM paths JOIN categories ON categories.parent_id = paths.id
+            WHERE paths.depth < 100
+        )
+        UPDATE categories
+        SET full_path = (SELECT paths.full_path FROM paths WHERE paths.id = categories.id),
+            depth = (SELECT paths.depth FROM paths WHERE paths.id = categories.id)
+        WHERE id IN (SELECT id FROM paths)
+        """
+    ))
+    # Catégories prises dans un cycle : au moins leur propre nom
+    op.execute(sa.text("UPDATE categories SET full_path = name WHERE full_path = ''"))
+
+    existing_indexes = {index['name'] for index in inspector.get_indexes('categories')}
+    if 'idx_categories_user_full_path' not in existing_indexes:
+        op.create_index('idx_categories_user_full_path', 'categories', ['user_id', 'full_path'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_categories_user_full_path', table_name='categories')
+    with op.batch_alter_table('categories') as batch_op:
+        batch_op.drop_column('depth')
+        batch_op.drop_column('full_path')
@@ -0,0 +1,71 @@
+"""unique index on category name per user and parent
+
+Revision ID: e61f0b9c4a27
+Revises: d8a4c6e2f913
+Create Date: 2026-10-18 21:52:07.318840
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e61f0b9c4a27'
+down_revision = 'd8a4c6e2f913'
+branch_labels = None
+depends_on = None
+
+INDEX_NAME = 'uq_categories_user_parent_lower_name'
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    # L'index peut déjà exister si init_db() (create_all) a tourné avant la migration
+    existing_indexes = {index['name'] for index in inspector.get_indexes('categories')}
+    if INDEX_NAME in existing_indexes:
+        return
+
+    # Doublons hérités du contrôle applicatif (concurrence, casse) : la plus
+    # ancienne catégorie garde son nom, les autres sont suffixées par leur id
+    result = bind.execute(sa.text(
+        """
+        UPDATE categories
+        SET name = SUBSTR(name, 1, 80) || ' (' || CAST(id AS VARCHAR(20)) || ')'
+        WHERE EXISTS (
+            SELECT 1 FROM categories AS other
+            WHERE other.user_id = categories.user_id
+              AND COALESCE(other.parent_id, 0) = COALESCE(categories.parent_id, 0)
+              AND LOWER(other.name) = LOWER(categories.name)
+              AND other.id < categories.id
+        )
+        """
+    ))
+    if result.rowcount:
+        # Les chemins stockés des catégories renommées et de leurs descendants
+        op.execute(sa.text(
+            """
+            WITH RECURSIVE paths(id, full_path) AS (
+                SELECT id, CAST(name AS TEXT) FROM categories WHERE parent_id IS NULL
+                UNION ALL
+                SELECT categories.id, paths.full_path || ' / ' || categories.name
+                FROM paths JOIN categories ON categories.parent_id = paths.id
+                WHERE categories.depth <= 100
+            )
+            UPDATE categories
+            SET full_path = (SELECT paths.full_path FROM paths WHERE paths.id = categories.id)
+            WHERE id IN (SELECT id FROM paths)
+            """
+        ))
+
+    op.create_index(
+        INDEX_NAME,
+        'categories',
+        ['user_id', sa.text('COALESCE(parent_id, 0)'), sa.text('LOWER(name)')],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(INDEX_NAME, table_name='categories')
@@ -7,6 +7,11 @@ from typing import Any
 
 _DEFAULT_TTL = 60  # seconds
 _CACHE: dict[str, tuple[datetime, Any]] = {}
+# Compteurs de version par préfixe, incrémentés à chaque invalidation : un
+# artefact dérivé des données (export sur disque...) peut s'y référer sans
+# avoir à être supprimé explicitement
+_VERSIONS: dict[str, int] = {}
+_GLOBAL_VERSION = 0
 
 # Métriques de cache pour le monitoring
 _cache_stats = {
@@ -41,17 +46,25 @@ def set(key: str, value: Any, *, ttl: int = _DEFAULT_TTL) -> None:
 
 def invalidate(prefix: str | None = None) -> None:
     """Invalidate cache entries, updating statistics."""
+    global _GLOBAL_VERSION
     if prefix is None:
+        _GLOBAL_VERSION += 1
         count = len(_CACHE)
         _CACHE.clear()
         _cache_stats["invalidations"] += count
         return
+    _VERSIONS[prefix] = _VERSIONS.get(prefix, 0) + 1
     keys_to_delete = [key for key in _CACHE if key.startswith(prefix)]
     for key in keys_to_delete:
         _CACHE.pop(key, None)
     _cache_stats["invalidations"] += len(keys_to_delete)
 
 
+def version(prefix: str) -> str:
+    """Return the current version of ``prefix``; it changes on every invalidation of it."""
+    return f"{_GLOBAL_VERSION}.{_VERSIONS.get(prefix, 0)}"
+
+
 def get_stats() -> dict[str, Any]:
     """Get cache statistics for monitoring."""
     total_requests = _cache_stats["hits"] + _cache_stats["misses"]
@@ -0,0 +1,169 @@
+"""Closure table maintenance and lookups for the category hierarchy.
+
+``category_closure`` stores one row per (ancestor, descendant) pair, including
+the ``depth 0`` self link. Paths, ancestors and subtrees are then single
+indexed lookups instead of walking ``parent_id`` pointers in Python.
+"""
+
+from __future__ import annotations
+
+from sqlalchemy import delete, func, insert, literal, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from . import models
+
+# Garde-fou contre d'éventuels cycles parent_id dans des données historiques
+MAX_DEPTH = 100
+
+PATH_SEPARATOR = " / "
+
+
+def join_path(parent_path: str | None, name: str) -> str:
+    """Return the full path of a category named ``name`` under ``parent_path``."""
+    return f"{parent_path}{PATH_SEPARATOR}{name}" if parent_path else name
+
+
+def subtree_ids_query(category_id: int):
+    """SELECT of the ids of a category and all of its descendants."""
+    closure = models.CategoryClosure
+    return select(closure.descendant_id).where(closure.ancestor_id == category_id)
+
+
+def ancestor_ids_query(category_id: int, *, include_self: bool = False):
+    """SELECT of the ids of a category's ancestors (nearest first)."""
+    closure = models.CategoryClosure
+    query = select(closure.ancestor_id).where(closure.descendant_id == category_id)
+    if not include_self:
+        query = query.where(closure.depth > 0)
+    return query.order_by(closure.depth)
+
+
+async def subtree_ids(session: AsyncSession, category_id: int) -> list[int]:
+    """Return the ids of a category and all of its descendants."""
+    return list((await session.execute(subtree_ids_query(category_id))).scalars())
+
+
+async def add_category(session: AsyncSession, category_id: int, parent_id: int | None) -> None:
+    """Insert the closure rows of a newly created category."""
+    closure = models.CategoryClosure
+    await session.execute(
+        insert(closure).values(ancestor_id=category_id, descendant_id=category_id, depth=0)
+    )
+    if parent_id is not None:
+        await session.execute(
+            insert(closure).from_select(
+                ["ancestor_id", "descendant_id", "depth"],
+                select(closure.ancestor_id, literal(category_id), closure.depth + 1).where(
+                    closure.descendant_id == parent_id
+                ),
+            )
+        )
+
+
+async def add_categories(session: AsyncSession, category_ids: list[int]) -> None:
+    """Insert the closure rows of many new categories whose parents are already linked."""
+    if not category_ids:
+        return
+    closure = models.CategoryClosure
+    category = models.Category
+    await session.execute(
+        insert(closure),
+        [{"ancestor_id": category_id, "descendant_id": category_id, "depth": 0} for category_id in category_ids],
+    )
+    await session.execute(
+        insert(closure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(closure.ancestor_id, category.id, closure.depth + 1)
+            .join(category, category.parent_id == closure.descendant_id)
+            .where(category.id.in_(category_ids)),
+        )
+    )
+
+
+async def move_category(session: AsyncSession, category_id: int, new_parent_id: int | None) -> None:
+    """Re-link a category's subtree under ``new_parent_id``.
+
+    Raises ``ValueError`` if the new parent belongs to the subtree itself.
+    """
+    closure = models.CategoryClosure
+    subtree = await subtree_ids(session, category_id)
+    if new_parent_id is not None and new_parent_id in subtree:
+        raise ValueError("A category cannot be moved under itself or one of its descendants")
+
+    old_ancestors = list((await session.execute(ancestor_ids_query(category_id))).scalars())
+    if old_ancestors:
+        await session.execute(
+            delete(closure).where(
+                closure.descendant_id.in_(subtree),
+                closure.ancestor_id.in_(old_ancestors),
+            )
+        )
+
+    if new_parent_id is not None:
+        parent_links = aliased(closure)
+        subtree_links = aliased(closure)
+        await session.execute(
+            insert(closure).from_select(
+                ["ancestor_id", "descendant_id", "depth"],
+                select(
+                    parent_links.ancestor_id,
+                    subtree_links.descendant_id,
+                    parent_links.depth + subtree_links.depth + 1,
+                )
+                .select_from(parent_links)
+                .join(subtree_links, subtree_links.ancestor_id == category_id)
+                .where(parent_links.descendant_id == new_parent_id),
+            )
+        )
+
+
+async def rewrite_subtree_paths(
+    session: AsyncSession,
+    category_id: int,
+    old_path: str,
+    new_path: str,
+    depth_delta: int,
+) -> None:
+    """Replace the ``old_path`` prefix by ``new_path`` for a category and its descendants.
+
+    A single set-based UPDATE driven by the closure table; categories outside
+    the subtree are never touched.
+    """
+    category = models.Category
+    await session.execute(
+        update(category)
+        .where(category.id.in_(subtree_ids_query(category_id)))
+        .values(
+            full_path=literal(new_path) + func.substr(category.full_path, len(old_path) + 1),
+            depth=category.depth + depth_delta,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def remove_categories(session: AsyncSession, category_ids: list[int]) -> None:
+    """Delete every closure row touching the given (deleted) categories."""
+    if not category_ids:
+        return
+    closure = models.CategoryClosure
+    await session.execute(delete(closure).where(closure.descendant_id.in_(category_ids)))
+
+
+REBUILD_SQL = f"""
+WITH RECURSIVE tree(ancestor_id, descendant_id, depth) AS (
+    SELECT id, id, 0 FROM categories
+    UNION ALL
+    SELECT tree.ancestor_id, categories.id, tree.depth + 1
+    FROM tree JOIN categories ON categories.parent_id = tree.descendant_id
+    WHERE tree.depth < {MAX_DEPTH}
+)
+INSERT INTO category_closure (ancestor_id, descendant_id, depth)
+SELECT ancestor_id, descendant_id, MIN(depth) FROM tree GROUP BY ancestor_id, descendant_id
+"""
+
+
+async def rebuild(session: AsyncSession) -> None:
+    """Recompute the whole closure table from ``categories.parent_id``."""
+    await session.execute(delete(models.CategoryClosure))
+    await session.execute(text(REBUILD_SQL))
@@ -2,25 +2,52 @@
 
 from __future__ import annotations
 
-from collections.abc import Sequence
-from datetime import datetime, timedelta
+from collections.abc import AsyncIterator, Callable, Iterable, Sequence
+from datetime import date, datetime, timedelta
 import csv
 import io
+import re
 from enum import Enum
 from typing import Literal
 
-from openpyxl import Workbook
-
-from sqlalchemy import and_, case, func, select
-from sqlalchemy.orm import selectinload
+from pydantic import ValidationError
+from sqlalchemy import (
+    Float,
+    Row,
+    Text,
+    case,
+    cast,
+    column,
+    delete,
+    event,
+    func,
+    insert,
+    literal,
+    literal_column,
+    select,
+    table,
+    union_all,
+    update,
+)
+from sqlalchemy.orm import lazyload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from . import models, schemas
+from . import category_tree, exports, fx, models, rollups, schemas, timeseries
+from .note_suggest import UserNotes, note_index
+from .cache import get as cache_get, invalidate as cache_invalidate, set as cache_set, version as cache_version
 from .database import get_session
 
 
+# Clé de ``session.info`` où une session mémorise les arbres de catégories lus
+_CATEGORY_PATHS_MEMO = "category_paths"
+# Clé de ``session.info`` des variations de notes à reporter dans l'index
+# d'autocomplétion une fois la transaction validée
+_NOTE_CHANGES = "note_changes"
+
+
 class CategoryNameConflictError(Exception):
     """Raised when trying to create a category with a duplicate name."""
 
@@ -128,41 +155,124 @@ async def get_user_by_id(session: AsyncSession, user_id: int) -> models.User | N
     return await session.get(models.User, user_id)
 
 
-async def _load_category_map(session: AsyncSession, user_id: int | None = None) -> dict[int, tuple[str, int | None]]:
-    query = select(models.Category.id, models.Category.name, models.Category.parent_id)
-    if user_id is not None:
-        query = query.where(models.Category.user_id == user_id)
-    rows = await session.execute(query)
-    return {row.id: (row.name, row.parent_id) for row in rows.all()}
+async def category_paths(session: AsyncSession, user_id: int, *, refresh: bool = False) -> dict[int, str]:
+    """Return ``{category_id: full_path}`` for every category of a user.
 
+    The map is cached per process under the current version of the
+    ``categories:{user_id}`` prefix, which every category write bumps, and
+    memoized on the session so a request reads it at most once. Callers must
+    not modify it.
+    """
+    prefix = f"categories:{user_id}"
+    current = cache_version(prefix)
+    memo = session.info.setdefault(_CATEGORY_PATHS_MEMO, {})
+    if not refresh and user_id in memo and memo[user_id][0] == current:
+        return memo[user_id][1]
+
+    key = f"{prefix}:paths:{current}"
+    paths = None if refresh else cache_get(key)
+    if paths is None:
+        result = await session.execute(
+            select(models.Category.id, models.Category.full_path).where(models.Category.user_id == user_id)
+        )
+        paths = {category_id: full_path for category_id, full_path in result.tuples()}
+        # Clé liée à la version lue avant la requête : une lecture concurrente
+        # d'une écriture ne peut pas réinstaller un arbre périmé
+        cache_set(key, paths, ttl=300)
+    memo[user_id] = (current, paths)
+    return paths
 
-def _build_category_path_from_map(
-    category_id: int | None, category_map: dict[int, tuple[str, int | None]]
-) -> str:
-    if category_id is None:
-        return "Non classé"
 
-    parts: list[str] = []
-    current_id: int | None = category_id
-    visited: set[int] = set()
+async def _owned_category_paths(session: AsyncSession, user_id: int, category_ids: Iterable[int]) -> dict[int, str]:
+    """Return the paths of those ``category_ids`` that belong to the user."""
+    wanted = set(category_ids)
+    paths = await category_paths(session, user_id)
+    if not wanted.issubset(paths):
+        # Catégorie créée depuis la mise en cache (ou pas à cet utilisateur)
+        paths = await category_paths(session, user_id, refresh=True)
+    return {category_id: paths[category_id] for category_id in wanted if category_id in paths}
+
+
+async def _owned_category_path(session: AsyncSession, user_id: int, category_id: int) -> str | None:
+    return (await _owned_category_paths(session, user_id, [category_id])).get(category_id)
+
+
+def _categories_changed(session: AsyncSession, user_id: int) -> None:
+    """Bump the category map version now and again when the transaction ends.
+
+    The second bump discards any map loaded in the meantime, whether by
+    another request (before the commit) or by this session (uncommitted rows
+    that a rollback removes).
+    """
+    prefix = f"categories:{user_id}"
+    cache_invalidate(prefix)
+    session.info.get(_CATEGORY_PATHS_MEMO, {}).pop(user_id, None)
+    for event_name in ("after_commit", "after_rollback"):
+        event.listen(session.sync_session, event_name, lambda _: cache_invalidate(prefix), once=True)
+
 
-    while current_id is not None and current_id not in visited:
-        visited.add(current_id)
-        entry = category_map.get(current_id)
-        if entry is None:
-            break
-        name, parent_id = entry
-        parts.append(name)
-        current_id = parent_id
+def _expenses_changed(session: AsyncSession, user_id: int) -> None:
+    """Bump the user's expense and summary versions now and when the transaction ends.
+
+    Endpoints invalidate before ``get_session`` commits; a read in between
+    (an export stored under :func:`export_cache.data_version`, a cached
+    listing) still sees the old rows, so the commit bumps the versions again.
+    """
+    prefixes = (f"expenses:{user_id}", f"summary:{user_id}")
+
+    def bump(_=None) -> None:
+        for prefix in prefixes:
+            cache_invalidate(prefix)
+
+    bump()
+    for event_name in ("after_commit", "after_rollback"):
+        event.listen(session.sync_session, event_name, bump, once=True)
 
-    return " / ".join(reversed(parts)) if parts else "Non classé"
+
+def _notes_changed(
+    session: AsyncSession, user_id: int, changes: Iterable[tuple[str | None, int]] | None
+) -> None:
+    """Queue ``(note, count delta)`` changes for the autocomplete index.
+
+    They reach :data:`note_index` only after the commit and are dropped on
+    rollback; ``None`` drops the user's index instead (bulk deletions).
+    """
+    pending = session.info.get(_NOTE_CHANGES)
+    if pending is None:
+        pending = session.info[_NOTE_CHANGES] = {}
+
+        def flush(_) -> None:
+            for pending_user, user_changes in session.info.pop(_NOTE_CHANGES, {}).items():
+                if user_changes is None:
+                    note_index.forget(pending_user)
+                else:
+                    note_index.apply(pending_user, user_changes)
+
+        event.listen(session.sync_session, "after_commit", flush, once=True)
+        event.listen(
+            session.sync_session, "after_rollback", lambda _: session.info.pop(_NOTE_CHANGES, None), once=True
+        )
+    if changes is None:
+        pending[user_id] = None
+    elif user_id not in pending or pending[user_id] is not None:
+        pending.setdefault(user_id, []).extend((note, count) for note, count in changes if note)
+
+
+def _dialect_insert(session: AsyncSession):
+    if session.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert
 
 
 async def create_category(session: AsyncSession, category: schemas.CategoryCreate, user_id: int) -> models.Category:
     """Create a new category for a user.
-    
-    Ensures category name uniqueness per user and parent_id combination.
-    Uses database-level locking to prevent race conditions.
+
+    Names are unique per user and parent, case-insensitively. The unique
+    index ``uq_categories_user_parent_lower_name`` enforces it: the row is
+    written with ``INSERT ... ON CONFLICT DO NOTHING RETURNING`` and a
+    duplicate, even from a concurrent request, returns no row.
     """
     import logging
     logger = logging.getLogger(__name__)
@@ -192,135 +302,150 @@ async def create_category(session: AsyncSession, category: schemas.CategoryCreat
     if not original_name:
         raise ValueError("Category name cannot be empty")
     
-    category_name_normalized = original_name.lower().strip()
-    
     logger.info(f"Creating category: user_id={user_id}, name='{original_name}', parent_id={parent_id}")
     
-    # VÉRIFICATION ROBUSTE AVEC VERROU DE BASE DE DONNÉES
-    # Utiliser SELECT FOR UPDATE pour verrouiller les lignes et éviter les race conditions
-    # Cela garantit qu'on voit les données les plus récentes et qu'on évite les conflits
-    from sqlalchemy import and_
-    
-    # Construire la requête de vérification avec verrou
-    # On récupère toutes les catégories avec le même user_id et parent_id
-    # puis on compare les noms normalisés en Python pour éviter les problèmes de compatibilité
-    if parent_id is None:
-        check_query = select(models.Category).where(
-            and_(
-                models.Category.user_id == user_id,
-                models.Category.parent_id.is_(None)
-            )
-        ).with_for_update(skip_locked=False)
-    else:
-        check_query = select(models.Category).where(
-            and_(
-                models.Category.user_id == user_id,
-                models.Category.parent_id == parent_id
-            )
-        ).with_for_update(skip_locked=False)
-    
-    # Exécuter la vérification avec verrou
-    check_result = await session.execute(check_query)
-    existing_categories = check_result.scalars().all()
-    
-    # Comparer les noms normalisés en Python (plus robuste que SQL)
-    for existing in existing_categories:
-        # Double vérification du user_id (sécurité)
-        if existing.user_id != user_id:
-            logger.error(
-                f"CRITICAL: Found category with wrong user_id! "
-                f"category_id={existing.id}, "
-                f"category_user_id={existing.user_id}, "
-                f"expected_user_id={user_id}"
-            )
-            continue
-        
-        # Normaliser le nom existant de la même manière
-        existing_name_normalized = existing.name.strip().lower() if existing.name else ""
-        
-        if existing_name_normalized == category_name_normalized:
-            logger.warning(
-                f"Category already exists: user_id={user_id}, "
-                f"name='{original_name}', "
-                f"existing_id={existing.id}, "
-                f"existing_name='{existing.name}'"
-            )
-            raise CategoryNameConflictError(
-                f"Category name '{original_name}' already exists"
-            )
-    
-    # Créer la nouvelle catégorie avec le user_id explicitement défini
-    db_category = models.Category(
-        name=original_name,
-        description=data.get("description"),
-        parent_id=parent_id,
-        user_id=user_id  # S'assurer que user_id est toujours défini explicitement
-    )
-    
-    session.add(db_category)
-    
-    try:
-        await session.flush()
-    except IntegrityError as exc:
-        # En cas d'erreur d'intégrité, vérifier une dernière fois
-        error_msg = str(exc.orig) if hasattr(exc, 'orig') else str(exc)
-        logger.error(f"IntegrityError during category creation: {error_msg}", exc_info=True)
-        
-        # Vérification finale après l'erreur
-        try:
-            if parent_id is None:
-                final_check = select(models.Category).where(
-                    and_(
-                        models.Category.user_id == user_id,
-                        models.Category.parent_id.is_(None)
-                    )
-                )
-            else:
-                final_check = select(models.Category).where(
-                    and_(
-                        models.Category.user_id == user_id,
-                        models.Category.parent_id == parent_id
-                    )
+    # Le chemin complet est dérivé de celui du parent (une seule ligne lue)
+    parent_path: str | None = None
+    depth = 0
+    if parent_id is not None:
+        parent_row = (
+            await session.execute(
+                select(models.Category.full_path, models.Category.depth).where(
+                    models.Category.id == parent_id,
+                    models.Category.user_id == user_id,
                 )
-            
-            final_result = await session.execute(final_check)
-            final_categories = final_result.scalars().all()
-            
-            # Comparer en Python
-            for final_cat in final_categories:
-                if final_cat.name.strip().lower() == category_name_normalized:
-                    raise CategoryNameConflictError(
-                        f"Category name '{original_name}' already exists"
-                    ) from exc
-        except CategoryNameConflictError:
-            raise
-        except Exception:
-            pass  # Si la vérification échoue, on lève quand même l'erreur originale
-        
-        raise CategoryNameConflictError("Category name already exists") from exc
-    
-    # Rafraîchir la catégorie et construire le full_path
-    try:
-        await session.refresh(db_category)
-        await session.refresh(db_category, attribute_names=["parent"])
-        category_map = await _load_category_map(session, user_id)
-        setattr(
-            db_category,
-            "full_path",
-            _build_category_path_from_map(db_category.id, category_map),
+            )
+        ).first()
+        if parent_row is None:
+            raise ValueError("Parent category not found")
+        parent_path = parent_row.full_path
+        depth = parent_row.depth + 1
+
+    # L'unicité (utilisateur, parent, nom en minuscules) est garantie par un index
+    # unique : pas de verrou sur les catégories sœurs, un doublon n'insère rien
+    statement = (
+        _dialect_insert(session)(models.Category)
+        .values(
+            name=original_name,
+            description=data.get("description"),
+            parent_id=parent_id,
+            user_id=user_id,
+            full_path=category_tree.join_path(parent_path, original_name),
+            depth=depth,
         )
-    except Exception as refresh_err:
-        logger.error(f"Error refreshing category or building full_path: {refresh_err}", exc_info=True)
-        # Définir un full_path simple en cas d'erreur
-        try:
-            setattr(db_category, "full_path", original_name)
-        except Exception:
-            pass
-    
+        .on_conflict_do_nothing(index_elements=list(models.CATEGORY_NAME_KEY))
+        .returning(models.Category)
+        .options(lazyload("*"))
+    )
+    db_category = (await session.execute(statement)).scalars().first()
+    if db_category is None:
+        logger.warning(f"Category already exists: user_id={user_id}, name='{original_name}', parent_id={parent_id}")
+        raise CategoryNameConflictError(f"Category name '{original_name}' already exists")
+
+    await category_tree.add_category(session, db_category.id, parent_id)
+    _categories_changed(session, user_id)
+    # Une catégorie qui vient d'être créée n'a pas d'enfants
+    set_committed_value(db_category, "children", [])
+
     logger.info(f"Category created successfully: id={db_category.id}, name='{db_category.name}', user_id={db_category.user_id}")
     return db_category
 
 
+def split_category_path(path: str) -> list[str] | None:
+    """Split a ``"Parent / Child"`` path into names (``None`` if a name is empty or too long)."""
+    names = [name.strip() for name in path.split(category_tree.PATH_SEPARATOR)]
+    return names if all(0 < len(name) <= 100 for name in names) else None
+
+
+# Catégories par INSERT multi-lignes (7 paramètres par ligne)
+_CATEGORY_INSERT_CHUNK = 1000
+
+
+def _path_key(names: Sequence[str]) -> str:
+    return category_tree.PATH_SEPARATOR.join(names).lower()
+
+
+async def load_category_paths(session: AsyncSession, user_id: int) -> dict[str, tuple[int, str]]:
+    """Map the lower-cased full path of every category of a user to ``(id, full_path)``."""
+    paths = await category_paths(session, user_id)
+    return {full_path.lower(): (category_id, full_path) for category_id, full_path in paths.items()}
+
+
+async def create_category_paths(
+    session: AsyncSession,
+    user_id: int,
+    paths: Iterable[Sequence[str]],
+    known: dict[str, tuple[int, str]],
+) -> None:
+    """Create the categories (and missing ancestors) of ``paths`` absent from ``known``.
+
+    ``paths`` are lists of names as returned by :func:`split_category_path`.
+    Categories are inserted level by level, one multi-row ``INSERT ... ON
+    CONFLICT DO NOTHING`` per depth like :func:`create_category`: a category
+    created concurrently under the same name is not an error, its id is read
+    back instead. ``known`` (as returned by :func:`load_category_paths`) is
+    updated in place.
+    """
+    missing: dict[str, tuple[str | None, str, int]] = {}
+    for names in paths:
+        for depth in range(len(names)):
+            key = _path_key(names[: depth + 1])
+            if key not in known and key not in missing:
+                missing[key] = (_path_key(names[:depth]) if depth else None, names[depth], depth)
+
+    category = models.Category
+    insert_category = _dialect_insert(session)
+    for depth in sorted({depth for _, _, depth in missing.values()}):
+        level: dict[tuple[int | None, str], str] = {}
+        rows = []
+        for key, (parent_key, name, d) in missing.items():
+            if d != depth:
+                continue
+            parent_id, parent_path = known[parent_key] if parent_key else (None, None)
+            level[(parent_id, name)] = key
+            rows.append(
+                {
+                    "name": name,
+                    "description": None,
+                    "parent_id": parent_id,
+                    "user_id": user_id,
+                    "full_path": category_tree.join_path(parent_path, name),
+                    "depth": depth,
+                }
+            )
+
+        new_ids = []
+        for offset in range(0, len(rows), _CATEGORY_INSERT_CHUNK):
+            result = await session.execute(
+                insert_category(category)
+                .values(rows[offset:offset + _CATEGORY_INSERT_CHUNK])
+                .on_conflict_do_nothing(index_elements=list(models.CATEGORY_NAME_KEY))
+                .returning(category.id, category.parent_id, category.name, category.full_path)
+            )
+            for category_id, parent_id, name, full_path in result.all():
+                known[level.pop((parent_id, name))] = (category_id, full_path)
+                new_ids.append(category_id)
+        await category_tree.add_categories(session, new_ids)
+
+        if level:
+            # Créées entre-temps par une autre requête : relire leur id
+            existing = await session.execute(
+                select(category.id, category.parent_id, category.name, category.full_path).where(
+                    category.user_id == user_id,
+                    func.coalesce(category.parent_id, 0).in_({parent_id or 0 for parent_id, _ in level}),
+                    func.lower(category.name).in_([func.lower(literal(name)) for _, name in level]),
+                )
+            )
+            by_name = {
+                (parent_id, name.lower()): (category_id, full_path)
+                for category_id, parent_id, name, full_path in existing.all()
+            }
+            for (parent_id, name), key in level.items():
+                known[key] = by_name[(parent_id, name.lower())]
+    if missing:
+        _categories_changed(session, user_id)
+
+
 async def list_categories(
     session: AsyncSession,
     user_id: int,
@@ -333,20 +458,13 @@ async def list_categories(
         .options(
             selectinload(models.Category.parent),
             selectinload(models.Category.children),
+            lazyload(models.Category.expenses),
         )
         .where(models.Category.user_id == user_id)
         .order_by(models.Category.name)
     )
     categories = result.scalars().unique().all()
 
-    category_map = {category.id: (category.name, category.parent_id) for category in categories}
-    for category in categories:
-        setattr(
-            category,
-            "full_path",
-            _build_category_path_from_map(category.id, category_map),
-        )
-
     id_to_node = {c.id: c for c in categories}
     roots: list[models.Category] = []
     for c in categories:
@@ -370,105 +488,345 @@ def _build_category_path(category: models.Category) -> str:
     return " / ".join(reversed(parts))
 
 
-async def get_category(session: AsyncSession, category_id: int, user_id: int) -> models.Category | None:
+async def _load_category_with_tree(
+    session: AsyncSession, category_id: int, user_id: int
+) -> models.Category | None:
+    # Charger ancêtres et sous-arborescence complète : CategoryRead sérialise children
+    # récursivement et aucun chargement paresseux n'est possible pendant la sérialisation
     result = await session.execute(
         select(models.Category)
         .options(
-            selectinload(models.Category.parent),
+            selectinload(models.Category.parent, recursion_depth=-1).lazyload(models.Category.expenses),
+            selectinload(models.Category.children, recursion_depth=-1).lazyload(models.Category.expenses),
+            lazyload(models.Category.expenses),
         )
         .where(models.Category.id == category_id, models.Category.user_id == user_id)
+        .execution_options(populate_existing=True)
     )
-    category = result.scalars().first()
-    if category is None:
-        return None
+    return result.scalars().first()
 
-    category_map = await _load_category_map(session, user_id)
-    setattr(
-        category,
-        "full_path",
-        _build_category_path_from_map(category.id, category_map),
-    )
-    return category
+
+async def get_category(session: AsyncSession, category_id: int, user_id: int) -> models.Category | None:
+    return await _load_category_with_tree(session, category_id, user_id)
 
 
 async def update_category(
     session: AsyncSession, category_id: int, payload: schemas.CategoryUpdate, user_id: int
 ) -> models.Category | None:
     """Update a category, ensuring name uniqueness per user."""
-    category = await session.get(models.Category, category_id)
-    if category is None or category.user_id != user_id:
+    # Colonnes seules : session.get chargerait parent, enfants et dépenses
+    category = (
+        await session.execute(
+            select(models.Category)
+            .where(models.Category.id == category_id, models.Category.user_id == user_id)
+            .options(lazyload("*"))
+        )
+    ).scalars().first()
+    if category is None:
         return None
 
     data = payload.model_dump(exclude_unset=True)
     if "parent_id" in data and data["parent_id"] == category_id:
         data["parent_id"] = None
-    
-    # Si le nom est modifié, vérifier qu'aucune autre catégorie n'a déjà ce nom pour cet utilisateur
     if "name" in data:
-        # Vérifier qu'une autre catégorie (différente de celle-ci) avec le même nom n'existe pas
-        new_parent_id = data.get("parent_id", category.parent_id)
-        existing_query = select(models.Category).where(
-            models.Category.user_id == user_id,
-            models.Category.name == data["name"],
-            models.Category.id != category_id  # Exclure la catégorie actuelle
-        )
-        # Comparer parent_id correctement (NULL-safe)
-        if new_parent_id is None:
-            existing_query = existing_query.where(models.Category.parent_id.is_(None))
+        if data["name"] is None:
+            data.pop("name")
         else:
-            existing_query = existing_query.where(models.Category.parent_id == new_parent_id)
-        
-        existing_category = await session.execute(existing_query)
-        if existing_category.first():
-            raise CategoryNameConflictError(
-                f"Category name '{data['name']}' already exists"
+            data["name"] = data["name"].strip()
+
+    parent_changed = "parent_id" in data and data["parent_id"] != category.parent_id
+    new_name = data.get("name", category.name)
+    new_path, new_depth = category.full_path, category.depth
+    if parent_changed or new_name != category.name:
+        new_parent_id = data.get("parent_id", category.parent_id)
+        new_parent_path: str | None = None
+        new_depth = 0
+        if new_parent_id is not None:
+            parent_row = (
+                await session.execute(
+                    select(models.Category.full_path, models.Category.depth).where(
+                        models.Category.id == new_parent_id,
+                        models.Category.user_id == user_id,
+                    )
+                )
+            ).first()
+            if parent_row is None:
+                raise ValueError("Parent category not found")
+            new_parent_path = parent_row.full_path
+            new_depth = parent_row.depth + 1
+        new_path = category_tree.join_path(new_parent_path, new_name)
+
+    if data:
+        # L'index unique (utilisateur, parent, nom en minuscules) rejette les doublons
+        try:
+            await session.execute(
+                update(models.Category)
+                .where(models.Category.id == category_id)
+                .values(**data)
+                .execution_options(synchronize_session=False)
             )
-    
-    for field, value in data.items():
-        setattr(category, field, value)
-
-    try:
-        await session.flush()
-    except IntegrityError as exc:  # pragma: no cover - depends on DB backend
-        raise CategoryNameConflictError("Category name already exists") from exc
-
-    await session.refresh(category)
-    await session.refresh(category, attribute_names=["parent"])
-    category_map = await _load_category_map(session, user_id)
-    setattr(
-        category,
-        "full_path",
-        _build_category_path_from_map(category.id, category_map),
-    )
-    return category
+        except IntegrityError as exc:
+            raise CategoryNameConflictError(f"Category name '{new_name}' already exists") from exc
+
+    if parent_changed:
+        # Lève ValueError si le nouveau parent appartient à la sous-arborescence
+        await category_tree.move_category(session, category_id, data["parent_id"])
+
+    if new_path != category.full_path or new_depth != category.depth:
+        # Réécrire en une seule requête les chemins de la sous-arborescence uniquement
+        await category_tree.rewrite_subtree_paths(
+            session, category_id, category.full_path, new_path, new_depth - category.depth
+        )
+
+    if data:
+        _categories_changed(session, user_id)
+    return await _load_category_with_tree(session, category_id, user_id)
 
 
 async def delete_category(session: AsyncSession, category_id: int, user_id: int) -> bool:
-    category = await session.get(models.Category, category_id)
-    if category is None or category.user_id != user_id:
+    """Delete a category, its descendants and all their expenses.
+
+    The subtree comes from the closure table and everything is removed with
+    set-based DELETEs: neither the categories nor their expenses are loaded
+    (the ORM cascade would load the whole subtree and every expense in it).
+    """
+    owned = await session.scalar(
+        select(models.Category.id).where(models.Category.id == category_id, models.Category.user_id == user_id)
+    )
+    if owned is None:
         return False
-    await session.delete(category)
+
+    subtree_ids = await category_tree.subtree_ids(session, category_id)
+    await rollups.delete_for_categories(session, user_id, subtree_ids)
+    await session.execute(
+        delete(models.Expense)
+        .where(models.Expense.category_id.in_(category_tree.subtree_ids_query(category_id)))
+        .execution_options(synchronize_session=False)
+    )
+    _expenses_changed(session, user_id)
+    _notes_changed(session, user_id, None)
+    await category_tree.remove_categories(session, subtree_ids)
+    await session.execute(
+        delete(models.Category)
+        .where(models.Category.id.in_(subtree_ids))
+        .execution_options(synchronize_session=False)
+    )
+    _categories_changed(session, user_id)
     return True
 
 
 async def create_expense(session: AsyncSession, expense: schemas.ExpenseCreate, user_id: int) -> models.Expense:
+    """Insert an expense with one ``INSERT ... RETURNING``; the path comes from the cached map."""
     payload = expense.model_dump(exclude_none=True)
-    if "created_at" in payload and payload["created_at"] is None:
-        payload.pop("created_at")
-    db_expense = models.Expense(**payload, user_id=user_id)
-    session.add(db_expense)
-    await session.flush()
-    await session.refresh(db_expense)
-    await session.refresh(db_expense, attribute_names=["category"])
-    category_map = await _load_category_map(session, user_id)
-    setattr(
-        db_expense,
-        "category_path",
-        _build_category_path_from_map(db_expense.category_id, category_map),
-    )
+    category_path = await _owned_category_path(session, user_id, payload["category_id"])
+    if category_path is None:
+        raise ValueError("Category not found")
+    db_expense = (
+        await session.execute(
+            insert(models.Expense)
+            .values(**payload, user_id=user_id)
+            .returning(models.Expense)
+            .options(lazyload("*"))
+        )
+    ).scalars().one()
+    await rollups.record_expense(session, db_expense)
+    _expenses_changed(session, user_id)
+    _notes_changed(session, user_id, [(db_expense.note, 1)])
+    setattr(db_expense, "category_path", category_path)
     return db_expense
 
 
+def _validation_message(exc: ValidationError) -> str:
+    error = exc.errors()[0]
+    location = ".".join(str(part) for part in error["loc"])
+    return f"{location}: {error['msg']}" if location else error["msg"]
+
+
+async def create_expenses_bulk(
+    session: AsyncSession,
+    items: Sequence[dict],
+    user_id: int,
+) -> list[schemas.ExpenseBulkItemResult]:
+    """Validate and insert a batch of expenses, returning one result per item.
+
+    Category ownership is checked against the cached category map and valid rows are
+    inserted with multi-row ``INSERT ... RETURNING`` statements; invalid items
+    are reported without rejecting the rest of the batch.
+    """
+    results: list[schemas.ExpenseBulkItemResult | None] = [None] * len(items)
+    valid: list[tuple[int, schemas.ExpenseCreate]] = []
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, schemas.ExpenseCreate.model_validate(item)))
+        except ValidationError as exc:
+            results[index] = schemas.ExpenseBulkItemResult(
+                index=index, status="error", error=_validation_message(exc)
+            )
+    await _insert_valid_expenses(session, valid, user_id, results)
+    return results  # type: ignore[return-value]
+
+
+async def _insert_valid_expenses(
+    session: AsyncSession,
+    valid: Sequence[tuple[int, schemas.ExpenseCreate]],
+    user_id: int,
+    results: list[schemas.ExpenseBulkItemResult | None],
+) -> None:
+    """Insert validated ``(index, expense)`` pairs, filling ``results`` at each index."""
+    category_ids = {expense.category_id for _, expense in valid}
+    owned_ids = set(await _owned_category_paths(session, user_id, category_ids)) if category_ids else set()
+
+    # Une instruction par forme de ligne : sans created_at, la valeur par
+    # défaut du serveur s'applique
+    rows_by_shape: dict[bool, list[tuple[int, dict]]] = {True: [], False: []}
+    for index, expense in valid:
+        if expense.category_id not in owned_ids:
+            results[index] = schemas.ExpenseBulkItemResult(
+                index=index, status="error", error="Category not found"
+            )
+            continue
+        row = expense.model_dump(exclude_none=True)
+        row.setdefault("note", None)
+        row["user_id"] = user_id
+        rows_by_shape["created_at" in row].append((index, row))
+
+    rollup_rows: list[tuple[int, datetime, str, float]] = []
+    for entries in rows_by_shape.values():
+        if not entries:
+            continue
+        result = await session.execute(
+            insert(models.Expense).returning(
+                models.Expense.id, models.Expense.created_at, sort_by_parameter_order=True
+            ),
+            [row for _, row in entries],
+        )
+        for (index, row), (expense_id, created_at) in zip(entries, result.all()):
+            results[index] = schemas.ExpenseBulkItemResult(index=index, status="created", id=expense_id)
+            rollup_rows.append((row["category_id"], created_at, row["currency"], row["amount"]))
+
+    await rollups.record_rows(session, user_id, rollup_rows)
+    if rollup_rows:
+        _expenses_changed(session, user_id)
+    _notes_changed(
+        session, user_id, [(row["note"], 1) for entries in rows_by_shape.values() for _, row in entries]
+    )
+
+
+async def import_expenses(
+    session: AsyncSession,
+    records: Sequence[dict],
+    user_id: int,
+    category_paths: dict[str, tuple[int, str]],
+) -> list[schemas.ExpenseBulkItemResult]:
+    """Insert imported rows whose category is given by path, one result per row.
+
+    Rows are validated against :class:`schemas.ExpenseCreate` first; paths
+    of the valid rows are then resolved case-insensitively against
+    ``category_paths`` (see :func:`load_category_paths`), missing categories
+    are created in bulk and the rows inserted like :func:`create_expenses_bulk`.
+    A rejected row never creates a category.
+    """
+    results: list[schemas.ExpenseBulkItemResult | None] = [None] * len(records)
+    valid: list[tuple[int, list[str], schemas.ExpenseCreate]] = []
+    for index, record in enumerate(records):
+        names = split_category_path(record["category_path"])
+        if names is None:
+            results[index] = schemas.ExpenseBulkItemResult(
+                index=index, status="error", error=f"Invalid category path '{record['category_path']}'"
+            )
+            continue
+        item = {key: value for key, value in record.items() if key != "category_path"}
+        try:
+            # La catégorie n'est connue qu'une fois le chemin résolu
+            expense = schemas.ExpenseCreate.model_validate({**item, "category_id": 0})
+        except ValidationError as exc:
+            results[index] = schemas.ExpenseBulkItemResult(
+                index=index, status="error", error=_validation_message(exc)
+            )
+            continue
+        valid.append((index, names, expense))
+
+    await create_category_paths(session, user_id, [names for _, names, _ in valid], category_paths)
+    await _insert_valid_expenses(
+        session,
+        [
+            (index, expense.model_copy(update={"category_id": category_paths[_path_key(names)][0]}))
+            for index, names, expense in valid
+        ],
+        user_id,
+        results,
+    )
+    return results  # type: ignore[return-value]
+
+
+def _expense_listing_query():
+    # Le chemin de catégorie est lu directement sur la ligne jointe ; la relation
+    # category n'est pas chargée (elle chargerait en cascade toutes ses dépenses)
+    return (
+        select(models.Expense, models.Category.full_path.label("category_path"))
+        .join(models.Category, models.Category.id == models.Expense.category_id)
+        .options(lazyload(models.Expense.category))
+    )
+
+
+async def _fetch_expense_page(
+    session: AsyncSession,
+    query,
+    *,
+    page: int,
+    per_page: int,
+    include_total: bool,
+) -> tuple[list[models.Expense], int | None, bool, bool]:
+    """Fetch one page of ``_expense_listing_query`` rows in a single round trip.
+
+    ``has_next`` is derived from fetching ``per_page + 1`` rows. When the
+    total is requested it is computed with ``count(*) OVER ()`` in the same
+    query instead of a separate COUNT over the filtered set.
+    """
+    offset = (page - 1) * per_page
+    page_query = query.offset(offset).limit(per_page + 1)
+    if include_total:
+        page_query = page_query.add_columns(func.count().over().label("total_count"))
+
+    result = await session.execute(page_query)
+    rows = result.all()
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+    expenses = []
+    for row in rows:
+        expense = row[0]
+        setattr(expense, "category_path", row.category_path)
+        expenses.append(expense)
+
+    total: int | None = None
+    if include_total:
+        if rows:
+            total = rows[0].total_count
+        elif offset == 0:
+            total = 0
+        else:
+            # Page au-delà de la fin : aucune ligne ne porte le total fenêtré
+            total = await session.scalar(select(func.count()).select_from(query.subquery())) or 0
+
+    return expenses, total, has_next, page > 1
+
+
+def _category_condition(column, category_id: int | Sequence[int], include_descendants: bool = False):
+    """``column == category_id``, or membership in its subtree when ``include_descendants``.
+
+    Several ids select the union of the categories (or of their subtrees).
+    The subtree is a semi-join on the closure table (``IN (SELECT descendant_id
+    ...)``), resolved in SQL through the closure primary key.
+    """
+    category_ids = [category_id] if isinstance(category_id, int) else list(category_id)
+    if include_descendants:
+        closure = models.CategoryClosure
+        return column.in_(select(closure.descendant_id).where(closure.ancestor_id.in_(category_ids)))
+    if len(category_ids) == 1:
+        return column == category_ids[0]
+    return column.in_(category_ids)
+
+
 async def list_expenses_by_category(
     session: AsyncSession,
     category_id: int,
@@ -478,13 +836,12 @@ async def list_expenses_by_category(
     end_date: datetime | None = None,
     page: int = 1,
     per_page: int = 50,
-) -> tuple[list[models.Expense], int, bool, bool]:
+    include_total: bool = True,
+) -> tuple[list[models.Expense], int | None, bool, bool]:
     query = (
-        select(models.Expense)
-        .options(
-            selectinload(models.Expense.category).selectinload(models.Category.parent),
-        )
+        _expense_listing_query()
         .where(models.Expense.category_id == category_id, models.Expense.user_id == user_id)
+        .order_by(models.Expense.created_at.desc())
     )
 
     if start_date is not None:
@@ -492,86 +849,161 @@ async def list_expenses_by_category(
     if end_date is not None:
         query = query.where(models.Expense.created_at < end_date + timedelta(days=1))
 
-    count_query = select(func.count()).select_from(models.Expense).where(
-        models.Expense.category_id == category_id,
-        models.Expense.user_id == user_id,
+    return await _fetch_expense_page(
+        session, query, page=page, per_page=per_page, include_total=include_total
     )
 
-    if start_date is not None:
-        count_query = count_query.where(models.Expense.created_at >= start_date)
-    if end_date is not None:
-        count_query = count_query.where(models.Expense.created_at < end_date + timedelta(days=1))
 
-    total = await session.scalar(count_query) or 0
+# Nombre maximal de mots pris en compte dans une recherche plein texte
+MAX_SEARCH_TERMS = 10
 
-    offset = (page - 1) * per_page
-    result = await session.execute(query.order_by(models.Expense.created_at.desc()).offset(offset).limit(per_page))
-    expenses = result.scalars().all()
-    category_map = await _load_category_map(session, user_id)
-    for expense in expenses:
-        setattr(
-            expense,
-            "category_path",
-            _build_category_path_from_map(expense.category_id, category_map),
+
+def search_terms(q: str | None) -> list[str]:
+    """Words of a search string; punctuation and query operators are dropped."""
+    return re.findall(r"\w+", q or "")[:MAX_SEARCH_TERMS]
+
+
+def _note_matches(dialect_name: str, terms: Sequence[str]):
+    """Subquery of ``(id, rank)`` for expenses whose note contains every term as a prefix.
+
+    A lower ``rank`` is a better match. SQLite queries the FTS5 table
+    (BM25 ranking), PostgreSQL the GIN-indexed tsvector (``ts_rank``); both
+    ignore accents.
+    """
+    if dialect_name == "postgresql":
+        vector = literal_column(models.EXPENSE_NOTES_TSVECTOR)
+        ts_query = func.to_tsquery(
+            literal_column("'simple'::regconfig"),
+            getattr(func, models.EXPENSE_NOTES_UNACCENT)(" & ".join(f"{term}:*" for term in terms)),
+        )
+        return (
+            select(models.Expense.id.label("id"), (-func.ts_rank(vector, ts_query)).label("rank"))
+            .where(vector.bool_op("@@")(ts_query))
+            .subquery("note_matches")
         )
+    fts = table(models.EXPENSE_NOTES_FTS, column("rowid"))
+    fts_name = literal_column(models.EXPENSE_NOTES_FTS)
+    # Chaque mot est cité (aucun opérateur FTS5 possible) et cherché en préfixe
+    match = " ".join(f'"{term}"*' for term in terms)
+    return (
+        select(fts.c.rowid.label("id"), func.bm25(fts_name).label("rank"))
+        .select_from(fts)
+        .where(fts_name.op("MATCH")(match))
+        .subquery("note_matches")
+    )
 
-    has_next = total > page * per_page
-    has_previous = page > 1
 
-    return expenses, total, has_next, has_previous
+# Ordre des pages de dépenses ; l'id départage les ex aequo pour une pagination stable
+EXPENSE_SORTS = {
+    "newest": (models.Expense.created_at.desc(), models.Expense.id.desc()),
+    "oldest": (models.Expense.created_at.asc(), models.Expense.id.asc()),
+    "amount_desc": (models.Expense.amount.desc(), models.Expense.id.desc()),
+    "amount_asc": (models.Expense.amount.asc(), models.Expense.id.asc()),
+}
 
 
-async def search_expenses(
-    session: AsyncSession,
+def _expense_search_query(
+    dialect_name: str,
     user_id: int,
     *,
-    category_id: int | None = None,
+    q: str | None = None,
+    category_id: int | Sequence[int] | None = None,
+    include_descendants: bool = False,
     start_date: datetime | None = None,
     end_date: datetime | None = None,
-    page: int = 1,
-    per_page: int = 50,
-) -> tuple[list[models.Expense], int, bool, bool]:
-    query = (
-        select(models.Expense)
-        .options(
-            selectinload(models.Expense.category).selectinload(models.Category.parent),
-        )
-        .where(models.Expense.user_id == user_id)
-        .order_by(models.Expense.created_at.desc())
-    )
+    min_amount: float | None = None,
+    max_amount: float | None = None,
+    sort: schemas.ExpenseSort | None = None,
+):
+    """Filtered and ordered ``_expense_listing_query`` behind :func:`search_expenses`.
+
+    Each filter combination is served by an index on ``expenses``:
+    ``(user_id, created_at)`` for dates, ``(user_id, category_id,
+    created_at)`` for categories (one or several) and ``(user_id, amount)``
+    for amount ranges and amount ordering.
+    """
+    if min_amount is not None and max_amount is not None and min_amount > max_amount:
+        raise ValueError("min_amount must be less than or equal to max_amount")
+    query = _expense_listing_query().where(models.Expense.user_id == user_id)
 
-    if category_id is not None:
-        query = query.where(models.Expense.category_id == category_id)
+    # Une liste vide ne filtre pas
+    if isinstance(category_id, int) or category_id:
+        query = query.where(_category_condition(models.Expense.category_id, category_id, include_descendants))
     if start_date is not None:
         query = query.where(models.Expense.created_at >= start_date)
     if end_date is not None:
         query = query.where(models.Expense.created_at < end_date + timedelta(days=1))
+    if min_amount is not None:
+        query = query.where(models.Expense.amount >= min_amount)
+    if max_amount is not None:
+        query = query.where(models.Expense.amount <= max_amount)
 
-    count_query = select(func.count()).select_from(models.Expense).where(models.Expense.user_id == user_id)
-    if category_id is not None:
-        count_query = count_query.where(models.Expense.category_id == category_id)
-    if start_date is not None:
-        count_query = count_query.where(models.Expense.created_at >= start_date)
-    if end_date is not None:
-        count_query = count_query.where(models.Expense.created_at < end_date + timedelta(days=1))
+    terms = search_terms(q)
+    if terms:
+        matches = _note_matches(dialect_name, terms)
+        query = query.join(matches, matches.c.id == models.Expense.id)
+        if sort is None:
+            # Les meilleures correspondances d'abord, puis les plus récentes
+            return query.order_by(matches.c.rank, *EXPENSE_SORTS["newest"])
+    return query.order_by(*EXPENSE_SORTS[sort or "newest"])
 
-    total = await session.scalar(count_query) or 0
 
-    offset = (page - 1) * per_page
-    result = await session.execute(query.offset(offset).limit(per_page))
-    expenses = result.scalars().all()
-    category_map = await _load_category_map(session, user_id)
-    for expense in expenses:
-        setattr(
-            expense,
-            "category_path",
-            _build_category_path_from_map(expense.category_id, category_map),
-        )
+async def search_expenses(
+    session: AsyncSession,
+    user_id: int,
+    *,
+    q: str | None = None,
+    category_id: int | Sequence[int] | None = None,
+    include_descendants: bool = False,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    min_amount: float | None = None,
+    max_amount: float | None = None,
+    sort: schemas.ExpenseSort | None = None,
+    page: int = 1,
+    per_page: int = 50,
+    include_total: bool = True,
+) -> tuple[list[models.Expense], int | None, bool, bool]:
+    """One page of the user's expenses; see :func:`_expense_search_query` for the filters.
 
-    has_next = total > page * per_page
-    has_previous = page > 1
+    Without ``sort``, note matches come by relevance when ``q`` is given and
+    expenses otherwise come newest first.
+    """
+    query = _expense_search_query(
+        session.bind.dialect.name,
+        user_id,
+        q=q,
+        category_id=category_id,
+        include_descendants=include_descendants,
+        start_date=start_date,
+        end_date=end_date,
+        min_amount=min_amount,
+        max_amount=max_amount,
+        sort=sort,
+    )
+    return await _fetch_expense_page(
+        session, query, page=page, per_page=per_page, include_total=include_total
+    )
+
+
+async def suggest_notes(session: AsyncSession, user_id: int, prefix: str, limit: int = 10) -> list[str]:
+    """The user's most frequent notes starting with ``prefix`` (case-insensitive).
 
-    return expenses, total, has_next, has_previous
+    Served from :data:`note_index`; the user's index is built on first use
+    from one grouped query over their notes.
+    """
+    notes = note_index.get(user_id)
+    if notes is None:
+        # Relevée avant la requête : une écriture validée entre-temps invalide la construction
+        generation = note_index.generation(user_id)
+        rows = await session.execute(
+            select(models.Expense.note, func.count())
+            .where(models.Expense.user_id == user_id, models.Expense.note.is_not(None))
+            .group_by(models.Expense.note)
+        )
+        notes = UserNotes((note, count) for note, count in rows.tuples() if note is not None)
+        note_index.store(user_id, notes, generation)
+    return notes.suggest(prefix, limit)
 
 
 async def get_expense(session: AsyncSession, expense_id: int, user_id: int) -> models.Expense | None:
@@ -584,41 +1016,197 @@ async def get_expense(session: AsyncSession, expense_id: int, user_id: int) -> m
 async def update_expense(
     session: AsyncSession, expense_id: int, payload: schemas.ExpenseUpdate, user_id: int
 ) -> models.Expense | None:
-    expense = await session.get(models.Expense, expense_id)
-    if expense is None or expense.user_id != user_id:
+    """Update an expense with one ``UPDATE ... RETURNING``.
+
+    Only the columns feeding the rollup are read beforehand; the category
+    path comes from the cached map.
+    """
+    expense = models.Expense
+    old = (
+        await session.execute(
+            select(expense.category_id, expense.created_at, expense.currency, expense.amount, expense.note).where(
+                expense.id == expense_id, expense.user_id == user_id
+            )
+        )
+    ).first()
+    if old is None:
         return None
 
     data = payload.model_dump(exclude_unset=True)
+    # Seule la note peut être effacée ; les autres champs à None sont ignorés
+    data = {field: value for field, value in data.items() if value is not None or field == "note"}
+
+    category_id: int = data.get("category_id") or old.category_id
+    category_path = await _owned_category_path(session, user_id, category_id)
+    if category_path is None:
+        raise ValueError("Category not found")
+
+    if data:
+        db_expense = (
+            await session.execute(
+                update(expense)
+                .where(expense.id == expense_id)
+                .values(**data)
+                .returning(expense)
+                .options(lazyload("*"))
+                .execution_options(synchronize_session=False, populate_existing=True)
+            )
+        ).scalars().one()
+    else:
+        db_expense = (
+            await session.execute(select(expense).where(expense.id == expense_id).options(lazyload("*")))
+        ).scalars().one()
+
+    old_key = (old.category_id, rollups.month_start(old.created_at), old.currency)
+    new_key = (db_expense.category_id, rollups.month_start(db_expense.created_at), db_expense.currency)
+    if old_key == new_key:
+        if db_expense.amount != old.amount:
+            await rollups.apply_delta(
+                session,
+                user_id=user_id,
+                category_id=db_expense.category_id,
+                created_at=db_expense.created_at,
+                currency=db_expense.currency,
+                amount=float(db_expense.amount) - float(old.amount),
+                count=0,
+            )
+    else:
+        # Retirer l'ancienne contribution du cumul mensuel et ajouter la nouvelle
+        deltas = rollups.row_deltas([tuple(old)[:4]], sign=-1)
+        rollups.row_deltas(
+            [(db_expense.category_id, db_expense.created_at, db_expense.currency, db_expense.amount)], deltas=deltas
+        )
+        await rollups.apply_deltas(session, user_id, deltas)
+
+    _expenses_changed(session, user_id)
+    if db_expense.note != old.note:
+        _notes_changed(session, user_id, [(old.note, -1), (db_expense.note, 1)])
+    setattr(db_expense, "category_path", category_path)
+    return db_expense
 
-    if "category_id" in data and data["category_id"] is not None:
-        category = await session.get(models.Category, data["category_id"])
-        if category is None or category.user_id != user_id:
-            raise ValueError("Category not found")
 
-    if data.get("created_at") is None:
-        data.pop("created_at", None)
+async def delete_expense(session: AsyncSession, expense_id: int, user_id: int) -> bool:
+    expense = models.Expense
+    deleted = (
+        await session.execute(
+            delete(expense)
+            .where(expense.id == expense_id, expense.user_id == user_id)
+            .returning(expense.category_id, expense.created_at, expense.currency, expense.amount, expense.note)
+            .execution_options(synchronize_session=False)
+        )
+    ).first()
+    if deleted is None:
+        return False
+    await rollups.record_rows(session, user_id, [tuple(deleted)[:4]], sign=-1)
+    _expenses_changed(session, user_id)
+    _notes_changed(session, user_id, [(deleted.note, -1)])
+    return True
 
-    for field, value in data.items():
-        setattr(expense, field, value)
 
-    await session.flush()
-    await session.refresh(expense)
-    await session.refresh(expense, attribute_names=["category"])
-    category_map = await _load_category_map(session, user_id)
-    setattr(
-        expense,
-        "category_path",
-        _build_category_path_from_map(expense.category_id, category_map),
+def _matching_expense_filters(
+    user_id: int,
+    *,
+    category_id: int | None,
+    start_date: datetime | None,
+    end_date: datetime | None,
+) -> list:
+    if category_id is None and start_date is None and end_date is None:
+        raise ValueError("At least one of category_id, start_date or end_date is required")
+    if start_date and end_date and start_date > end_date:
+        raise ValueError("start_date must be before end_date")
+    filters = [models.Expense.user_id == user_id]
+    if category_id is not None:
+        filters.append(models.Expense.category_id == category_id)
+    if start_date is not None:
+        filters.append(models.Expense.created_at >= start_date)
+    if end_date is not None:
+        filters.append(models.Expense.created_at < end_date + timedelta(days=1))
+    return filters
+
+
+async def delete_expenses(
+    session: AsyncSession,
+    user_id: int,
+    *,
+    category_id: int | None = None,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+) -> int:
+    """Delete every expense matching the filters with one ``DELETE``; return the count.
+
+    The rollup deltas come from the ``RETURNING`` rows, i.e. exactly the rows
+    deleted (a row committed concurrently is either deleted and subtracted,
+    or neither), and are applied with one multi-row upsert.
+    """
+    filters = _matching_expense_filters(
+        user_id, category_id=category_id, start_date=start_date, end_date=end_date
     )
-    return expense
+    expense = models.Expense
+    deleted = (
+        await session.execute(
+            delete(expense)
+            .where(*filters)
+            .returning(expense.category_id, expense.created_at, expense.currency, expense.amount, expense.note)
+            .execution_options(synchronize_session=False)
+        )
+    ).all()
+    if not deleted:
+        return 0
+    await rollups.record_rows(session, user_id, [tuple(row)[:4] for row in deleted], sign=-1)
+    _expenses_changed(session, user_id)
+    _notes_changed(session, user_id, [(row.note, -1) for row in deleted])
+    return len(deleted)
 
 
-async def delete_expense(session: AsyncSession, expense_id: int, user_id: int) -> bool:
-    expense = await session.get(models.Expense, expense_id)
-    if expense is None or expense.user_id != user_id:
-        return False
-    await session.delete(expense)
-    return True
+async def recategorize_expenses(
+    session: AsyncSession,
+    user_id: int,
+    to_category_id: int,
+    *,
+    from_category_id: int | None = None,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+) -> int:
+    """Move every expense matching the filters to ``to_category_id``.
+
+    One ``UPDATE ... RETURNING`` runs per source category (a single one when
+    ``from_category_id`` is given), so each returned row is known to have
+    left that category: the rollup deltas follow exactly the rows moved and
+    are applied with one multi-row upsert.
+    """
+    filters = _matching_expense_filters(
+        user_id, category_id=from_category_id, start_date=start_date, end_date=end_date
+    )
+    if await _owned_category_path(session, user_id, to_category_id) is None:
+        raise ValueError("Category not found")
+    expense = models.Expense
+    filters.append(expense.category_id != to_category_id)
+
+    if from_category_id is not None:
+        sources = [from_category_id]
+    else:
+        sources = list((await session.execute(select(expense.category_id).where(*filters).distinct())).scalars())
+
+    deltas: dict[tuple[int, date, str], tuple[float, int]] = {}
+    moved = 0
+    for source_id in sources:
+        rows = (
+            await session.execute(
+                update(expense)
+                .where(*filters, expense.category_id == source_id)
+                .values(category_id=to_category_id)
+                .returning(expense.created_at, expense.currency, expense.amount)
+                .execution_options(synchronize_session=False)
+            )
+        ).all()
+        rollups.row_deltas(((source_id, *row) for row in rows), sign=-1, deltas=deltas)
+        rollups.row_deltas(((to_category_id, *row) for row in rows), deltas=deltas)
+        moved += len(rows)
+    if not moved:
+        return 0
+    await rollups.apply_deltas(session, user_id, deltas)
+    _expenses_changed(session, user_id)
+    return moved
 
 
 def _resolve_date_range(
@@ -640,153 +1228,636 @@ def _resolve_date_range(
     return start_date, end_date
 
 
+def _period_label(start_date: datetime, end_date: datetime) -> str:
+    if start_date.date() == end_date.date():
+        return start_date.strftime("%Y-%m-%d")
+    return f"{start_date.strftime('%Y-%m-%d')} → {end_date.strftime('%Y-%m-%d')}"
+
+
 async def totals_by_period(
     session: AsyncSession,
     user_id: int,
     start_date: datetime | None = None,
     end_date: datetime | None = None,
     category_id: int | None = None,
+    base_currency: str | None = None,
+    include_descendants: bool = False,
 ) -> schemas.MonthlySummary:
+    """Per-category totals of a period, converted into ``base_currency``.
+
+    Amounts are summed per category and currency, then converted in SQL by
+    joining the exchange rate table (see :mod:`fx`). Per-currency totals are
+    returned unconverted; currencies without a rate are listed in
+    ``missing_rates`` and left out of the converted totals. With
+    ``include_descendants``, ``category_id`` selects its whole subtree.
+    """
     start_date, end_date = _resolve_date_range(start_date, end_date)
+    base_currency = (base_currency or fx.base_currency()).upper()
+    rates = fx.rates_subquery(base_currency)
 
-    total_case = case(
-        (
-            and_(
-                models.Expense.created_at >= start_date,
-                models.Expense.created_at < end_date + timedelta(days=1),
-            ),
-            models.Expense.amount,
-        ),
-        else_=0.0,
-    )
+    # Les mois complets de la période sont lus depuis expense_monthly_rollups ;
+    # seuls les jours partiels en bordure sont agrégés depuis les dépenses brutes
+    # (filtrées sur idx_expenses_user_created).
+    parts = rollups.period_totals_parts(user_id, start_date, end_date + timedelta(days=1), by_currency=True)
+    period_totals = (parts[0] if len(parts) == 1 else union_all(*parts)).subquery()
 
+    # La jointure externe conserve les catégories sans dépense sur la période
     query = (
         select(
-            models.Category.id,
-            func.coalesce(func.sum(total_case), 0.0),
+            models.Category.full_path,
+            period_totals.c.currency,
+            func.sum(period_totals.c.total),
+            func.sum(period_totals.c.total * rates.c.rate),
         )
-        .outerjoin(models.Expense, models.Expense.category_id == models.Category.id)
+        .outerjoin(period_totals, period_totals.c.category_id == models.Category.id)
+        .outerjoin(rates, rates.c.currency == period_totals.c.currency)
         .where(models.Category.user_id == user_id)
-        .group_by(models.Category.id)
-        .order_by(models.Category.name)
+        .group_by(models.Category.id, models.Category.full_path, period_totals.c.currency)
+        .order_by(models.Category.full_path)
     )
 
     if category_id is not None:
-        query = query.where(models.Category.id == category_id)
+        query = query.where(_category_condition(models.Category.id, category_id, include_descendants))
 
     result = await session.execute(query)
-    totals = result.all()
-    category_map = await _load_category_map(session, user_id)
-
-    category_totals = {
-        _build_category_path_from_map(category_id, category_map): float(total)
-        for category_id, total in totals
-    }
-    overall_total = float(sum(category_totals.values()))
-
-    if start_date.date() == end_date.date():
-        period_label = start_date.strftime("%Y-%m-%d")
-    else:
-        period_label = f"{start_date.strftime('%Y-%m-%d')} → {end_date.strftime('%Y-%m-%d')}"
+    category_totals: dict[str, float] = {}
+    currency_totals: dict[str, float] = {}
+    missing_rates: set[str] = set()
+    for full_path, currency, total, converted in result.all():
+        category_totals.setdefault(full_path, 0.0)
+        if currency is None:
+            continue
+        currency_totals[currency] = round(currency_totals.get(currency, 0.0) + float(total), 2)
+        if converted is None:
+            missing_rates.add(currency)
+        else:
+            category_totals[full_path] = round(category_totals[full_path] + float(converted), 2)
+    overall_total = round(sum(category_totals.values()), 2)
 
     return schemas.MonthlySummary(
-        month=period_label,
+        month=_period_label(start_date, end_date),
         total=overall_total,
         category_totals=category_totals,
+        base_currency=base_currency,
+        currency_totals=dict(sorted(currency_totals.items())),
+        missing_rates=sorted(missing_rates),
         start_date=start_date,
         end_date=end_date,
         category_id=category_id,
     )
 
 
-async def export_expenses(
+async def category_tree_totals(
     session: AsyncSession,
     user_id: int,
-    *,
     start_date: datetime | None = None,
     end_date: datetime | None = None,
     category_id: int | None = None,
-    export_format: Literal["csv", "xlsx"] = "csv",
-) -> tuple[bytes, str, str]:
+    base_currency: str | None = None,
+) -> schemas.CategorySummaryTree:
+    """Own and subtree totals of every category, shaped as the category tree.
+
+    A single query joins each category to its descendants through the
+    closure table and sums their period totals per currency, converted into
+    ``base_currency`` like :func:`totals_by_period` (currencies without a
+    rate are listed in ``missing_rates``); ``category_id`` limits the tree
+    to that category's subtree. Percentages are shares of the period total
+    of the returned tree.
+    """
     start_date, end_date = _resolve_date_range(start_date, end_date)
+    base_currency = (base_currency or fx.base_currency()).upper()
+    rates = fx.rates_subquery(base_currency)
+    parts = rollups.period_totals_parts(user_id, start_date, end_date + timedelta(days=1), by_currency=True)
+    period_totals = (parts[0] if len(parts) == 1 else union_all(*parts)).subquery()
+
+    category = models.Category
+    closure = models.CategoryClosure
+    # NULL pour une devise sans taux : exclue des totaux convertis
+    converted = period_totals.c.total * rates.c.rate
+    query = (
+        select(
+            category.id,
+            category.parent_id,
+            category.name,
+            category.full_path,
+            period_totals.c.currency,
+            func.sum(case((closure.depth == 0, converted), else_=0.0)).label("own_total"),
+            func.sum(converted).label("subtree_total"),
+        )
+        .join(closure, closure.ancestor_id == category.id)
+        .outerjoin(period_totals, period_totals.c.category_id == closure.descendant_id)
+        .outerjoin(rates, rates.c.currency == period_totals.c.currency)
+        .where(category.user_id == user_id)
+        .group_by(category.id, category.parent_id, category.name, category.full_path, period_totals.c.currency)
+        .order_by(category.full_path)
+    )
+    if category_id is not None:
+        query = query.where(category.id.in_(category_tree.subtree_ids_query(category_id)))
+    rows = (await session.execute(query)).all()
+
+    # Une ligne par catégorie et devise, dans l'ordre des chemins
+    categories: dict[int, Row] = {}
+    totals: dict[int, list[float]] = {}
+    missing_rates: set[str] = set()
+    for row in rows:
+        categories.setdefault(row.id, row)
+        node_totals = totals.setdefault(row.id, [0.0, 0.0])
+        if row.currency is None:
+            continue
+        if row.subtree_total is None:
+            missing_rates.add(row.currency)
+            continue
+        node_totals[0] += float(row.own_total or 0)
+        node_totals[1] += float(row.subtree_total)
+
+    overall_total = round(sum(own_total for own_total, _ in totals.values()), 2)
+    nodes: dict[int, schemas.CategoryTotalNode] = {}
+    roots: list[schemas.CategoryTotalNode] = []
+    # Tri par chemin : un parent précède toujours ses enfants
+    for row in categories.values():
+        own_total, subtree_total = totals[row.id]
+        node = schemas.CategoryTotalNode(
+            id=row.id,
+            name=row.name,
+            full_path=row.full_path,
+            own_total=round(own_total, 2),
+            subtree_total=round(subtree_total, 2),
+            percentage=round(subtree_total / overall_total * 100, 2) if overall_total else 0.0,
+        )
+        nodes[row.id] = node
+        parent = nodes.get(row.parent_id) if row.id != category_id else None
+        (parent.children if parent is not None else roots).append(node)
 
-    # search_expenses retourne un tuple (expenses, total, has_next, has_previous)
-    # On ne prend que la liste des expenses pour l'export
-    expenses, _, _, _ = await search_expenses(
-        session,
-        user_id=user_id,
+    return schemas.CategorySummaryTree(
+        month=_period_label(start_date, end_date),
+        total=overall_total,
+        categories=roots,
+        base_currency=base_currency,
+        missing_rates=sorted(missing_rates),
+        start_date=start_date,
+        end_date=end_date,
         category_id=category_id,
+    )
+
+
+async def expense_timeseries(
+    session: AsyncSession,
+    user_id: int,
+    bucket: timeseries.Bucket = "month",
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    category_id: int | None = None,
+    max_points: int | None = None,
+    base_currency: str | None = None,
+) -> schemas.SummaryTimeseries:
+    """Totals per day, week or month over a period, one point per bucket.
+
+    Grouping happens in SQL, per bucket and currency, and totals are
+    converted into ``base_currency`` like :func:`totals_by_period`
+    (currencies without a rate are listed in ``missing_rates``); monthly
+    series read whole months from the rollup table. Buckets without expenses
+    are returned at zero and, when ``max_points`` is given, the series is
+    reduced with LTTB.
+    """
+    start_date, end_date = _resolve_date_range(start_date, end_date)
+    end_exclusive = end_date + timedelta(days=1)
+    base_currency = (base_currency or fx.base_currency()).upper()
+    rates = fx.rates_subquery(base_currency)
+    expense = models.Expense
+    dialect_name = session.bind.dialect.name
+
+    ranges: list[tuple[datetime, datetime]] = [(start_date, end_exclusive)]
+    queries = []
+    if bucket == "month":
+        months, ranges = rollups.split_range(start_date, end_exclusive)
+        if months is not None:
+            rollup = models.ExpenseMonthlyRollup
+            query = (
+                select(rollup.month, rollup.currency, func.sum(rollup.total * rates.c.rate), func.sum(rollup.count))
+                .outerjoin(rates, rates.c.currency == rollup.currency)
+                .where(rollup.user_id == user_id, rollup.month >= months[0], rollup.month < months[1])
+                .group_by(rollup.month, rollup.currency)
+            )
+            if category_id is not None:
+                query = query.where(rollup.category_id == category_id)
+            queries.append(query)
+    period = timeseries.bucket_expression(dialect_name, bucket, expense.created_at)
+    for low, high in ranges:
+        query = (
+            select(period, expense.currency, func.sum(expense.amount * rates.c.rate), func.count())
+            .outerjoin(rates, rates.c.currency == expense.currency)
+            .where(expense.user_id == user_id, expense.created_at >= low, expense.created_at < high)
+            .group_by(period, expense.currency)
+        )
+        if category_id is not None:
+            query = query.where(expense.category_id == category_id)
+        queries.append(query)
+
+    # Remplissage des trous : une valeur par période, même sans dépense
+    totals = {period_start: [0.0, 0] for period_start in timeseries.bucket_range(start_date, end_date, bucket)}
+    missing_rates: set[str] = set()
+    for query in queries:
+        for period_start, currency, total, count in (await session.execute(query)).all():
+            point = totals.setdefault(timeseries.as_date(period_start), [0.0, 0])
+            # Sans taux, la dépense est comptée mais exclue du total converti
+            if total is None:
+                missing_rates.add(currency)
+            else:
+                point[0] += float(total)
+            point[1] += int(count or 0)
+
+    points = [
+        schemas.TimeseriesPoint(period=period_start, total=round(total, 2), count=count)
+        for period_start, (total, count) in sorted(totals.items())
+    ]
+    overall_total = round(sum(point.total for point in points), 2)
+    downsampled = False
+    if max_points is not None and len(points) > max_points:
+        kept = timeseries.lttb_indices(
+            [point.period.toordinal() for point in points], [point.total for point in points], max_points
+        )
+        points = [points[index] for index in kept]
+        downsampled = True
+
+    return schemas.SummaryTimeseries(
+        bucket=bucket,
+        total=overall_total,
+        points=points,
+        downsampled=downsampled,
+        base_currency=base_currency,
+        missing_rates=sorted(missing_rates),
         start_date=start_date,
         end_date=end_date,
-        page=1,
-        per_page=10000,  # Nombre élevé pour récupérer toutes les dépenses
+        category_id=category_id,
     )
 
-    category_map = await _load_category_map(session, user_id)
-
-    grouped: dict[str, list[models.Expense]] = {}
-    for expense in expenses:
-        path = _build_category_path_from_map(expense.category_id, category_map)
-        grouped.setdefault(path, []).append(expense)
-
-    category_totals = {name: float(sum(exp.amount for exp in items)) for name, items in grouped.items()}
-    overall_total = float(sum(category_totals.values()))
-
-    headers = ["Catégorie", "ID", "Montant", "Note", "Date"]
-
-    if export_format == "csv":
-        buffer = io.StringIO()
-        writer = csv.writer(buffer)
-        writer.writerow(["Résumé"])
-        for name, total in category_totals.items():
-            writer.writerow([name, f"{total:.2f} €"])
-        writer.writerow(["Total", f"{overall_total:.2f} €"])
-        writer.writerow([])
-        writer.writerow(headers)
-        for name, items in grouped.items():
-            for expense in items:
-                writer.writerow(
-                    [
-                        name,
-                        expense.id,
-                        f"{expense.amount:.2f}",
-                        expense.note or "",
-                        expense.created_at.isoformat() if expense.created_at else "",
-                    ]
-                )
-        content = buffer.getvalue().encode("utf-8")
-        filename = "expenses.csv"
-        media_type = "text/csv"
+
+def _changes(values: Sequence[float]) -> tuple[list[float | None], list[float | None]]:
+    """Deltas and percentage changes of each value against the previous one."""
+    deltas: list[float | None] = [None]
+    changes: list[float | None] = [None]
+    for previous, current in zip(values, values[1:]):
+        deltas.append(round(current - previous, 2))
+        changes.append(round((current - previous) / previous * 100, 2) if previous else None)
+    return deltas, changes
+
+
+async def compare_periods(
+    session: AsyncSession,
+    user_id: int,
+    periods: Sequence[schemas.ComparisonPeriod],
+    category_id: int | None = None,
+    base_currency: str | None = None,
+) -> schemas.SummaryComparison:
+    """Per-category totals of several periods, from one grouped query.
+
+    The rollup and edge SELECTs of every period are tagged with the period's
+    index and combined into a single UNION ALL grouped by period, category
+    and currency, so overlapping periods are counted independently; totals
+    are converted into ``base_currency`` like :func:`totals_by_period`
+    (currencies without a rate are listed in ``missing_rates``). Each period
+    is compared with the one before it; categories without expenses in any
+    of the periods are left out.
+    """
+    base_currency = (base_currency or fx.base_currency()).upper()
+    rates = fx.rates_subquery(base_currency)
+    parts = []
+    for index, period in enumerate(periods):
+        start_date, end_date = _resolve_date_range(period.start_date, period.end_date)
+        parts.extend(
+            rollups.period_totals_parts(
+                user_id, start_date, end_date + timedelta(days=1), literal(index).label("period"), by_currency=True
+            )
+        )
+    combined = union_all(*parts).subquery()
+
+    query = (
+        select(
+            combined.c.period,
+            models.Category.full_path,
+            combined.c.currency,
+            func.sum(combined.c.total * rates.c.rate),
+        )
+        .join(models.Category, models.Category.id == combined.c.category_id)
+        .outerjoin(rates, rates.c.currency == combined.c.currency)
+        .group_by(combined.c.period, models.Category.id, models.Category.full_path, combined.c.currency)
+        .order_by(models.Category.full_path)
+    )
+    if category_id is not None:
+        query = query.where(models.Category.id == category_id)
+
+    by_category: dict[str, list[float]] = {}
+    missing_rates: set[str] = set()
+    for period_index, full_path, currency, total in (await session.execute(query)).all():
+        totals = by_category.setdefault(full_path, [0.0] * len(periods))
+        if total is None:
+            missing_rates.add(currency)
+        else:
+            totals[period_index] = round(totals[period_index] + float(total), 2)
+
+    period_totals = [round(sum(totals[index] for totals in by_category.values()), 2) for index in range(len(periods))]
+    deltas, changes = _changes(period_totals)
+    categories = []
+    for full_path, totals in by_category.items():
+        category_deltas, category_changes = _changes(totals)
+        categories.append(
+            schemas.CategoryComparison(
+                category=full_path, totals=totals, deltas=category_deltas, changes_pct=category_changes
+            )
+        )
+
+    return schemas.SummaryComparison(
+        periods=[
+            schemas.PeriodTotal(
+                label=period.label or _period_label(period.start_date, period.end_date),
+                start_date=period.start_date,
+                end_date=period.end_date,
+                total=total,
+                delta=delta,
+                change_pct=change,
+            )
+            for period, total, delta, change in zip(periods, period_totals, deltas, changes)
+        ],
+        categories=categories,
+        base_currency=base_currency,
+        missing_rates=sorted(missing_rates),
+        category_id=category_id,
+    )
+
+
+EXPORT_HEADERS = ["Catégorie", "ID", "Montant", "Note", "Date", "Devise"]
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+ExportFormat = Literal["csv", "xlsx", "ndjson", "arrow", "parquet"]
+# Formats encodés lot par lot au fil du curseur ; les autres sont des conteneurs
+# à finaliser, écrits dans un fichier temporaire puis renvoyés
+_STREAMED_EXPORT_FORMATS = {"csv", "ndjson"}
+# Nombre de lignes lues par aller-retour sur le curseur serveur lors d'un export
+EXPORT_BATCH_SIZE = 2000
+
+
+def _export_filters(
+    user_id: int,
+    start_date: datetime,
+    end_date: datetime,
+    category_id: int | None,
+    include_descendants: bool = False,
+) -> list:
+    filters = [
+        models.Expense.user_id == user_id,
+        models.Expense.created_at >= start_date,
+        models.Expense.created_at < end_date + timedelta(days=1),
+    ]
+    if category_id is not None:
+        filters.append(_category_condition(models.Expense.category_id, category_id, include_descendants))
+    return filters
+
+
+def _export_rows_query(filters: list):
+    # Colonnes brutes plutôt que des objets ORM : rien n'est gardé en mémoire
+    # d'un lot à l'autre
+    return (
+        select(
+            models.Category.full_path,
+            models.Expense.id,
+            models.Expense.amount,
+            models.Expense.note,
+            models.Expense.created_at,
+            models.Expense.currency,
+        )
+        .join(models.Category, models.Category.id == models.Expense.category_id)
+        .where(*filters)
+        .order_by(models.Category.full_path, models.Expense.created_at.desc(), models.Expense.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+
+
+def _export_json_query(dialect_name: str, filters: list):
+    # Chaque ligne est sérialisée en JSON par la base : aucun formatage par
+    # ligne côté Python
+    expense = models.Expense
+    if dialect_name == "postgresql":
+        document = cast(
+            func.json_build_object(
+                "category", models.Category.full_path,
+                "id", expense.id,
+                "amount", expense.amount,
+                "note", expense.note,
+                "created_at", expense.created_at,
+                "currency", expense.currency,
+            ),
+            Text,
+        )
     else:
-        workbook = Workbook()
-        summary_sheet = workbook.active
-        summary_sheet.title = "Résumé"
-        summary_sheet.append(["Catégorie", "Total (€)"])
-        for name, total in category_totals.items():
-            summary_sheet.append([name, float(total)])
-        summary_sheet.append(["Total", overall_total])
-
-        detail_sheet = workbook.create_sheet("Détails")
-        detail_sheet.append(headers)
-        for name, items in grouped.items():
-            for expense in items:
-                detail_sheet.append(
-                    [
-                        name,
-                        expense.id,
-                        float(expense.amount),
-                        expense.note or "",
-                        expense.created_at.isoformat() if expense.created_at else "",
-                    ]
-                )
+        document = func.json_object(
+            "category", models.Category.full_path,
+            "id", expense.id,
+            "amount", cast(expense.amount, Float),
+            "note", expense.note,
+            "created_at", func.strftime("%Y-%m-%dT%H:%M:%f", expense.created_at),
+            "currency", expense.currency,
+        )
+    return (
+        select(document)
+        .select_from(expense)
+        .join(models.Category, models.Category.id == expense.category_id)
+        .where(*filters)
+        .order_by(models.Category.full_path, expense.created_at.desc(), expense.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+
+
+async def _export_category_totals(
+    session: AsyncSession, filters: list, currency: str
+) -> tuple[dict[str, float], int]:
+    """Return the per-category totals of an export, converted into ``currency``, and its number of rows."""
+    rates = fx.rates_subquery(currency)
+    result = await session.execute(
+        select(
+            models.Category.full_path,
+            func.coalesce(func.sum(models.Expense.amount * rates.c.rate), 0.0),
+            func.count(),
+        )
+        .join(models.Category, models.Category.id == models.Expense.category_id)
+        .outerjoin(rates, rates.c.currency == models.Expense.currency)
+        .where(*filters)
+        .group_by(models.Category.id, models.Category.full_path)
+        .order_by(models.Category.full_path)
+    )
+    rows = result.all()
+    return {full_path: round(float(total), 2) for full_path, total, _ in rows}, sum(count for *_, count in rows)
+
+
+async def _iter_export_rows(
+    session: AsyncSession,
+    filters: list,
+    on_batch: Callable[[int], None] | None = None,
+    *,
+    query=None,
+) -> AsyncIterator[Sequence]:
+    """Yield export rows in batches from a server-side cursor."""
+    result = await session.stream(query if query is not None else _export_rows_query(filters))
+    async for partition in result.partitions():
+        yield partition
+        if on_batch is not None:
+            on_batch(len(partition))
+
+
+async def _csv_chunks(
+    category_totals: dict[str, float],
+    batches: AsyncIterator[Sequence],
+    currency: str,
+) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush() -> bytes:
+        chunk = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate(0)
+        return chunk
+
+    writer.writerow(["Résumé"])
+    for name, total in category_totals.items():
+        writer.writerow([name, fx.format_amount(total, currency)])
+    writer.writerow(["Total", fx.format_amount(sum(category_totals.values()), currency)])
+    writer.writerow([])
+    writer.writerow(EXPORT_HEADERS)
+    yield flush()
+
+    async for rows in batches:
+        writer.writerows(
+            [
+                name,
+                expense_id,
+                f"{amount:.2f}",
+                note or "",
+                created_at.isoformat() if created_at else "",
+                expense_currency,
+            ]
+            for name, expense_id, amount, note, created_at, expense_currency in rows
+        )
+        yield flush()
+
+
+async def _ndjson_chunks(batches: AsyncIterator[Sequence]) -> AsyncIterator[bytes]:
+    async for rows in batches:
+        yield ("\n".join(document for (document,) in rows) + "\n").encode("utf-8")
 
-        bytes_buffer = io.BytesIO()
-        workbook.save(bytes_buffer)
-        content = bytes_buffer.getvalue()
-        filename = "expenses.xlsx"
-        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
 
-    return content, media_type, filename
+def _encoded_export(
+    session: AsyncSession,
+    filters: list,
+    category_totals: dict[str, float],
+    currency: str,
+    export_format: ExportFormat,
+    on_batch: Callable[[int], None] | None = None,
+) -> AsyncIterator[bytes]:
+    if export_format == "ndjson":
+        query = _export_json_query(session.bind.dialect.name, filters)
+        return _ndjson_chunks(_iter_export_rows(session, filters, on_batch, query=query))
+    return _csv_chunks(category_totals, _iter_export_rows(session, filters, on_batch), currency)
+
+
+async def _spooled_export(
+    session: AsyncSession,
+    filters: list,
+    category_totals: dict[str, float],
+    currency: str,
+    export_format: ExportFormat,
+    on_batch: Callable[[int], None] | None = None,
+    directory: str | None = None,
+) -> str:
+    batches = _iter_export_rows(session, filters, on_batch)
+    if export_format == "xlsx":
+        return await exports.write_xlsx(
+            category_totals, EXPORT_HEADERS, batches, currency=currency, directory=directory
+        )
+    return await exports.write_arrow(batches, export_format, directory=directory)
+
+
+async def export_expenses(
+    session: AsyncSession,
+    user_id: int,
+    *,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    category_id: int | None = None,
+    include_descendants: bool = False,
+    export_format: ExportFormat = "csv",
+) -> tuple[AsyncIterator[bytes], str, str]:
+    """Export the expenses of a period as a stream of byte chunks.
+
+    The summary block comes from an aggregate query; the detail rows are read
+    from a server-side cursor, so the export runs in constant memory whatever
+    the size of the history. CSV and NDJSON are encoded batch by batch (the
+    session must stay open until the returned iterator is exhausted); XLSX,
+    Arrow and Parquet are written off the event loop to a spool file that is
+    then streamed. Arrow and Parquet carry the detail rows only.
+
+    Detail rows keep their own currency; the summary block is converted into
+    the base currency (see :func:`fx.base_currency`).
+    """
+    start_date, end_date = _resolve_date_range(start_date, end_date)
+    filters = _export_filters(user_id, start_date, end_date, category_id, include_descendants)
+    currency = fx.base_currency()
+    category_totals, _ = await _export_category_totals(session, filters, currency)
+
+    if export_format in _STREAMED_EXPORT_FORMATS:
+        chunks = _encoded_export(session, filters, category_totals, currency, export_format)
+    else:
+        chunks = exports.stream_file(
+            await _spooled_export(session, filters, category_totals, currency, export_format)
+        )
+    return chunks, EXPORT_MEDIA_TYPES[export_format], f"expenses.{export_format}"
+
+
+async def write_export_file(
+    session: AsyncSession,
+    user_id: int,
+    *,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    category_id: int | None = None,
+    include_descendants: bool = False,
+    export_format: ExportFormat = "csv",
+    directory: str | None = None,
+    progress: Callable[[int, int], None] | None = None,
+) -> tuple[str, str, str]:
+    """Write an export to a file in ``directory`` and return ``(path, media_type, filename)``.
+
+    ``progress`` is called with ``(rows_written, rows_total)`` before the first
+    batch and after each one.
+    """
+    start_date, end_date = _resolve_date_range(start_date, end_date)
+    filters = _export_filters(user_id, start_date, end_date, category_id, include_descendants)
+    currency = fx.base_currency()
+    category_totals, rows_total = await _export_category_totals(session, filters, currency)
+
+    rows_written = 0
+
+    def on_batch(count: int) -> None:
+        nonlocal rows_written
+        rows_written += count
+        if progress is not None:
+            progress(rows_written, rows_total)
+
+    if progress is not None:
+        progress(0, rows_total)
+
+    if export_format in _STREAMED_EXPORT_FORMATS:
+        chunks = _encoded_export(session, filters, category_totals, currency, export_format, on_batch)
+        path = await exports.write_chunks(chunks, f".{export_format}", directory=directory)
+    else:
+        path = await _spooled_export(
+            session, filters, category_totals, currency, export_format, on_batch, directory
+        )
+    return path, EXPORT_MEDIA_TYPES[export_format], f"expenses.{export_format}"
 
 
 async def paginate_query(
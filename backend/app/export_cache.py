@@ -0,0 +1,155 @@
+"""On-disk cache of generated export files.
+
+An export is addressed by a hash of everything that determines its content:
+user, filters, format and the user's data version (see :func:`cache.version`,
+bumped whenever the user's expenses change). A repeat export with no write in
+between is therefore served from disk, and a stale file is simply never asked
+for again. The directory is kept under a byte budget by evicting the least
+recently used files.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from datetime import date, datetime
+
+from . import fx
+from .cache import version as cache_version
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+# Les compteurs de version repartent de zéro à chaque démarrage : le jeton de
+# démarrage évite de resservir un fichier produit par un processus précédent
+_BOOT_TOKEN = uuid.uuid4().hex
+
+
+def data_version(user_id: int) -> str:
+    """Version of the data an export of ``user_id`` depends on."""
+    # Les lignes exportées embarquent le chemin de leur catégorie : la version
+    # des catégories, de nouveau incrémentée à la validation d'un renommage ou
+    # d'une suppression, en fait partie
+    return f"{cache_version(f'expenses:{user_id}')}/{cache_version(f'categories:{user_id}')}"
+
+
+def export_key(
+    user_id: int,
+    *,
+    export_format: str,
+    start_date: datetime | None,
+    end_date: datetime | None,
+    category_id: int | None,
+    include_descendants: bool = False,
+) -> str:
+    """Content address of an export (also used as its ETag)."""
+    parts = [
+        _BOOT_TOKEN,
+        str(user_id),
+        data_version(user_id),
+        export_format,
+        start_date.isoformat() if start_date else "",
+        end_date.isoformat() if end_date else "",
+        str(category_id) if category_id is not None else "",
+        "subtree" if include_descendants else "",
+        # Le résumé est converti avec la table de taux courante
+        fx.base_currency(),
+        fx.load_rates().version,
+        # Sans dates explicites, la période par défaut dépend du jour courant
+        date.today().isoformat() if start_date is None or end_date is None else "",
+    ]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+class ExportCache:
+    """Content-addressed export files with an LRU byte budget."""
+
+    def __init__(self, directory: str, *, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, tuple[str, int]] = OrderedDict()
+        self._size = 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def get(self, key: str) -> str | None:
+        """Return the path of a cached export and mark it as recently used."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        path, _ = entry
+        if not os.path.exists(path):
+            self._forget(key)
+            return None
+        self._entries.move_to_end(key)
+        return path
+
+    async def store(self, key: str, suffix: str, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """Yield ``chunks`` while writing them to the cache.
+
+        The file is only registered once every chunk has been produced; an
+        interrupted export (client gone, error) leaves nothing behind.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        fd, partial_path = tempfile.mkstemp(prefix=".partial-", dir=self.directory)
+        os.close(fd)
+        completed = False
+        try:
+            with open(partial_path, "wb") as handle:
+                async for chunk in chunks:
+                    await asyncio.to_thread(handle.write, chunk)
+                    yield chunk
+            path = os.path.join(self.directory, f"{key}{suffix}")
+            os.replace(partial_path, path)
+            completed = True
+            self._register(key, path, os.path.getsize(path))
+        finally:
+            if not completed:
+                _remove_quietly(partial_path)
+
+    def _register(self, key: str, path: str, size: int) -> None:
+        if key in self._entries:
+            self._forget(key, remove_file=False)
+        self._entries[key] = (path, size)
+        self._size += size
+        self._evict()
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            self._forget(oldest)
+
+    def _forget(self, key: str, *, remove_file: bool = True) -> None:
+        path, size = self._entries.pop(key)
+        self._size -= size
+        if remove_file:
+            _remove_quietly(path)
+
+    def clear(self) -> None:
+        """Drop every cached export (files from a previous process included)."""
+        self._entries.clear()
+        self._size = 0
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+export_cache = ExportCache(
+    config.get("EXPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "expense-export-cache")),
+    max_bytes=config.get_int("EXPORT_CACHE_MAX_BYTES", 512 * 1024 * 1024),
+)
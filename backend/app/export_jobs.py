@@ -0,0 +1,227 @@
+"""In-process background export jobs.
+
+Large exports are written by background tasks instead of inside the request,
+so they are not bound by the request timeout. Finished files are spooled in
+``EXPORT_SPOOL_DIR`` and served by a download endpoint until they expire.
+
+The backend runs a single worker process, so job state lives in memory: a
+restart loses pending jobs and :meth:`ExportJobManager.reset_spool_dir`
+removes the files left behind.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Final, Literal
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from . import crud
+from .config import config
+from .database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+JobStatus = Literal["pending", "running", "done", "failed"]
+PENDING: Final = "pending"
+RUNNING: Final = "running"
+DONE: Final = "done"
+FAILED: Final = "failed"
+
+
+class ExportJobLimitError(Exception):
+    """Raised when a user already has too many export jobs in flight."""
+
+
+@dataclass
+class ExportJob:
+    """State of one background export."""
+
+    id: str
+    user_id: int
+    key: tuple
+    export_format: str
+    start_date: datetime | None
+    end_date: datetime | None
+    category_id: int | None
+    include_descendants: bool = False
+    status: JobStatus = PENDING
+    rows_written: int = 0
+    rows_total: int | None = None
+    path: str | None = None
+    media_type: str | None = None
+    filename: str | None = None
+    size: int | None = None
+    error: str | None = None
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    finished_at: datetime | None = None
+    expires_at: datetime | None = None
+    task: asyncio.Task | None = field(default=None, repr=False)
+
+    @property
+    def in_flight(self) -> bool:
+        return self.status in (PENDING, RUNNING)
+
+    @property
+    def progress(self) -> float | None:
+        """Fraction of rows written, between 0 and 1 (``None`` before counting)."""
+        if self.status == DONE:
+            return 1.0
+        if not self.rows_total:
+            return None if self.rows_total is None else 0.0
+        return min(self.rows_written / self.rows_total, 1.0)
+
+
+class ExportJobManager:
+    """Run export jobs on a bounded pool of background tasks."""
+
+    def __init__(
+        self,
+        *,
+        spool_dir: str,
+        max_workers: int = 2,
+        max_jobs_per_user: int = 3,
+        ttl_seconds: int = 3600,
+        session_factory: async_sessionmaker[AsyncSession] = AsyncSessionLocal,
+    ) -> None:
+        self.spool_dir = spool_dir
+        self.max_jobs_per_user = max_jobs_per_user
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.session_factory = session_factory
+        self._workers = asyncio.Semaphore(max_workers)
+        self._jobs: dict[str, ExportJob] = {}
+        self._sweeper: asyncio.Task | None = None
+
+    def submit(
+        self,
+        user_id: int,
+        *,
+        export_format: str,
+        start_date: datetime | None = None,
+        end_date: datetime | None = None,
+        category_id: int | None = None,
+        include_descendants: bool = False,
+    ) -> ExportJob:
+        """Queue an export, or return the identical job already in flight."""
+        if start_date and end_date and start_date > end_date:
+            raise ValueError("start_date must be before end_date")
+        self.purge_expired()
+        key = (user_id, export_format, start_date, end_date, category_id, include_descendants)
+        user_jobs = [job for job in self._jobs.values() if job.user_id == user_id and job.in_flight]
+        for job in user_jobs:
+            if job.key == key:
+                return job
+        if len(user_jobs) >= self.max_jobs_per_user:
+            raise ExportJobLimitError(
+                f"Too many export jobs in progress (max {self.max_jobs_per_user})"
+            )
+
+        job = ExportJob(
+            id=uuid.uuid4().hex,
+            user_id=user_id,
+            key=key,
+            export_format=export_format,
+            start_date=start_date,
+            end_date=end_date,
+            category_id=category_id,
+            include_descendants=include_descendants,
+        )
+        self._jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job))
+        return job
+
+    def get(self, job_id: str, user_id: int) -> ExportJob | None:
+        """Return a job of ``user_id`` (``None`` if unknown, expired or another user's)."""
+        self.purge_expired()
+        job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    async def _run(self, job: ExportJob) -> None:
+        async with self._workers:
+            job.status = RUNNING
+
+            def progress(rows_written: int, rows_total: int) -> None:
+                job.rows_written = rows_written
+                job.rows_total = rows_total
+
+            try:
+                os.makedirs(self.spool_dir, exist_ok=True)
+                async with self.session_factory() as session:
+                    job.path, job.media_type, job.filename = await crud.write_export_file(
+                        session,
+                        job.user_id,
+                        start_date=job.start_date,
+                        end_date=job.end_date,
+                        category_id=job.category_id,
+                        include_descendants=job.include_descendants,
+                        export_format=job.export_format,  # type: ignore[arg-type]
+                        directory=self.spool_dir,
+                        progress=progress,
+                    )
+                job.size = os.path.getsize(job.path)
+                job.status = DONE
+            except Exception as exc:
+                logger.error(f"Export job {job.id} failed: {exc}", exc_info=True)
+                job.status = FAILED
+                job.error = str(exc) if isinstance(exc, ValueError) else "Export failed"
+            finally:
+                job.finished_at = datetime.utcnow()
+                job.expires_at = job.finished_at + self.ttl
+                job.task = None
+
+    def purge_expired(self) -> None:
+        """Forget finished jobs past their expiry and delete their files."""
+        now = datetime.utcnow()
+        for job_id, job in list(self._jobs.items()):
+            if job.expires_at is not None and job.expires_at <= now:
+                self._jobs.pop(job_id, None)
+                if job.path:
+                    try:
+                        os.unlink(job.path)
+                    except FileNotFoundError:
+                        pass
+
+    async def _sweep(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            self.purge_expired()
+
+    def start(self, *, sweep_interval: float = 300) -> None:
+        """Clear the spool directory and purge expired jobs periodically."""
+        self.reset_spool_dir()
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep(sweep_interval))
+
+    def reset_spool_dir(self) -> None:
+        """Remove spooled files left by a previous process (jobs are not persisted)."""
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+    async def shutdown(self) -> None:
+        """Cancel jobs still running (their partial files are removed by the writers)."""
+        tasks = [job.task for job in self._jobs.values() if job.task is not None]
+        if self._sweeper is not None:
+            tasks.append(self._sweeper)
+            self._sweeper = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+manager = ExportJobManager(
+    spool_dir=config.get(
+        "EXPORT_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "expense-exports")
+    ),
+    max_workers=config.get_int("EXPORT_JOB_WORKERS", 2),
+    max_jobs_per_user=config.get_int("EXPORT_JOB_MAX_PER_USER", 3),
+    ttl_seconds=config.get_int("EXPORT_JOB_TTL_SECONDS", 3600),
+)
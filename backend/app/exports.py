@@ -0,0 +1,176 @@
+"""File writers for expense exports.
+
+Writers run their blocking work in worker threads and spool to a temporary
+file, so a large export neither blocks the event loop nor keeps the whole
+document in memory. The file is then streamed back in fixed-size chunks and
+removed once sent.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import tempfile
+from collections.abc import AsyncIterator, Iterable, Sequence
+
+from openpyxl import Workbook
+
+from .fx import CURRENCY_SYMBOLS
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _new_spool_file(suffix: str, directory: str | None = None) -> str:
+    fd, path = tempfile.mkstemp(prefix="expenses-export-", suffix=suffix, dir=directory)
+    os.close(fd)
+    return path
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _detail_row(row: Sequence) -> list:
+    name, expense_id, amount, note, created_at, currency = row
+    return [
+        name,
+        expense_id,
+        float(amount),
+        note or "",
+        created_at.isoformat() if created_at else "",
+        currency,
+    ]
+
+
+def _append_rows(sheet, rows: Iterable[Sequence]) -> None:
+    for row in rows:
+        sheet.append(_detail_row(row))
+
+
+async def write_xlsx(
+    category_totals: dict[str, float],
+    headers: list[str],
+    batches: AsyncIterator[Sequence[Sequence]],
+    *,
+    currency: str = "EUR",
+    directory: str | None = None,
+) -> str:
+    """Write the export workbook to a temporary file and return its path.
+
+    The workbook is opened in ``write_only`` mode: rows are serialized as they
+    are appended instead of being kept as cell objects. Appending and saving
+    happen in a worker thread, one batch at a time.
+    """
+    path = _new_spool_file(".xlsx", directory)
+    try:
+        workbook = Workbook(write_only=True)
+        summary_sheet = workbook.create_sheet("Résumé")
+        summary_sheet.append(["Catégorie", f"Total ({CURRENCY_SYMBOLS.get(currency, currency)})"])
+        for name, total in category_totals.items():
+            summary_sheet.append([name, float(total)])
+        summary_sheet.append(["Total", float(sum(category_totals.values()))])
+
+        detail_sheet = workbook.create_sheet("Détails")
+        detail_sheet.append(headers)
+        async for rows in batches:
+            await asyncio.to_thread(_append_rows, detail_sheet, rows)
+
+        await asyncio.to_thread(workbook.save, path)
+    except BaseException:
+        _remove_quietly(path)
+        raise
+    return path
+
+
+def _arrow_schema(pa):
+    return pa.schema(
+        [
+            ("category", pa.string()),
+            ("id", pa.int64()),
+            ("amount", pa.decimal128(12, 2)),
+            ("note", pa.string()),
+            ("created_at", pa.timestamp("us", tz="UTC")),
+            ("currency", pa.string()),
+        ]
+    )
+
+
+def _record_batch(pa, schema, rows: Sequence[Sequence]):
+    # Conversion colonne par colonne, effectuée en C par pyarrow
+    columns = list(zip(*rows))
+    return pa.record_batch(
+        [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+        schema=schema,
+    )
+
+
+async def write_arrow(
+    batches: AsyncIterator[Sequence[Sequence]],
+    export_format: str,
+    *,
+    directory: str | None = None,
+) -> str:
+    """Write export rows as an Arrow IPC stream or a Parquet file and return its path.
+
+    Each cursor batch becomes one record batch (one row group for Parquet);
+    conversion and writing happen in a worker thread.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:  # pragma: no cover - dépend de l'installation
+        raise ValueError(f"Export format '{export_format}' requires pyarrow") from exc
+
+    schema = _arrow_schema(pa)
+    path = _new_spool_file(f".{export_format}", directory)
+    try:
+        if export_format == "parquet":
+            writer = pq.ParquetWriter(path, schema, compression="zstd")
+            write = writer.write_batch
+        else:
+            sink = pa.OSFile(path, "wb")
+            writer = pa.ipc.new_stream(sink, schema)
+            write = writer.write_batch
+        try:
+            async for rows in batches:
+                if rows:
+                    await asyncio.to_thread(lambda rows=rows: write(_record_batch(pa, schema, rows)))
+        finally:
+            await asyncio.to_thread(writer.close)
+            if export_format != "parquet":
+                sink.close()
+    except BaseException:
+        _remove_quietly(path)
+        raise
+    return path
+
+
+async def write_chunks(
+    chunks: AsyncIterator[bytes],
+    suffix: str,
+    *,
+    directory: str | None = None,
+) -> str:
+    """Write byte chunks to a temporary file off the event loop and return its path."""
+    path = _new_spool_file(suffix, directory)
+    try:
+        with open(path, "wb") as handle:
+            async for chunk in chunks:
+                await asyncio.to_thread(handle.write, chunk)
+    except BaseException:
+        _remove_quietly(path)
+        raise
+    return path
+
+
+async def stream_file(path: str, *, chunk_size: int = STREAM_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Yield a spooled export file in chunks, then delete it."""
+    try:
+        with open(path, "rb") as handle:
+            while chunk := await asyncio.to_thread(handle.read, chunk_size):
+                yield chunk
+    finally:
+        _remove_quietly(path)
@@ -0,0 +1,94 @@
+"""Exchange rates for currency-aware summaries and exports.
+
+Rates are read from a local JSON file (``FX_RATES_FILE``, by default
+``app/data/fx_rates.json``); no network call is ever made. The file gives,
+for each currency, the value of one unit in the table's base currency::
+
+    {"base": "EUR", "date": "2025-10-01", "rates": {"EUR": 1.0, "USD": 0.85}}
+
+The parsed table is kept in memory and reloaded only when the file changes.
+Conversions happen in SQL: :func:`rates_subquery` turns the table into a
+``(currency, rate)`` relation joined to the aggregated amounts.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+
+from sqlalchemy import literal, select, union_all
+
+from .config import config
+
+DEFAULT_RATES_FILE = os.path.join(os.path.dirname(__file__), "data", "fx_rates.json")
+CURRENCY_SYMBOLS = {"EUR": "€", "USD": "$", "GBP": "£", "JPY": "¥"}
+
+
+@dataclass(frozen=True)
+class RateTable:
+    """Value of one unit of each currency in ``base``."""
+
+    base: str
+    rates: dict[str, float]
+    date: str | None = None
+    # Empreinte du contenu : change dès que le fichier est modifié
+    version: str = ""
+
+    def rates_to(self, base: str) -> dict[str, float]:
+        """Rates expressed in another base currency of the table."""
+        if base not in self.rates:
+            raise ValueError(f"No exchange rate for base currency '{base}'")
+        pivot = self.rates[base]
+        return {currency: rate / pivot for currency, rate in self.rates.items()}
+
+
+_loaded: tuple[str, float, RateTable] | None = None
+
+
+def load_rates(path: str | None = None) -> RateTable:
+    """Return the rate table, re-reading the file only when its mtime changed."""
+    global _loaded
+    rates_file: str = path or config.get("FX_RATES_FILE") or DEFAULT_RATES_FILE
+    mtime = os.path.getmtime(rates_file)
+    if _loaded is not None and _loaded[0] == rates_file and _loaded[1] == mtime:
+        return _loaded[2]
+
+    with open(rates_file, "rb") as handle:
+        content = handle.read()
+    data = json.loads(content)
+    base = str(data["base"]).upper()
+    rates = {str(currency).upper(): float(rate) for currency, rate in data["rates"].items()}
+    rates.setdefault(base, 1.0)
+    if any(rate <= 0 for rate in rates.values()):
+        raise ValueError(f"Invalid exchange rate in {rates_file}")
+    table = RateTable(
+        base=base,
+        rates=rates,
+        date=data.get("date"),
+        version=hashlib.sha256(content).hexdigest()[:16],
+    )
+    _loaded = (rates_file, mtime, table)
+    return table
+
+
+def base_currency() -> str:
+    """Currency summaries and exports are converted to when none is requested."""
+    return (config.get("BASE_CURRENCY") or load_rates().base).upper()
+
+
+def rates_subquery(base: str, table: RateTable | None = None):
+    """``(currency, rate)`` relation converting amounts of each currency into ``base``."""
+    rates = (table or load_rates()).rates_to(base)
+    return union_all(
+        *(
+            select(literal(currency).label("currency"), literal(rate).label("rate"))
+            for currency, rate in sorted(rates.items())
+        )
+    ).subquery("fx_rates")
+
+
+def format_amount(amount: float, currency: str) -> str:
+    """Render an amount with its currency symbol (or ISO code)."""
+    return f"{amount:.2f} {CURRENCY_SYMBOLS.get(currency, currency)}"
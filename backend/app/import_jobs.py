@@ -0,0 +1,241 @@
+"""In-process background import jobs.
+
+An uploaded file is spooled to ``IMPORT_SPOOL_DIR`` and imported by a
+background task, ``IMPORT_CHUNK_SIZE`` rows per transaction: a failure only
+rolls back the current chunk. Progress is exposed while the job runs and the
+rejected rows are written to a CSV error report kept until the job expires.
+
+As for exports (see :mod:`export_jobs`), job state lives in memory.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from . import crud, imports
+from .cache import invalidate as cache_invalidate
+from .config import config
+from .database import AsyncSessionLocal
+from .export_jobs import DONE, FAILED, PENDING, RUNNING, JobStatus
+from .exports import _remove_quietly
+
+logger = logging.getLogger(__name__)
+
+
+class ImportJobLimitError(Exception):
+    """Raised when a user already has too many import jobs in flight."""
+
+
+@dataclass
+class ImportJob:
+    """State of one background import."""
+
+    id: str
+    user_id: int
+    import_format: str
+    filename: str | None
+    upload_path: str
+    status: JobStatus = PENDING
+    rows_processed: int = 0
+    rows_imported: int = 0
+    rows_failed: int = 0
+    categories_created: int = 0
+    reader: imports.RowReader | None = field(default=None, repr=False)
+    error_report_path: str | None = None
+    error: str | None = None
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    finished_at: datetime | None = None
+    expires_at: datetime | None = None
+    task: asyncio.Task | None = field(default=None, repr=False)
+
+    @property
+    def in_flight(self) -> bool:
+        return self.status in (PENDING, RUNNING)
+
+    @property
+    def progress(self) -> float | None:
+        """Fraction of the file read, between 0 and 1."""
+        if self.status == DONE:
+            return 1.0
+        if self.reader is None:
+            return 0.0
+        return self.reader.progress
+
+
+class ImportJobManager:
+    """Run import jobs on a bounded pool of background tasks."""
+
+    def __init__(
+        self,
+        *,
+        spool_dir: str,
+        chunk_size: int = 1000,
+        max_bytes: int = 512 * 1024 * 1024,
+        max_workers: int = 1,
+        max_jobs_per_user: int = 2,
+        ttl_seconds: int = 3600,
+        session_factory: async_sessionmaker[AsyncSession] = AsyncSessionLocal,
+    ) -> None:
+        self.spool_dir = spool_dir
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self.max_jobs_per_user = max_jobs_per_user
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.session_factory = session_factory
+        self._workers = asyncio.Semaphore(max_workers)
+        self._jobs: dict[str, ImportJob] = {}
+        self._sweeper: asyncio.Task | None = None
+
+    def check_limit(self, user_id: int) -> None:
+        """Raise :class:`ImportJobLimitError` before a new upload is spooled."""
+        self.purge_expired()
+        in_flight = sum(1 for job in self._jobs.values() if job.user_id == user_id and job.in_flight)
+        if in_flight >= self.max_jobs_per_user:
+            raise ImportJobLimitError(f"Too many import jobs in progress (max {self.max_jobs_per_user})")
+
+    def submit(self, user_id: int, *, upload_path: str, import_format: str, filename: str | None) -> ImportJob:
+        """Queue the import of a spooled upload (the job takes ownership of the file)."""
+        job = ImportJob(
+            id=uuid.uuid4().hex,
+            user_id=user_id,
+            import_format=import_format,
+            filename=filename,
+            upload_path=upload_path,
+        )
+        self._jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job))
+        return job
+
+    def get(self, job_id: str, user_id: int) -> ImportJob | None:
+        """Return a job of ``user_id`` (``None`` if unknown, expired or another user's)."""
+        self.purge_expired()
+        job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    async def _run(self, job: ImportJob) -> None:
+        async with self._workers:
+            job.status = RUNNING
+            report: imports.ErrorReport | None = None
+            try:
+                os.makedirs(self.spool_dir, exist_ok=True)
+                job.reader = imports.RowReader(job.upload_path, job.import_format, chunk_size=self.chunk_size)
+                report = imports.ErrorReport(self.spool_dir)
+                job.error_report_path = report.path
+                chunks = job.reader.chunks()
+                category_paths: dict[str, tuple[int, str]] | None = None
+                while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+                    async with self.session_factory() as session:
+                        if category_paths is None:
+                            category_paths = await crud.load_category_paths(session, job.user_id)
+                        known_before = len(category_paths)
+                        try:
+                            errors = await self._import_chunk(session, job, chunk, category_paths)
+                            await session.commit()
+                        except BaseException:
+                            await session.rollback()
+                            # Les catégories créées par le lot annulé n'existent plus
+                            category_paths = None
+                            raise
+                    job.categories_created += len(category_paths) - known_before
+                    job.rows_processed += len(chunk)
+                    job.rows_failed += len(errors)
+                    job.rows_imported += len(chunk) - len(errors)
+                    if errors:
+                        await asyncio.to_thread(report.write, errors)
+                    self._invalidate(job.user_id)
+                job.status = DONE
+            except Exception as exc:
+                logger.error(f"Import job {job.id} failed: {exc}", exc_info=True)
+                job.status = FAILED
+                job.error = str(exc) if isinstance(exc, ValueError) else "Import failed"
+            finally:
+                if report is not None:
+                    report.close()
+                _remove_quietly(job.upload_path)
+                job.finished_at = datetime.utcnow()
+                job.expires_at = job.finished_at + self.ttl
+                job.task = None
+
+    @staticmethod
+    async def _import_chunk(
+        session: AsyncSession,
+        job: ImportJob,
+        chunk: list[imports.ImportRow],
+        category_paths: dict[str, tuple[int, str]],
+    ) -> list[tuple[int, str, list[str]]]:
+        errors = [(row.line, row.error, row.raw) for row in chunk if row.error is not None]
+        parsed = [(row, row.values) for row in chunk if row.values is not None]
+        if parsed:
+            results = await crud.import_expenses(
+                session, [values for _, values in parsed], job.user_id, category_paths
+            )
+            errors.extend(
+                (row.line, result.error or "Invalid row", row.raw)
+                for (row, _), result in zip(parsed, results)
+                if result.status == "error"
+            )
+        return sorted(errors, key=lambda error: error[0])
+
+    @staticmethod
+    def _invalidate(user_id: int) -> None:
+        cache_invalidate(f"expenses:{user_id}")
+        cache_invalidate(f"summary:{user_id}")
+        cache_invalidate(f"categories:{user_id}")
+
+    def purge_expired(self) -> None:
+        """Forget finished jobs past their expiry and delete their error reports."""
+        now = datetime.utcnow()
+        for job_id, job in list(self._jobs.items()):
+            if job.expires_at is not None and job.expires_at <= now:
+                self._jobs.pop(job_id, None)
+                if job.error_report_path:
+                    _remove_quietly(job.error_report_path)
+
+    async def _sweep(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            self.purge_expired()
+
+    def start(self, *, sweep_interval: float = 300) -> None:
+        """Clear the spool directory and purge expired jobs periodically."""
+        self.reset_spool_dir()
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep(sweep_interval))
+
+    def reset_spool_dir(self) -> None:
+        """Remove uploads and reports left by a previous process (jobs are not persisted)."""
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+    async def shutdown(self) -> None:
+        """Cancel jobs still running; chunks already committed are kept."""
+        tasks = [job.task for job in self._jobs.values() if job.task is not None]
+        if self._sweeper is not None:
+            tasks.append(self._sweeper)
+            self._sweeper = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+manager = ImportJobManager(
+    spool_dir=config.get(
+        "IMPORT_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "expense-imports")
+    ),
+    chunk_size=config.get_int("IMPORT_CHUNK_SIZE", 1000),
+    max_bytes=config.get_int("IMPORT_MAX_BYTES", 512 * 1024 * 1024),
+    max_workers=config.get_int("IMPORT_JOB_WORKERS", 1),
+    max_jobs_per_user=config.get_int("IMPORT_JOB_MAX_PER_USER", 2),
+    ttl_seconds=config.get_int("IMPORT_JOB_TTL_SECONDS", 3600),
+)
@@ -0,0 +1,242 @@
+"""Streaming readers for expense imports.
+
+An uploaded file is first copied to a spool file, then read one chunk of rows
+at a time: CSV through :mod:`csv` over the raw byte stream, XLSX through
+openpyxl's ``read_only`` mode. Neither keeps more than the current chunk in
+memory, whatever the size of the file. Reading happens in worker threads.
+
+The expected columns are those of the CSV/XLSX export (``Catégorie``,
+``Montant``, ``Note``, ``Date``, optionally ``Devise``); the rows preceding
+the header (such as the export's summary block) are skipped.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import csv
+import os
+import tempfile
+import zipfile
+from collections.abc import Iterator
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+from fastapi import UploadFile
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+
+from .exports import STREAM_CHUNK_SIZE, _remove_quietly
+
+IMPORT_FORMATS = ("csv", "xlsx")
+
+# En-têtes reconnus (comparés en minuscules) et champ correspondant
+HEADER_ALIASES = {
+    "catégorie": "category",
+    "categorie": "category",
+    "category": "category",
+    "montant": "amount",
+    "amount": "amount",
+    "note": "note",
+    "date": "created_at",
+    "created_at": "created_at",
+    "devise": "currency",
+    "currency": "currency",
+}
+# Nombre maximal de lignes parcourues à la recherche de l'en-tête
+HEADER_SEARCH_ROWS = 50
+ERROR_REPORT_HEADERS = ["Ligne", "Erreur", "Valeurs"]
+
+
+@dataclass
+class ImportRow:
+    """One data row: its line number and either parsed values or an error."""
+
+    line: int
+    raw: list[str]
+    values: dict[str, Any] | None = None
+    error: str | None = None
+
+
+def detect_format(filename: str | None, content_type: str | None) -> str:
+    """Guess the import format from the upload's file name or content type."""
+    name = (filename or "").lower()
+    if name.endswith(".xlsx") or (content_type or "").endswith("spreadsheetml.sheet"):
+        return "xlsx"
+    if name.endswith((".csv", ".txt")) or (content_type or "").startswith("text/"):
+        return "csv"
+    raise ValueError("Unsupported import file: expected a .csv or .xlsx file")
+
+
+async def save_upload(upload: UploadFile, import_format: str, directory: str, *, max_bytes: int) -> str:
+    """Copy an uploaded file to the spool directory in chunks and return its path."""
+    os.makedirs(directory, exist_ok=True)
+    # openpyxl reconnaît le format à l'extension du fichier
+    fd, path = tempfile.mkstemp(prefix="expenses-import-", suffix=f".{import_format}", dir=directory)
+    os.close(fd)
+    size = 0
+    try:
+        with open(path, "wb") as handle:
+            while chunk := await upload.read(STREAM_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError(f"Import file exceeds {max_bytes} bytes")
+                await asyncio.to_thread(handle.write, chunk)
+    except BaseException:
+        _remove_quietly(path)
+        raise
+    return path
+
+
+def _parse_amount(value: Any) -> Any:
+    if isinstance(value, (int, float)) or value is None:
+        return value
+    text = str(value).replace("€", "").replace(" ", "").replace(" ", "").replace(",", ".")
+    try:
+        return float(text)
+    except ValueError:
+        raise ValueError(f"amount: invalid number '{value}'") from None
+
+
+def _parse_row(mapping: dict[str, int], values: tuple) -> dict[str, Any]:
+    fields: dict[str, Any] = {}
+    for field, position in mapping.items():
+        value = values[position] if position < len(values) else None
+        if isinstance(value, str):
+            value = value.strip()
+        if value not in (None, ""):
+            fields[field] = value
+
+    category_path = fields.pop("category", None)
+    if category_path is None:
+        raise ValueError("Missing category")
+    if "amount" not in fields:
+        raise ValueError("Missing amount")
+    fields["category_path"] = str(category_path)
+    fields["amount"] = _parse_amount(fields["amount"])
+    if "note" in fields:
+        fields["note"] = str(fields["note"])
+    if "currency" in fields:
+        fields["currency"] = str(fields["currency"])
+    return fields
+
+
+def _header_mapping(values: tuple) -> dict[str, int] | None:
+    mapping: dict[str, int] = {}
+    for position, value in enumerate(values):
+        field = HEADER_ALIASES.get(str(value).strip().lower()) if value is not None else None
+        if field and field not in mapping:
+            mapping[field] = position
+    if "category" in mapping and "amount" in mapping:
+        return mapping
+    return None
+
+
+def _raw_values(values: tuple) -> list[str]:
+    return [
+        value.isoformat() if isinstance(value, datetime) else ("" if value is None else str(value))
+        for value in values
+    ]
+
+
+class RowReader:
+    """Read an import file as chunks of :class:`ImportRow`.
+
+    :meth:`chunks` is a plain generator meant to be advanced from a worker
+    thread; :attr:`progress` may be read concurrently from the event loop.
+    """
+
+    def __init__(self, path: str, import_format: str, *, chunk_size: int) -> None:
+        if import_format not in IMPORT_FORMATS:
+            raise ValueError(f"Unsupported import format '{import_format}'")
+        self.path = path
+        self.import_format = import_format
+        self.chunk_size = chunk_size
+        self.progress: float | None = 0.0
+
+    def _csv_rows(self) -> Iterator[tuple[int, tuple]]:
+        total = os.path.getsize(self.path) or 1
+        consumed = 0
+
+        with open(self.path, "rb") as handle:
+
+            def lines() -> Iterator[str]:
+                # Lecture binaire : la position consommée donne la progression
+                nonlocal consumed
+                for raw_line in handle:
+                    consumed += len(raw_line)
+                    yield raw_line.decode("utf-8-sig", "replace")
+
+            first = handle.readline()
+            handle.seek(0)
+            sample = first.decode("utf-8-sig", "replace")
+            delimiter = ";" if sample.count(";") > sample.count(",") else ","
+            reader = csv.reader(lines(), delimiter=delimiter)
+            try:
+                for values in reader:
+                    self.progress = consumed / total
+                    yield reader.line_num, tuple(values)
+            except csv.Error as exc:
+                raise ValueError(f"Invalid CSV file (line {reader.line_num}): {exc}") from exc
+
+    def _xlsx_rows(self) -> Iterator[tuple[int, tuple]]:
+        try:
+            workbook = load_workbook(self.path, read_only=True, data_only=True)
+        except (InvalidFileException, zipfile.BadZipFile) as exc:
+            raise ValueError("Invalid XLSX file") from exc
+        try:
+            sheet = workbook["Détails"] if "Détails" in workbook.sheetnames else workbook.active
+            if sheet is None:
+                raise ValueError("Invalid XLSX file")
+            total = sheet.max_row
+            for line, values in enumerate(sheet.iter_rows(values_only=True), start=1):
+                self.progress = min(line / total, 1.0) if total else None
+                yield line, values
+        finally:
+            workbook.close()
+
+    def chunks(self) -> Iterator[list[ImportRow]]:
+        rows = self._csv_rows() if self.import_format == "csv" else self._xlsx_rows()
+        mapping = None
+        for line, values in rows:
+            mapping = _header_mapping(values)
+            if mapping is not None:
+                break
+            if line >= HEADER_SEARCH_ROWS:
+                break
+        if mapping is None:
+            raise ValueError("No header row with category and amount columns found")
+
+        chunk: list[ImportRow] = []
+        for line, values in rows:
+            if not any(value not in (None, "") for value in values):
+                continue
+            row = ImportRow(line=line, raw=_raw_values(values))
+            try:
+                row.values = _parse_row(mapping, values)
+            except ValueError as exc:
+                row.error = str(exc)
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+        self.progress = 1.0
+
+
+class ErrorReport:
+    """CSV report of rejected rows, appended to as chunks are imported."""
+
+    def __init__(self, directory: str) -> None:
+        fd, self.path = tempfile.mkstemp(prefix="expenses-import-errors-", suffix=".csv", dir=directory)
+        self._handle = os.fdopen(fd, "w", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._handle)
+        self._writer.writerow(ERROR_REPORT_HEADERS)
+
+    def write(self, rows: list[tuple[int, str, list[str]]]) -> None:
+        self._writer.writerows([line, error, *raw] for line, error, raw in rows)
+        self._handle.flush()
+
+    def close(self) -> None:
+        self._handle.close()
@@ -4,22 +4,25 @@ from __future__ import annotations
 
 import asyncio
 import os
+import re
 import time
 import logging
 from datetime import datetime
 from functools import wraps
-from typing import Annotated
+from typing import Annotated, Literal
 
-from fastapi import Depends, FastAPI, HTTPException, Query, Response, status, Request
+from fastapi import Depends, FastAPI, File, HTTPException, Query, Response, UploadFile, status, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
 from fastapi.middleware.gzip import GZipMiddleware
 
-from . import crud, schemas
+from . import crud, export_jobs, import_jobs, imports, schemas
 from .database import get_session, init_db
 from .auth import create_access_token, get_current_user, verify_password, ACCESS_TOKEN_EXPIRE_MINUTES
 from .logging_config import log_security_event
 from .cache import get as cache_get, set as cache_set, invalidate as cache_invalidate
+from .export_cache import export_cache, export_key
+from .note_suggest import MAX_SUGGESTIONS, note_index
 from .rate_limit import check_rate_limit
 from .exceptions import (
     integrity_error_handler,
@@ -91,7 +94,7 @@ app = FastAPI(
     * **Categories**: Hierarchical category management with parent-child relationships
     * **Expenses**: Track expenses with amounts, notes, and categorization
     * **Summaries**: Monthly summaries with totals by category and period
-    * **Export**: Export expenses to CSV or XLSX formats
+    * **Export**: Export expenses to CSV, XLSX, NDJSON, Arrow or Parquet formats
     * **Internationalization**: Multi-language support (FR, EN, RU)
     
     ## Security
@@ -130,8 +133,24 @@ app.add_exception_handler(crud.CategoryNameConflictError, crud_error_handler)
 app.add_exception_handler(crud.UserAlreadyExistsError, crud_error_handler)
 app.add_exception_handler(Exception, general_exception_handler)
 
+class DownloadAwareGZipMiddleware(GZipMiddleware):
+    """GZip responses, except export job downloads.
+
+    Their ``Range`` requests address the bytes of the stored file, which a
+    recompressed body would not match.
+    """
+
+    UNCOMPRESSED_PATHS = re.compile(r"/expenses/export/jobs/[^/]+/download")
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "http" and self.UNCOMPRESSED_PATHS.fullmatch(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
 # Compression des réponses pour réduire la bande passante
-app.add_middleware(GZipMiddleware, minimum_size=500)
+app.add_middleware(DownloadAwareGZipMiddleware, minimum_size=500)
 
 # Configuration CORS sécurisée
 app.add_middleware(
@@ -223,6 +242,10 @@ def rate_limit(requests_per_minute: int):
 @app.on_event("startup")
 async def on_startup() -> None:
     await init_db()
+    export_jobs.manager.start()
+    import_jobs.manager.start()
+    export_cache.clear()
+    note_index.clear()
     # Seed translations on startup (only if they don't exist yet)
     # Cela évite les insertions répétées à chaque redémarrage
     from .database import AsyncSessionLocal
@@ -259,6 +282,12 @@ async def on_startup() -> None:
         await session.close()
 
 
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    await export_jobs.manager.shutdown()
+    await import_jobs.manager.shutdown()
+
+
 # Routes d'authentification
 # Logger pour les endpoints critiques
 logger = logging.getLogger(__name__)
@@ -379,6 +408,8 @@ async def create_category(
     except crud.CategoryNameConflictError as exc:
         logger.warning(f"Category creation failed: {exc} for user_id={current_user.id}")
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc)) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
     except Exception as exc:
         logger.error(f"Unexpected error creating category: {exc}", exc_info=True)
         raise HTTPException(
@@ -450,6 +481,8 @@ async def update_category(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
     cache_invalidate(f"categories:{current_user.id}")
     cache_invalidate(f"summary:{current_user.id}")
+    # Les dépenses embarquent le chemin de leur catégorie
+    cache_invalidate(f"expenses:{current_user.id}")
     return category
 
 
@@ -466,6 +499,8 @@ async def delete_category(
     log_security_event("CATEGORY_DELETED", current_user.id, {"category_id": category_id})
     cache_invalidate(f"categories:{current_user.id}")
     cache_invalidate(f"summary:{current_user.id}")
+    # Les dépenses embarquent le chemin de leur catégorie
+    cache_invalidate(f"expenses:{current_user.id}")
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
@@ -476,13 +511,42 @@ async def create_expense(
     current_user = Depends(get_current_user),
     session=Depends(get_session)
 ):
-    expense = await crud.create_expense(session, payload, current_user.id)
+    try:
+        expense = await crud.create_expense(session, payload, current_user.id)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
     cache_invalidate(f"expenses:{current_user.id}")
     cache_invalidate(f"summary:{current_user.id}")
     return expense
 
 
+@app.post("/expenses/bulk", response_model=schemas.ExpenseBulkResult)
+async def create_expenses_bulk(
+    request: Request,
+    payload: schemas.ExpenseBulkCreate,
+    current_user = Depends(get_current_user),
+    session=Depends(get_session)
+):
+    """Create up to 10,000 expenses at once; each item gets its own result."""
+    items = await crud.create_expenses_bulk(session, payload.items, current_user.id)
+    created = sum(1 for item in items if item.status == "created")
+    if created:
+        log_security_event("EXPENSES_BULK_CREATED", current_user.id, {"count": created})
+        cache_invalidate(f"expenses:{current_user.id}")
+        cache_invalidate(f"summary:{current_user.id}")
+    return schemas.ExpenseBulkResult(created=created, failed=len(items) - created, items=items)
+
+
 DateQuery = Annotated[datetime | None, Query(description="Date au format ISO 8601")]
+IncludeDescendantsQuery = Annotated[
+    bool, Query(description="Inclure les sous-catégories de category_id")
+]
+IncludeTotalQuery = Annotated[
+    bool, Query(description="Calculer le nombre total de résultats (désactiver pour une pagination plus rapide)")
+]
+BaseCurrencyQuery = Annotated[
+    str | None, Query(min_length=3, max_length=3, description="Devise de conversion des totaux")
+]
 
 
 @app.get("/categories/{category_id}/expenses", response_model=schemas.PaginatedExpenses)
@@ -493,6 +557,7 @@ async def list_expenses(
     end_date: DateQuery = None,
     page: int = Query(1, ge=1),
     per_page: int = Query(50, ge=1, le=200),
+    include_total: IncludeTotalQuery = True,
     current_user = Depends(get_current_user),
     session=Depends(get_session),
 ):
@@ -504,6 +569,7 @@ async def list_expenses(
         end_date=end_date,
         page=page,
         per_page=per_page,
+        include_total=include_total,
     )
     return schemas.PaginatedExpenses(
         items=expenses,
@@ -520,28 +586,53 @@ async def list_expenses(
 @app.get("/expenses", response_model=schemas.PaginatedExpenses)
 async def search_expenses(
     request: Request,
-    category_id: Annotated[int | None, Query()] = None,
+    q: Annotated[
+        str | None, Query(max_length=200, description="Mots recherchés dans les notes (préfixes, tous requis)")
+    ] = None,
+    category_id: Annotated[
+        list[int] | None, Query(max_length=100, description="Une ou plusieurs catégories (paramètre répété)")
+    ] = None,
+    include_descendants: IncludeDescendantsQuery = False,
     start_date: DateQuery = None,
     end_date: DateQuery = None,
+    min_amount: Annotated[float | None, Query(ge=0)] = None,
+    max_amount: Annotated[float | None, Query(ge=0)] = None,
+    sort: Annotated[
+        schemas.ExpenseSort | None, Query(description="Par défaut : pertinence avec q, sinon les plus récentes")
+    ] = None,
     page: int = Query(1, ge=1),
     per_page: int = Query(50, ge=1, le=200),
+    include_total: IncludeTotalQuery = True,
     current_user = Depends(get_current_user),
     session=Depends(get_session),
 ):
-    cache_key = f"expenses:{current_user.id}:{category_id}:{start_date}:{end_date}:{page}:{per_page}"
+    category_ids = sorted(set(category_id or []))
+    cache_key = (
+        f"expenses:{current_user.id}:{q}:{category_ids}:{include_descendants}:{start_date}:{end_date}:"
+        f"{min_amount}:{max_amount}:{sort}:{page}:{per_page}:{include_total}"
+    )
     cached = cache_get(cache_key)
     if cached:
         return schemas.PaginatedExpenses.model_validate(cached)
 
-    expenses, total, has_next, has_previous = await crud.search_expenses(
-        session,
-        current_user.id,
-        category_id=category_id,
-        start_date=start_date,
-        end_date=end_date,
-        page=page,
-        per_page=per_page,
-    )
+    try:
+        expenses, total, has_next, has_previous = await crud.search_expenses(
+            session,
+            current_user.id,
+            q=q,
+            category_id=category_ids,
+            include_descendants=include_descendants,
+            start_date=start_date,
+            end_date=end_date,
+            min_amount=min_amount,
+            max_amount=max_amount,
+            sort=sort,
+            page=page,
+            per_page=per_page,
+            include_total=include_total,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
     response_data = schemas.PaginatedExpenses(
         items=expenses,
         meta=schemas.PaginationMeta(
@@ -556,6 +647,72 @@ async def search_expenses(
     return response_data
 
 
+@app.get("/expenses/notes/suggest", response_model=schemas.NoteSuggestions)
+async def suggest_notes(
+    request: Request,
+    prefix: Annotated[str, Query(max_length=200, description="Début de la note, sans distinction de casse")] = "",
+    limit: Annotated[int, Query(ge=1, le=MAX_SUGGESTIONS)] = 10,
+    current_user = Depends(get_current_user),
+    session=Depends(get_session),
+):
+    """Autocomplete expense notes from the user's most frequent ones."""
+    suggestions = await crud.suggest_notes(session, current_user.id, prefix, limit)
+    return schemas.NoteSuggestions(prefix=prefix, suggestions=suggestions)
+
+
+@app.delete("/expenses", response_model=schemas.ExpenseBatchResult)
+async def delete_expenses(
+    request: Request,
+    category_id: Annotated[int | None, Query()] = None,
+    start_date: DateQuery = None,
+    end_date: DateQuery = None,
+    current_user = Depends(get_current_user),
+    session=Depends(get_session),
+):
+    """Delete every expense matching the filters (at least one is required)."""
+    try:
+        affected = await crud.delete_expenses(
+            session, current_user.id, category_id=category_id, start_date=start_date, end_date=end_date
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+    if affected:
+        log_security_event("EXPENSES_BULK_DELETED", current_user.id, {"count": affected})
+        cache_invalidate(f"expenses:{current_user.id}")
+        cache_invalidate(f"summary:{current_user.id}")
+    return schemas.ExpenseBatchResult(affected=affected)
+
+
+@app.post("/expenses/recategorize", response_model=schemas.ExpenseBatchResult)
+async def recategorize_expenses(
+    request: Request,
+    payload: schemas.ExpenseRecategorize,
+    current_user = Depends(get_current_user),
+    session=Depends(get_session),
+):
+    """Move the expenses of a category and/or a date range to another category."""
+    try:
+        affected = await crud.recategorize_expenses(
+            session,
+            current_user.id,
+            payload.to_category_id,
+            from_category_id=payload.from_category_id,
+            start_date=payload.start_date,
+            end_date=payload.end_date,
+        )
+    except ValueError as exc:
+        detail = str(exc)
+        code = status.HTTP_404_NOT_FOUND if detail == "Category not found" else status.HTTP_400_BAD_REQUEST
+        raise HTTPException(status_code=code, detail=detail) from exc
+    if affected:
+        log_security_event(
+            "EXPENSES_RECATEGORIZED", current_user.id, {"count": affected, "to_category_id": payload.to_category_id}
+        )
+        cache_invalidate(f"expenses:{current_user.id}")
+        cache_invalidate(f"summary:{current_user.id}")
+    return schemas.ExpenseBatchResult(affected=affected)
+
+
 @app.patch("/expenses/{expense_id}", response_model=schemas.ExpenseRead)
 async def update_expense(
     request: Request,
@@ -598,10 +755,14 @@ async def get_summary(
     start_date: DateQuery = None,
     end_date: DateQuery = None,
     category_id: Annotated[int | None, Query()] = None,
+    include_descendants: IncludeDescendantsQuery = False,
+    base_currency: BaseCurrencyQuery = None,
     current_user = Depends(get_current_user),
     session=Depends(get_session),
 ):
-    cache_key = f"summary:{current_user.id}:{start_date}:{end_date}:{category_id}"
+    cache_key = (
+        f"summary:{current_user.id}:{start_date}:{end_date}:{category_id}:{include_descendants}:{base_currency}"
+    )
     cached = cache_get(cache_key)
     if cached:
         return cached
@@ -613,6 +774,38 @@ async def get_summary(
             start_date=start_date,
             end_date=end_date,
             category_id=category_id,
+            include_descendants=include_descendants,
+            base_currency=base_currency,
+        )
+        cache_set(cache_key, summary, ttl=60)
+        return summary
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+
+
+@app.get("/summary/tree", response_model=schemas.CategorySummaryTree)
+async def get_summary_tree(
+    request: Request,
+    start_date: DateQuery = None,
+    end_date: DateQuery = None,
+    category_id: Annotated[int | None, Query()] = None,
+    base_currency: BaseCurrencyQuery = None,
+    current_user = Depends(get_current_user),
+    session=Depends(get_session),
+):
+    cache_key = f"summary:{current_user.id}:tree:{start_date}:{end_date}:{category_id}:{base_currency}"
+    cached = cache_get(cache_key)
+    if cached:
+        return cached
+
+    try:
+        summary = await crud.category_tree_totals(
+            session,
+            current_user.id,
+            start_date=start_date,
+            end_date=end_date,
+            category_id=category_id,
+            base_currency=base_currency,
         )
         cache_set(cache_key, summary, ttl=60)
         return summary
@@ -620,6 +813,69 @@ async def get_summary(
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
 
 
+@app.get("/summary/timeseries", response_model=schemas.SummaryTimeseries)
+async def get_summary_timeseries(
+    request: Request,
+    bucket: Annotated[Literal["day", "week", "month"], Query()] = "month",
+    start_date: DateQuery = None,
+    end_date: DateQuery = None,
+    category_id: Annotated[int | None, Query()] = None,
+    max_points: Annotated[int | None, Query(ge=3, le=10_000)] = None,
+    base_currency: BaseCurrencyQuery = None,
+    current_user = Depends(get_current_user),
+    session=Depends(get_session),
+):
+    cache_key = (
+        f"summary:{current_user.id}:timeseries:{bucket}:{start_date}:{end_date}:{category_id}:{max_points}"
+        f":{base_currency}"
+    )
+    cached = cache_get(cache_key)
+    if cached:
+        return cached
+
+    try:
+        series = await crud.expense_timeseries(
+            session,
+            current_user.id,
+            bucket=bucket,
+            start_date=start_date,
+            end_date=end_date,
+            category_id=category_id,
+            max_points=max_points,
+            base_currency=base_currency,
+        )
+        cache_set(cache_key, series, ttl=60)
+        return series
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+
+
+@app.post("/summary/compare", response_model=schemas.SummaryComparison)
+async def compare_summary_periods(
+    request: Request,
+    payload: schemas.SummaryComparisonRequest,
+    current_user = Depends(get_current_user),
+    session=Depends(get_session),
+):
+    cache_key = f"summary:{current_user.id}:compare:{payload.model_dump_json()}"
+    cached = cache_get(cache_key)
+    if cached:
+        return cached
+
+    try:
+        comparison = await crud.compare_periods(
+            session,
+            current_user.id,
+            payload.periods,
+            category_id=payload.category_id,
+            base_currency=payload.base_currency,
+        )
+        cache_set(cache_key, comparison, ttl=60)
+        return comparison
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+
+
 def get_cors_headers(request: Request) -> dict[str, str]:
     """Get CORS headers for a request."""
     origin = request.headers.get("origin")
@@ -643,26 +899,61 @@ def get_cors_headers(request: Request) -> dict[str, str]:
 @app.get("/expenses/export")
 async def export_expenses(
     request: Request,
-    format: Annotated[str, Query(pattern="^(csv|xlsx)$", description="csv ou xlsx")] = "csv",
+    format: Annotated[
+        str,
+        Query(pattern="^(csv|xlsx|ndjson|arrow|parquet)$", description="csv, xlsx, ndjson, arrow ou parquet"),
+    ] = "csv",
     category_id: Annotated[int | None, Query()] = None,
+    include_descendants: IncludeDescendantsQuery = False,
     start_date: DateQuery = None,
     end_date: DateQuery = None,
     current_user = Depends(get_current_user),
     session=Depends(get_session),
 ):
+    key = export_key(
+        current_user.id,
+        export_format=format,
+        start_date=start_date,
+        end_date=end_date,
+        category_id=category_id,
+        include_descendants=include_descendants,
+    )
+    etag = f'"{key}"'
+    cors_headers = get_cors_headers(request)
+    cache_headers = {
+        **cors_headers,
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in {tag.strip() for tag in if_none_match.split(",")}:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+
+    headers = {
+        **cache_headers,
+        "Content-Disposition": f'attachment; filename="expenses.{format}"',
+        "Access-Control-Expose-Headers": "Content-Disposition, ETag",
+    }
+
+    # Même utilisateur, mêmes filtres, aucune écriture depuis : fichier déjà produit
+    cached_path = export_cache.get(key)
+    if cached_path is not None:
+        log_security_event("EXPENSES_EXPORTED", current_user.id, {"format": format, "cached": True})
+        return FileResponse(cached_path, media_type=crud.EXPORT_MEDIA_TYPES[format], headers=headers)
+
     try:
-        content, media_type, filename = await crud.export_expenses(
+        chunks, media_type, _ = await crud.export_expenses(
             session,
             current_user.id,
             start_date=start_date,
             end_date=end_date,
             category_id=category_id,
+            include_descendants=include_descendants,
             export_format=format,  # type: ignore[arg-type]
         )
         log_security_event("EXPENSES_EXPORTED", current_user.id, {"format": format})
     except ValueError as exc:
         # Ajouter headers CORS même en cas d'erreur
-        cors_headers = get_cors_headers(request)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(exc),
@@ -673,22 +964,188 @@ async def export_expenses(
         import logging
         logger = logging.getLogger(__name__)
         logger.error(f"Error exporting expenses: {exc}", exc_info=True)
-        cors_headers = get_cors_headers(request)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="An error occurred while exporting expenses",
             headers=cors_headers
         ) from exc
 
-    # Ajouter headers CORS pour que le téléchargement fonctionne
-    cors_headers = get_cors_headers(request)
+    # Le fichier est produit au fil de la lecture du curseur (la session reste
+    # ouverte jusqu'à la fin de la réponse) et mis en cache une fois complet
+    return StreamingResponse(
+        export_cache.store(key, f".{format}", chunks), media_type=media_type, headers=headers
+    )
+
+
+def _export_job_response(job: export_jobs.ExportJob) -> schemas.ExportJobRead:
+    return schemas.ExportJobRead(
+        id=job.id,
+        status=job.status,
+        format=job.export_format,
+        progress=job.progress,
+        rows_written=job.rows_written,
+        rows_total=job.rows_total,
+        size=job.size,
+        error=job.error,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+        expires_at=job.expires_at,
+        download_url=(
+            f"/expenses/export/jobs/{job.id}/download" if job.status == export_jobs.DONE else None
+        ),
+    )
+
+
+@app.post(
+    "/expenses/export/jobs",
+    response_model=schemas.ExportJobRead,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def create_export_job(
+    request: Request,
+    payload: schemas.ExportJobCreate,
+    current_user = Depends(get_current_user),
+):
+    """Queue an export in the background; an identical job in progress is reused."""
+    try:
+        job = export_jobs.manager.submit(
+            current_user.id,
+            export_format=payload.format,
+            start_date=payload.start_date,
+            end_date=payload.end_date,
+            category_id=payload.category_id,
+            include_descendants=payload.include_descendants,
+        )
+    except export_jobs.ExportJobLimitError as exc:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(exc)) from exc
+    log_security_event("EXPENSES_EXPORT_QUEUED", current_user.id, {"format": payload.format, "job_id": job.id})
+    return _export_job_response(job)
+
+
+@app.get("/expenses/export/jobs/{job_id}", response_model=schemas.ExportJobRead)
+async def get_export_job(
+    request: Request,
+    job_id: str,
+    current_user = Depends(get_current_user),
+):
+    job = export_jobs.manager.get(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Export job not found")
+    return _export_job_response(job)
+
+
+@app.get("/expenses/export/jobs/{job_id}/download")
+async def download_export_job(
+    request: Request,
+    job_id: str,
+    current_user = Depends(get_current_user),
+):
+    """Serve a finished export; ``Range`` requests are supported to resume downloads."""
+    job = export_jobs.manager.get(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Export job not found")
+    if job.status != export_jobs.DONE:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Export job is {job.status}")
+    if job.path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Export file not found")
+
     headers = {
-        **cors_headers,
-        "Content-Disposition": f'attachment; filename="{filename}"',
-        "Access-Control-Expose-Headers": "Content-Disposition",
+        **get_cors_headers(request),
+        "Access-Control-Expose-Headers": "Content-Disposition, Content-Range, Accept-Ranges",
     }
+    return FileResponse(job.path, media_type=job.media_type, filename=job.filename, headers=headers)
+
+
+def _import_job_response(job: import_jobs.ImportJob) -> schemas.ImportJobRead:
+    return schemas.ImportJobRead(
+        id=job.id,
+        status=job.status,
+        format=job.import_format,
+        filename=job.filename,
+        progress=job.progress,
+        rows_processed=job.rows_processed,
+        rows_imported=job.rows_imported,
+        rows_failed=job.rows_failed,
+        categories_created=job.categories_created,
+        error=job.error,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+        expires_at=job.expires_at,
+        errors_url=(
+            f"/expenses/import/jobs/{job.id}/errors"
+            if not job.in_flight and job.error_report_path
+            else None
+        ),
+    )
 
-    return Response(content=content, media_type=media_type, headers=headers)
+
+@app.post(
+    "/expenses/import",
+    response_model=schemas.ImportJobRead,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def import_expenses(
+    request: Request,
+    file: Annotated[UploadFile, File(description="CSV or XLSX file with the export's columns")],
+    format: Annotated[str | None, Query(pattern="^(csv|xlsx)$")] = None,
+    current_user = Depends(get_current_user),
+):
+    """Spool an uploaded CSV/XLSX file and import it in the background.
+
+    Category paths (``Parent / Child``) are matched case-insensitively and
+    missing categories are created. Poll the returned job for progress.
+    """
+    manager = import_jobs.manager
+    try:
+        manager.check_limit(current_user.id)
+        import_format = format or imports.detect_format(file.filename, file.content_type)
+        upload_path = await imports.save_upload(
+            file, import_format, manager.spool_dir, max_bytes=manager.max_bytes
+        )
+    except import_jobs.ImportJobLimitError as exc:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(exc)) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+    finally:
+        await file.close()
+
+    job = manager.submit(
+        current_user.id, upload_path=upload_path, import_format=import_format, filename=file.filename
+    )
+    log_security_event("EXPENSES_IMPORT_QUEUED", current_user.id, {"format": import_format, "job_id": job.id})
+    return _import_job_response(job)
+
+
+@app.get("/expenses/import/jobs/{job_id}", response_model=schemas.ImportJobRead)
+async def get_import_job(
+    request: Request,
+    job_id: str,
+    current_user = Depends(get_current_user),
+):
+    job = import_jobs.manager.get(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Import job not found")
+    return _import_job_response(job)
+
+
+@app.get("/expenses/import/jobs/{job_id}/errors")
+async def download_import_errors(
+    request: Request,
+    job_id: str,
+    current_user = Depends(get_current_user),
+):
+    """Serve the CSV report of the rows rejected by a finished import."""
+    job = import_jobs.manager.get(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Import job not found")
+    if job.in_flight or not job.error_report_path:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Import job is {job.status}")
+    return FileResponse(
+        job.error_report_path,
+        media_type="text/csv",
+        filename=f"import_errors_{job.id}.csv",
+        headers=get_cors_headers(request),
+    )
 
 
 # ============================================================================
@@ -2,9 +2,9 @@
 
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import date, datetime
 
-from sqlalchemy import Boolean, DateTime, ForeignKey, Integer, Numeric, String, Text, func, Index
+from sqlalchemy import DDL, Boolean, Date, DateTime, ForeignKey, Integer, Numeric, String, Text, event, func, Index, literal_column
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .database import Base
@@ -47,6 +47,10 @@ class Category(Base):
         ForeignKey("categories.id", ondelete="SET NULL"), nullable=True
     )
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+    # Chemin complet ("Parent / Enfant") et profondeur, maintenus à l'écriture
+    # pour que les lectures n'aient jamais à reconstruire l'arborescence
+    full_path: Mapped[str] = mapped_column(Text, nullable=False, default="")
+    depth: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
 
     expenses: Mapped[list[Expense]] = relationship(
         "Expense", back_populates="category", cascade="all, delete-orphan", lazy="selectin"
@@ -68,29 +72,37 @@ class Category(Base):
 
     __table_args__ = (
         Index('idx_categories_user_parent_name', 'user_id', 'parent_id', 'name'),
+        Index('idx_categories_user_full_path', 'user_id', 'full_path'),
     )
 
-    @property
-    def full_path(self) -> str:
-        """Return the category name prefixed with its ancestors."""
-        parts: list[str] = []
-        current: Category | None = self
-        visited: set[int] = set()
-        while current is not None and current.id not in visited:
-            visited.add(current.id)
-            parts.append(current.name)
-            current = current.parent
-        return " / ".join(reversed(parts)) if parts else self.name
 
-    @full_path.setter
-    def full_path(self, value: str) -> None:  # noqa: D401,D417 - placeholder setter for serialization
-        # SQLAlchemy instantiates models without allowing attribute assignment on @property attributes.
-        # Providing a no-op setter keeps ORM happy when we assign full_path dynamically.
-        self.__dict__["_full_path_override"] = value
+# Clé d'unicité des noms frères, insensible à la casse. coalesce() ramène les
+# racines (parent_id NULL, jamais égal à lui-même) sur une même valeur ; la même
+# expression sert de cible aux INSERT ... ON CONFLICT
+CATEGORY_NAME_KEY = (
+    Category.user_id,
+    func.coalesce(Category.parent_id, literal_column("0")),
+    func.lower(Category.name),
+)
+Index('uq_categories_user_parent_lower_name', *CATEGORY_NAME_KEY, unique=True)
 
-    @full_path.deleter
-    def full_path(self) -> None:  # type: ignore[override]
-        self.__dict__.pop("_full_path_override", None)
+
+class CategoryClosure(Base):
+    """Ancestor/descendant pairs of the category tree (closure table)."""
+
+    __tablename__ = "category_closure"
+
+    ancestor_id: Mapped[int] = mapped_column(
+        ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True
+    )
+    descendant_id: Mapped[int] = mapped_column(
+        ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True
+    )
+    depth: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index('idx_category_closure_descendant_depth', 'descendant_id', 'depth'),
+    )
 
 
 class Expense(Base):
@@ -116,7 +128,90 @@ class Expense(Base):
     __table_args__ = (
         Index('idx_expenses_user_created', 'user_id', 'created_at'),
         Index('idx_expenses_category_user', 'category_id', 'user_id'),
+        # Filtres de GET /expenses : catégories (plus dates) et montants (plus tri)
+        Index('idx_expenses_user_category_created', 'user_id', 'category_id', 'created_at'),
+        Index('idx_expenses_user_amount', 'user_id', 'amount'),
+    )
+
+
+# Recherche plein texte sur les notes. SQLite : table FTS5 à contenu externe
+# (seul l'index inversé est stocké) tenue à jour par des triggers ;
+# PostgreSQL : index GIN sur l'expression tsvector, sans colonne ni trigger.
+# Les accents sont ignorés des deux côtés : remove_diacritics pour FTS5,
+# unaccent pour PostgreSQL (via une fonction IMMUTABLE, indexable).
+EXPENSE_NOTES_FTS = "expenses_fts"
+EXPENSE_NOTES_UNACCENT = "expenses_unaccent"
+EXPENSE_NOTES_TSVECTOR = f"to_tsvector('simple'::regconfig, {EXPENSE_NOTES_UNACCENT}(COALESCE(note, ''::text)))"
+POSTGRESQL_UNACCENT_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    f"""
+    CREATE OR REPLACE FUNCTION {EXPENSE_NOTES_UNACCENT}(text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+    """,
+)
+_SQLITE_NOTES_FTS_DDL = (
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {EXPENSE_NOTES_FTS} USING fts5(
+        note, content='expenses', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS expenses_fts_insert AFTER INSERT ON expenses
+    WHEN new.note IS NOT NULL BEGIN
+        INSERT INTO {EXPENSE_NOTES_FTS}(rowid, note) VALUES (new.id, new.note);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS expenses_fts_delete AFTER DELETE ON expenses
+    WHEN old.note IS NOT NULL BEGIN
+        INSERT INTO {EXPENSE_NOTES_FTS}({EXPENSE_NOTES_FTS}, rowid, note) VALUES ('delete', old.id, old.note);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS expenses_fts_update AFTER UPDATE OF note ON expenses BEGIN
+        INSERT INTO {EXPENSE_NOTES_FTS}({EXPENSE_NOTES_FTS}, rowid, note)
+            SELECT 'delete', old.id, old.note WHERE old.note IS NOT NULL;
+        INSERT INTO {EXPENSE_NOTES_FTS}(rowid, note) SELECT new.id, new.note WHERE new.note IS NOT NULL;
+    END
+    """,
+)
+for _statement in _SQLITE_NOTES_FTS_DDL:
+    event.listen(Expense.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+event.listen(
+    Expense.__table__,
+    "before_drop",
+    DDL(f"DROP TABLE IF EXISTS {EXPENSE_NOTES_FTS}").execute_if(dialect="sqlite"),
+)
+for _statement in POSTGRESQL_UNACCENT_DDL:
+    event.listen(Expense.__table__, "after_create", DDL(_statement).execute_if(dialect="postgresql"))
+event.listen(
+    Expense.__table__,
+    "after_create",
+    DDL(
+        f"CREATE INDEX IF NOT EXISTS idx_expenses_note_fts ON expenses USING gin (({EXPENSE_NOTES_TSVECTOR}))"
+    ).execute_if(dialect="postgresql"),
+)
+event.listen(
+    Expense.__table__,
+    "after_drop",
+    DDL(f"DROP FUNCTION IF EXISTS {EXPENSE_NOTES_UNACCENT}(text)").execute_if(dialect="postgresql"),
+)
+
+
+class ExpenseMonthlyRollup(Base):
+    """Monthly totals per user, category and currency, kept in sync with expenses."""
+
+    __tablename__ = "expense_monthly_rollups"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    month: Mapped[date] = mapped_column(Date, primary_key=True)  # premier jour du mois
+    category_id: Mapped[int] = mapped_column(
+        ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True
     )
+    currency: Mapped[str] = mapped_column(String(3), primary_key=True)
+    total: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
 
 
 class Translation(Base):
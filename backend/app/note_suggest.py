@@ -0,0 +1,166 @@
+"""In-memory note autocomplete.
+
+Each user's distinct notes are kept as a sorted array of normalized keys
+(case-folded, whitespace collapsed) with their frequency: the notes starting
+with a prefix are a contiguous slice found by bisection, and the most
+frequent of them are picked with a bounded heap (memoized for prefixes
+matching many notes, such as a single letter). The array of a user is
+built lazily from one grouped query, updated incrementally once expense
+writes are committed, and bounded by an LRU over users.
+"""
+
+from __future__ import annotations
+
+import heapq
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from collections.abc import Iterable
+
+from .config import config
+
+# Borne supérieure des clés commençant par un préfixe donné
+_PREFIX_END = "\U0010ffff"
+MAX_SUGGESTIONS = 50
+# Au-delà de ce nombre de notes, le classement d'un préfixe est mémorisé et
+# tenu à jour par les écritures
+_TOP_CACHE_MIN_KEYS = 256
+
+
+def normalize(note: str) -> str:
+    return " ".join(note.split()).casefold()
+
+
+class UserNotes:
+    """Frequency-ranked prefix index of one user's notes."""
+
+    def __init__(self, counts: Iterable[tuple[str, int]]) -> None:
+        # clé normalisée -> {graphie: occurrences}
+        self._spellings: dict[str, dict[str, int]] = {}
+        self._totals: dict[str, int] = {}
+        # Meilleures clés des préfixes larges, déjà classées
+        self._top: dict[str, list[str]] = {}
+        for note, count in counts:
+            self._add(note, count)
+        self._keys = sorted(self._totals)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _add(self, note: str, count: int) -> str | None:
+        """Apply a count change; return the key if it appeared or vanished."""
+        key = normalize(note)
+        if not key:
+            return None
+        spellings = self._spellings.setdefault(key, {})
+        spellings[note] = spellings.get(note, 0) + count
+        if spellings[note] <= 0:
+            del spellings[note]
+        if not spellings:
+            del self._spellings[key]
+            self._totals.pop(key, None)
+            return key
+        created = key not in self._totals
+        self._totals[key] = sum(spellings.values())
+        return key if created else None
+
+    def _rank(self, key: str) -> tuple[int, int]:
+        # Plus fréquente d'abord ; à fréquence égale, la plus courte
+        return self._totals[key], -len(key)
+
+    def apply(self, note: str, count: int) -> None:
+        key = normalize(note)
+        if not key:
+            return
+        changed = self._add(note, count)
+        for length in range(len(key) + 1):
+            self._update_top(key[:length], key, count)
+        if changed is None:
+            return
+        position = bisect_left(self._keys, key)
+        present = position < len(self._keys) and self._keys[position] == key
+        if key in self._totals and not present:
+            insort(self._keys, key)
+        elif key not in self._totals and present:
+            del self._keys[position]
+
+    def _update_top(self, prefix: str, key: str, count: int) -> None:
+        best = self._top.get(prefix)
+        if best is None:
+            return
+        if count < 0:
+            # Une note du classement qui recule peut céder sa place à une note
+            # absente du classement : il est recalculé à la prochaine lecture
+            if key in best:
+                del self._top[prefix]
+            return
+        if key in best:
+            best.remove(key)
+        rank = self._rank(key)
+        position = next((index for index, other in enumerate(best) if self._rank(other) < rank), len(best))
+        best.insert(position, key)
+        del best[MAX_SUGGESTIONS:]
+
+    def _display(self, key: str) -> str:
+        spellings = self._spellings[key]
+        return max(spellings, key=spellings.__getitem__)
+
+    def suggest(self, prefix: str, limit: int) -> list[str]:
+        """The ``limit`` (at most :data:`MAX_SUGGESTIONS`) most frequent notes starting with ``prefix``."""
+        prefix = normalize(prefix)
+        best = self._top.get(prefix)
+        if best is None:
+            low = bisect_left(self._keys, prefix)
+            high = bisect_left(self._keys, prefix + _PREFIX_END, low)
+            best = heapq.nlargest(MAX_SUGGESTIONS, self._keys[low:high], key=self._rank)
+            if high - low > _TOP_CACHE_MIN_KEYS:
+                self._top[prefix] = best
+        return [self._display(key) for key in best[:limit]]
+
+
+class NoteSuggestIndex:
+    """Per-user :class:`UserNotes`, least recently used users evicted first."""
+
+    def __init__(self, *, max_users: int) -> None:
+        self.max_users = max_users
+        self._users: OrderedDict[int, UserNotes] = OrderedDict()
+        # Incrémenté à chaque écriture validée : une construction commencée
+        # avant n'est pas conservée
+        self._generations: dict[int, int] = {}
+
+    def get(self, user_id: int) -> UserNotes | None:
+        notes = self._users.get(user_id)
+        if notes is not None:
+            self._users.move_to_end(user_id)
+        return notes
+
+    def generation(self, user_id: int) -> int:
+        return self._generations.get(user_id, 0)
+
+    def store(self, user_id: int, notes: UserNotes, generation: int) -> None:
+        """Keep a freshly built index unless a write was committed meanwhile."""
+        if generation != self.generation(user_id):
+            return
+        self._users[user_id] = notes
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    def apply(self, user_id: int, changes: Iterable[tuple[str, int]]) -> None:
+        """Apply committed ``(note, count delta)`` changes."""
+        self._generations[user_id] = self.generation(user_id) + 1
+        notes = self._users.get(user_id)
+        if notes is not None:
+            for note, count in changes:
+                notes.apply(note, count)
+
+    def forget(self, user_id: int) -> None:
+        """Drop a user's index after a bulk change; it is rebuilt on next use."""
+        self._generations[user_id] = self.generation(user_id) + 1
+        self._users.pop(user_id, None)
+
+    def clear(self) -> None:
+        for user_id in list(self._users):
+            self.forget(user_id)
+
+
+note_index = NoteSuggestIndex(max_users=config.get_int("NOTE_SUGGEST_MAX_USERS", 1000))
@@ -0,0 +1,324 @@
+"""Monthly expense rollups maintained alongside writes to ``expenses``.
+
+Each row of ``expense_monthly_rollups`` holds the sum and count of a user's
+expenses for one (category, month, currency). The rollup is updated in the
+same transaction as the expense write, so summaries can read whole months
+from it and only touch raw rows for the partial days at the edges of a range.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from typing import Any
+
+from sqlalchemy import ColumnElement, Date, cast, delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+
+
+@dataclass(frozen=True)
+class RollupMismatch:
+    """Difference between the rollup table and the raw expenses for one key."""
+
+    user_id: int
+    category_id: int
+    month: date
+    currency: str
+    rollup_total: float
+    rollup_count: int
+    actual_total: float
+    actual_count: int
+
+
+def as_utc(value: datetime) -> datetime:
+    """Convert an aware datetime to UTC; naive datetimes are already taken as UTC."""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc)
+    return value
+
+
+def month_start(value: datetime) -> date:
+    """Return the first day of the month of ``value`` (UTC for aware datetimes)."""
+    value = as_utc(value)
+    return date(value.year, value.month, 1)
+
+
+def month_bucket(dialect_name: str, column):
+    """SQL expression truncating a timestamp column to the first day of its month."""
+    if dialect_name == "postgresql":
+        return cast(func.date_trunc("month", column), Date)
+    return func.date(column, "start of month")
+
+
+def _insert(dialect_name: str):
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+# Clés de l'agrégat par instruction INSERT multi-lignes (6 paramètres par ligne)
+_UPSERT_CHUNK = 1000
+
+
+async def apply_deltas(
+    session: AsyncSession,
+    user_id: int,
+    deltas: dict[tuple[int, date, str], tuple[float, int]],
+) -> None:
+    """Add ``(total, count)`` deltas per ``(category_id, month, currency)`` key.
+
+    All keys go through one multi-row ``INSERT ... ON CONFLICT DO UPDATE``
+    (split only beyond :data:`_UPSERT_CHUNK` keys); when counts decrease, a
+    single ``DELETE`` then drops the rows left empty.
+    """
+    rows = [
+        {
+            "user_id": user_id,
+            "category_id": category_id,
+            "month": month,
+            "currency": currency,
+            "total": round(total, 2),
+            "count": count,
+        }
+        for (category_id, month, currency), (total, count) in deltas.items()
+        if count or round(total, 2)
+    ]
+    if not rows:
+        return
+    rollup = models.ExpenseMonthlyRollup
+    insert = _insert(session.bind.dialect.name)
+    for offset in range(0, len(rows), _UPSERT_CHUNK):
+        statement = insert(rollup).values(rows[offset:offset + _UPSERT_CHUNK])
+        statement = statement.on_conflict_do_update(
+            index_elements=[rollup.user_id, rollup.month, rollup.category_id, rollup.currency],
+            set_={
+                "total": rollup.total + statement.excluded.total,
+                "count": rollup.count + statement.excluded.count,
+            },
+        )
+        await session.execute(statement)
+
+    if any(row["count"] < 0 for row in rows):
+        await session.execute(delete(rollup).where(rollup.user_id == user_id, rollup.count <= 0))
+
+
+async def apply_delta(
+    session: AsyncSession,
+    *,
+    user_id: int,
+    category_id: int,
+    created_at: datetime,
+    currency: str,
+    amount: float,
+    count: int,
+) -> None:
+    """Add ``amount``/``count`` to the rollup row of an expense (negative to remove)."""
+    await apply_deltas(session, user_id, {(category_id, month_start(created_at), currency): (amount, count)})
+
+
+async def record_expense(session: AsyncSession, expense: models.Expense, *, sign: int = 1) -> None:
+    """Add (``sign=1``) or remove (``sign=-1``) an expense from the rollup."""
+    await apply_delta(
+        session,
+        user_id=expense.user_id,
+        category_id=expense.category_id,
+        created_at=expense.created_at,
+        currency=expense.currency,
+        amount=sign * float(expense.amount),
+        count=sign,
+    )
+
+
+def row_deltas(
+    rows: Iterable[tuple[int, datetime, str, float]],
+    *,
+    sign: int = 1,
+    deltas: dict[tuple[int, date, str], tuple[float, int]] | None = None,
+) -> dict[tuple[int, date, str], tuple[float, int]]:
+    """Aggregate ``(category_id, created_at, currency, amount)`` rows per rollup key."""
+    deltas = {} if deltas is None else deltas
+    for category_id, created_at, currency, amount in rows:
+        key = (category_id, month_start(created_at), currency)
+        total, count = deltas.get(key, (0.0, 0))
+        deltas[key] = (total + sign * float(amount), count + sign)
+    return deltas
+
+
+async def record_rows(
+    session: AsyncSession,
+    user_id: int,
+    rows: Iterable[tuple[int, datetime, str, float]],
+    *,
+    sign: int = 1,
+) -> None:
+    """Add or remove many ``(category_id, created_at, currency, amount)`` rows.
+
+    Rows are aggregated per rollup key first, so a bulk write costs one
+    multi-row upsert instead of one per expense.
+    """
+    await apply_deltas(session, user_id, row_deltas(rows, sign=sign))
+
+
+async def delete_for_categories(session: AsyncSession, user_id: int, category_ids: list[int]) -> None:
+    """Drop the rollup rows of categories whose expenses are being deleted."""
+    if not category_ids:
+        return
+    rollup = models.ExpenseMonthlyRollup
+    await session.execute(
+        delete(rollup).where(rollup.user_id == user_id, rollup.category_id.in_(category_ids))
+    )
+
+
+def _next_month(value: date) -> date:
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def split_range(start: datetime, end_exclusive: datetime) -> tuple[tuple[date, date] | None, list[tuple[datetime, datetime]]]:
+    """Split ``[start, end_exclusive)`` into whole months and raw edge ranges.
+
+    Returns ``(months, edges)`` where ``months`` is a ``[first, last)`` month
+    range answerable from the rollup (or ``None``) and ``edges`` the datetime
+    ranges that must still be aggregated from raw expenses. Aware bounds are
+    converted to UTC first, like the months of the rollup, so the edges are
+    UTC datetimes too.
+    """
+    start, end_exclusive = as_utc(start), as_utc(end_exclusive)
+    start_month = month_start(start)
+    start_midnight = datetime(start.year, start.month, start.day, tzinfo=start.tzinfo)
+    if start_midnight == start and start.day == 1:
+        first_full = start_month
+    else:
+        first_full = _next_month(start_month)
+    last_full = month_start(end_exclusive)
+
+    if first_full >= last_full:
+        return None, [(start, end_exclusive)]
+
+    first_full_dt = datetime(first_full.year, first_full.month, 1, tzinfo=start.tzinfo)
+    last_full_dt = datetime(last_full.year, last_full.month, 1, tzinfo=end_exclusive.tzinfo)
+    edges = [
+        (low, high)
+        for low, high in ((start, first_full_dt), (last_full_dt, end_exclusive))
+        if low < high
+    ]
+    return (first_full, last_full), edges
+
+
+def period_totals_parts(
+    user_id: int, start: datetime, end_exclusive: datetime, *tags, by_currency: bool = False
+) -> list:
+    """SELECTs of per-category totals for a period (whole months from the rollup).
+
+    Each SELECT exposes ``category_id`` (then ``currency`` if ``by_currency``)
+    and ``total`` after the ``tags`` columns (labelled constants identifying
+    the period); a category may appear in several of them, so their union
+    must still be summed.
+    """
+    rollup = models.ExpenseMonthlyRollup
+    expense = models.Expense
+    months, edges = split_range(start, end_exclusive)
+
+    parts = []
+    keys: list[ColumnElement[Any]]
+    if months is not None:
+        first_month, last_month = months
+        keys = [rollup.category_id.label("category_id")]
+        if by_currency:
+            keys.append(rollup.currency.label("currency"))
+        parts.append(
+            select(*tags, *keys, func.sum(rollup.total).label("total"))
+            .where(rollup.user_id == user_id, rollup.month >= first_month, rollup.month < last_month)
+            .group_by(*keys)
+        )
+    for low, high in edges:
+        keys = [expense.category_id.label("category_id")]
+        if by_currency:
+            keys.append(expense.currency.label("currency"))
+        parts.append(
+            select(*tags, *keys, func.sum(expense.amount).label("total"))
+            .where(expense.user_id == user_id, expense.created_at >= low, expense.created_at < high)
+            .group_by(*keys)
+        )
+    return parts
+
+
+def _actual_totals_query(dialect_name: str, user_id: int | None):
+    expense = models.Expense
+    bucket = month_bucket(dialect_name, expense.created_at)
+    query = select(
+        expense.user_id,
+        expense.category_id,
+        bucket.label("month"),
+        expense.currency,
+        func.sum(expense.amount).label("total"),
+        # Pas « count » : Row.count est la méthode de tuple
+        func.count().label("expense_count"),
+    ).group_by(expense.user_id, expense.category_id, bucket, expense.currency)
+    if user_id is not None:
+        query = query.where(expense.user_id == user_id)
+    return query
+
+
+async def rebuild(session: AsyncSession, user_id: int | None = None) -> int:
+    """Recompute the rollup from raw expenses (all users or one user).
+
+    Returns the number of rollup rows written.
+    """
+    rollup = models.ExpenseMonthlyRollup
+    dialect_name = session.bind.dialect.name
+
+    clear = delete(rollup)
+    if user_id is not None:
+        clear = clear.where(rollup.user_id == user_id)
+    await session.execute(clear)
+
+    insert = _insert(dialect_name)
+    result = await session.execute(
+        insert(rollup).from_select(
+            ["user_id", "category_id", "month", "currency", "total", "count"],
+            _actual_totals_query(dialect_name, user_id),
+        )
+    )
+    return result.rowcount or 0
+
+
+async def verify(session: AsyncSession, user_id: int | None = None) -> list[RollupMismatch]:
+    """Compare the rollup table with raw expenses and return every mismatch."""
+    rollup = models.ExpenseMonthlyRollup
+    dialect_name = session.bind.dialect.name
+
+    stored_query = select(rollup)
+    if user_id is not None:
+        stored_query = stored_query.where(rollup.user_id == user_id)
+    stored = {
+        (row.user_id, row.category_id, _as_date(row.month), row.currency): (float(row.total), row.count)
+        for row in (await session.execute(stored_query)).scalars()
+    }
+    actual = {
+        (row.user_id, row.category_id, _as_date(row.month), row.currency): (float(row.total), row.expense_count)
+        for row in (await session.execute(_actual_totals_query(dialect_name, user_id))).all()
+    }
+
+    mismatches: list[RollupMismatch] = []
+    for key in sorted(stored.keys() | actual.keys(), key=lambda k: (k[0], k[1], k[2], k[3])):
+        stored_total, stored_count = stored.get(key, (0.0, 0))
+        actual_total, actual_count = actual.get(key, (0.0, 0))
+        if stored_count != actual_count or round(stored_total - actual_total, 2) != 0:
+            mismatches.append(
+                RollupMismatch(*key, stored_total, stored_count, actual_total, actual_count)
+            )
+    return mismatches
+
+
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
@@ -2,8 +2,8 @@
 
 from __future__ import annotations
 
-from datetime import datetime
-from typing import Annotated, Generic, TypeVar
+from datetime import date, datetime
+from typing import Annotated, Any, Generic, Literal, TypeVar
 import re
 
 from pydantic import BaseModel, Field, field_validator
@@ -97,6 +97,45 @@ class ExpenseRead(ExpenseBase):
         from_attributes = True
 
 
+class ExpenseBulkCreate(BaseModel):
+    # Les éléments sont validés un par un pour renvoyer un résultat par élément
+    items: Annotated[list[dict[str, Any]], Field(min_length=1, max_length=10_000)]
+
+
+class ExpenseBulkItemResult(BaseModel):
+    index: int
+    status: Literal["created", "error"]
+    id: int | None = None
+    error: str | None = None
+
+
+class ExpenseBulkResult(BaseModel):
+    created: int
+    failed: int
+    items: list[ExpenseBulkItemResult]
+
+
+class ExpenseRecategorize(BaseModel):
+    to_category_id: int
+    from_category_id: int | None = None
+    start_date: datetime | None = None
+    end_date: datetime | None = None
+
+
+class ExpenseBatchResult(BaseModel):
+    affected: int
+
+
+# Ordre de GET /expenses : date ou montant, décroissant ou croissant
+ExpenseSort = Literal["newest", "oldest", "amount_desc", "amount_asc"]
+
+
+class NoteSuggestions(BaseModel):
+    prefix: str
+    # Notes les plus fréquentes d'abord
+    suggestions: list[str]
+
+
 class ExpenseUpdate(BaseModel):
     amount: Annotated[float | None, Field(default=None, gt=0)] = None
     currency: Annotated[str | None, Field(default=None, min_length=3, max_length=3)] = None
@@ -136,11 +175,129 @@ class MonthlySummary(BaseModel):
     month: str
     total: float
     category_totals: dict[str, float]
+    base_currency: str = "EUR"
+    currency_totals: dict[str, float] = {}
+    missing_rates: list[str] = []
+    start_date: datetime | None = None
+    end_date: datetime | None = None
+    category_id: int | None = None
+
+
+class CategoryTotalNode(BaseModel):
+    id: int
+    name: str
+    full_path: str
+    own_total: float
+    subtree_total: float
+    percentage: float
+    children: list["CategoryTotalNode"] = []
+
+
+class CategorySummaryTree(BaseModel):
+    month: str
+    total: float
+    categories: list[CategoryTotalNode]
+    base_currency: str = "EUR"
+    missing_rates: list[str] = []
+    start_date: datetime | None = None
+    end_date: datetime | None = None
+    category_id: int | None = None
+
+
+class TimeseriesPoint(BaseModel):
+    period: date
+    total: float
+    count: int
+
+
+class SummaryTimeseries(BaseModel):
+    bucket: Literal["day", "week", "month"]
+    total: float
+    points: list[TimeseriesPoint]
+    downsampled: bool = False
+    base_currency: str = "EUR"
+    missing_rates: list[str] = []
     start_date: datetime | None = None
     end_date: datetime | None = None
     category_id: int | None = None
 
 
+class ComparisonPeriod(BaseModel):
+    start_date: datetime
+    end_date: datetime
+    label: Annotated[str | None, Field(default=None, max_length=50)] = None
+
+
+class SummaryComparisonRequest(BaseModel):
+    periods: Annotated[list[ComparisonPeriod], Field(min_length=1, max_length=24)]
+    category_id: int | None = None
+    base_currency: Annotated[str | None, Field(default=None, min_length=3, max_length=3)] = None
+
+
+class PeriodTotal(BaseModel):
+    label: str
+    start_date: datetime
+    end_date: datetime
+    total: float
+    delta: float | None = None
+    change_pct: float | None = None
+
+
+class CategoryComparison(BaseModel):
+    category: str
+    totals: list[float]
+    deltas: list[float | None]
+    changes_pct: list[float | None]
+
+
+class SummaryComparison(BaseModel):
+    periods: list[PeriodTotal]
+    categories: list[CategoryComparison]
+    base_currency: str = "EUR"
+    missing_rates: list[str] = []
+    category_id: int | None = None
+
+
+class ExportJobCreate(BaseModel):
+    format: Literal["csv", "xlsx", "ndjson", "arrow", "parquet"] = "csv"
+    category_id: int | None = None
+    include_descendants: bool = False
+    start_date: datetime | None = None
+    end_date: datetime | None = None
+
+
+class ExportJobRead(BaseModel):
+    id: str
+    status: Literal["pending", "running", "done", "failed"]
+    format: str
+    progress: float | None = None
+    rows_written: int
+    rows_total: int | None = None
+    size: int | None = None
+    error: str | None = None
+    created_at: datetime
+    finished_at: datetime | None = None
+    expires_at: datetime | None = None
+    download_url: str | None = None
+
+
+class ImportJobRead(BaseModel):
+    id: str
+    status: Literal["pending", "running", "done", "failed"]
+    format: str
+    filename: str | None = None
+    progress: float | None = None
+    rows_processed: int
+    rows_imported: int
+    rows_failed: int
+    categories_created: int
+    error: str | None = None
+    created_at: datetime
+    finished_at: datetime | None = None
+    expires_at: datetime | None = None
+    errors_url: str | None = None
+
+
 class UserBase(BaseModel):
     username: Annotated[str, Field(
         min_length=3,
@@ -210,7 +367,7 @@ T = TypeVar("T")
 class PaginationMeta(BaseModel):
     page: int
     per_page: int
-    total: int
+    total: int | None = None
     has_next: bool
     has_previous: bool
 
@@ -0,0 +1,112 @@
+"""Time buckets and downsampling for the summary time series.
+
+Expenses are grouped by day, ISO week (starting on Monday) or month in SQL;
+the buckets without expenses are then filled in Python so that a chart gets
+one point per bucket. Long daily series can be reduced with the
+largest-triangle-three-buckets algorithm, which keeps the visual shape
+(peaks and troughs) of the curve with far fewer points.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Sequence
+from datetime import date, datetime, timedelta
+from typing import Literal
+
+from sqlalchemy import Date, Integer, cast, func
+
+from .rollups import month_bucket
+
+Bucket = Literal["day", "week", "month"]
+BUCKETS = ("day", "week", "month")
+# Garde-fou : nombre maximal de périodes d'une série avant réduction
+MAX_BUCKETS = 20_000
+
+
+def bucket_expression(dialect_name: str, bucket: Bucket, column):
+    """SQL expression truncating a timestamp column to the start of its bucket."""
+    if bucket == "month":
+        return month_bucket(dialect_name, column)
+    if dialect_name == "postgresql":
+        return cast(func.date_trunc(bucket, column), Date)
+    if bucket == "day":
+        return func.date(column)
+    # %w vaut 0 le dimanche : reculer jusqu'au lundi précédent
+    days_since_monday = (cast(func.strftime("%w", column), Integer) + 6) % 7
+    return func.date(column, func.printf("-%d days", days_since_monday))
+
+
+def bucket_start(value: date | datetime, bucket: Bucket) -> date:
+    """Return the first day of the bucket containing ``value``."""
+    day = value.date() if isinstance(value, datetime) else value
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def as_date(value: date | datetime | str) -> date:
+    """Normalize a bucket value read from the database (SQLite returns text)."""
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def bucket_range(start: datetime, end: datetime, bucket: Bucket) -> list[date]:
+    """Every bucket start between ``start`` and ``end`` included."""
+    current = bucket_start(start, bucket)
+    last = bucket_start(end, bucket)
+    buckets: list[date] = []
+    while current <= last:
+        buckets.append(current)
+        if len(buckets) > MAX_BUCKETS:
+            raise ValueError(f"Time series exceeds {MAX_BUCKETS} {bucket} buckets; use a wider bucket")
+        if bucket == "day":
+            current += timedelta(days=1)
+        elif bucket == "week":
+            current += timedelta(weeks=1)
+        else:
+            current = (current + timedelta(days=32)).replace(day=1)
+    return buckets
+
+
+def lttb_indices(x: Sequence[float], y: Sequence[float], threshold: int) -> list[int]:
+    """Indices of the points kept by largest-triangle-three-buckets downsampling.
+
+    The first and last points are always kept; the others are split into
+    ``threshold - 2`` buckets and, in each, the point forming the largest
+    triangle with the previously kept point and the average of the next
+    bucket is selected. Requires NumPy.
+    """
+    try:
+        import numpy as np
+    except ImportError as exc:  # pragma: no cover - dépend de l'installation
+        raise ValueError("Downsampling (max_points) requires numpy") from exc
+
+    count = len(x)
+    if threshold >= count or threshold < 3:
+        return list(range(count))
+
+    xs = np.asarray(x, dtype=float)
+    ys = np.asarray(y, dtype=float)
+    every = (count - 2) / (threshold - 2)
+    kept = [0]
+    anchor = 0
+    for index in range(threshold - 2):
+        low = int(index * every) + 1
+        high = int((index + 1) * every) + 1
+        next_high = min(int((index + 2) * every) + 1, count)
+        # Le dernier point sert de moyenne au dernier intervalle
+        next_x = xs[high:next_high].mean() if high < next_high else xs[-1]
+        next_y = ys[high:next_high].mean() if high < next_high else ys[-1]
+        areas = np.abs(
+            (xs[anchor] - next_x) * (ys[low:high] - ys[anchor])
+            - (xs[anchor] - xs[low:high]) * (next_y - ys[anchor])
+        )
+        anchor = low + int(areas.argmax())
+        kept.append(anchor)
+    kept.append(count - 1)
+    return kept
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""Benchmark de la suppression d'une catégorie et de sa sous-arborescence.
+
+Compare l'ancienne suppression (``session.get`` puis ``session.delete`` : la
+cascade ORM charge toute la sous-arborescence et chacune de ses dépenses avant
+de les supprimer une par une) et ``crud.delete_category`` (DELETE ensemblistes
+guidés par la table de fermeture). Pour un nombre croissant de dépenses, on
+mesure le temps, le nombre d'instances ORM chargées et le pic de
+mémoire Python (tracemalloc). Chaque mesure part d'une copie de la base.
+
+Usage :
+    python benchmarks/bench_delete_category.py [--rows 100000] [--children 20]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from sqlalchemy import create_engine, event  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+
+from app import category_tree, crud, models, rollups  # noqa: E402
+from app.database import Base  # noqa: E402
+
+USER_ID = 1
+ROOT_ID = 1
+OTHER_ID = 10_000
+HISTORY_END = datetime(2025, 1, 1)
+
+# Nombre d'instances ORM chargées depuis la base pendant la mesure
+_loaded = 0
+
+
+@event.listens_for(Base, "load", propagate=True)
+def _count_load(target, context) -> None:
+    global _loaded
+    _loaded += 1
+
+
+def populate(db_path: str, rows: int, children: int) -> None:
+    """Une racine, ``children`` sous-catégories et ``rows`` dépenses dans ce sous-arbre.
+
+    Une catégorie témoin hors du sous-arbre reçoit autant de dépenses, qui
+    doivent survivre à la suppression.
+    """
+    sync_engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(sync_engine)
+    sync_engine.dispose()
+
+    rng = random.Random(42)
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "INSERT INTO users (id, username, email, hashed_password, is_active) VALUES (?, ?, ?, ?, 1)",
+        (USER_ID, "bench", "bench@example.com", "x"),
+    )
+    categories = [(ROOT_ID, "Racine", None, "Racine", 0), (OTHER_ID, "Témoin", None, "Témoin", 0)]
+    categories += [
+        (ROOT_ID + i, f"Enfant {i:02d}", ROOT_ID, f"Racine / Enfant {i:02d}", 1) for i in range(1, children + 1)
+    ]
+    conn.executemany(
+        "INSERT INTO categories (id, name, parent_id, full_path, depth, user_id) VALUES (?, ?, ?, ?, ?, 1)",
+        categories,
+    )
+    conn.execute(category_tree.REBUILD_SQL)
+
+    subtree = [ROOT_ID + i for i in range(children + 1)]
+    span_seconds = int(timedelta(days=3650).total_seconds())
+    conn.executemany(
+        "INSERT INTO expenses (category_id, amount, currency, created_at, user_id) VALUES (?, ?, 'EUR', ?, 1)",
+        (
+            (
+                rng.choice(subtree) if index % 2 == 0 else OTHER_ID,
+                round(rng.uniform(1, 200), 2),
+                (HISTORY_END - timedelta(seconds=rng.randrange(span_seconds))).strftime("%Y-%m-%d %H:%M:%S.%f"),
+            )
+            for index in range(rows * 2)
+        ),
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+async def legacy_delete(session) -> None:
+    """Ancien chemin : cascade ORM sur la catégorie chargée."""
+    category = await session.get(models.Category, ROOT_ID)
+    subtree_ids = await category_tree.subtree_ids(session, ROOT_ID)
+    await rollups.delete_for_categories(session, USER_ID, subtree_ids)
+    await category_tree.remove_categories(session, subtree_ids)
+    await session.delete(category)
+    await session.flush()
+
+
+async def set_based_delete(session) -> None:
+    assert await crud.delete_category(session, ROOT_ID, USER_ID)
+    await session.flush()
+
+
+async def measure(template: str, tmp: str, mode: str) -> tuple[float, int, float, int]:
+    global _loaded
+    db_path = str(Path(tmp) / f"{mode}.db")
+    shutil.copy(template, db_path)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+    async with factory() as session:
+        _loaded = 0
+        tracemalloc.start()
+        start = time.perf_counter()
+        await (legacy_delete if mode == "legacy" else set_based_delete)(session)
+        await session.commit()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    await engine.dispose()
+
+    conn = sqlite3.connect(db_path)
+    remaining = conn.execute("SELECT COUNT(*) FROM expenses").fetchone()[0]
+    conn.close()
+    return elapsed, _loaded, peak / 1_000_000, remaining
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=(__doc__ or "").splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--children", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sorted({max(args.rows // 100, 1), max(args.rows // 10, 1), args.rows}):
+            template = str(Path(tmp) / f"template-{rows}.db")
+            populate(template, rows, args.children)
+            for mode in ("legacy", "set_based"):
+                seconds, loaded, peak_mb, remaining = await measure(template, tmp, mode)
+                print(
+                    f"{rows:>9,} dépenses | {mode:<9} | {seconds * 1000:9.1f} ms | "
+                    f"objets chargés {loaded:>9,} | pic mémoire {peak_mb:8.1f} Mo | "
+                    f"dépenses restantes {remaining:,}"
+                )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
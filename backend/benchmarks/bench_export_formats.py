@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Benchmark des formats d'export : CSV, XLSX, NDJSON, Arrow et Parquet.
+
+Pour un historique synthétique, mesure le temps de production de chaque
+format via ``crud.export_expenses`` (lecture du curseur comprise) et le volume
+transmis, brut puis compressé par gzip comme le ferait ``GZipMiddleware``.
+
+Usage :
+    python benchmarks/bench_export_formats.py [--rows 200000] [--repeat 3]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+import zlib
+from datetime import timedelta
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+
+from app import crud  # noqa: E402
+from bench_summary_period import HISTORY_END, USER_ID, populate  # noqa: E402
+
+FORMATS: tuple[crud.ExportFormat, ...] = ("csv", "xlsx", "ndjson", "arrow", "parquet")
+
+
+async def export_once(factory, export_format: crud.ExportFormat) -> tuple[float, int, int]:
+    """Produire un export complet ; renvoie (secondes, octets bruts, octets gzip)."""
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    raw = compressed = 0
+    async with factory() as session:
+        start = time.perf_counter()
+        chunks, _, _ = await crud.export_expenses(
+            session,
+            USER_ID,
+            start_date=HISTORY_END - timedelta(days=3650),
+            end_date=HISTORY_END,
+            export_format=export_format,
+        )
+        async for chunk in chunks:
+            raw += len(chunk)
+            compressed += len(compressor.compress(chunk))
+        elapsed = time.perf_counter() - start
+    compressed += len(compressor.flush())
+    return elapsed, raw, compressed
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=(__doc__ or "").splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = str(Path(tmp) / "bench.db")
+        populate(db_path, args.rows)
+        engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+        factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+        for export_format in FORMATS:
+            runs = [await export_once(factory, export_format) for _ in range(args.repeat)]
+            seconds = statistics.median(run[0] for run in runs)
+            _, raw, compressed = runs[-1]
+            print(
+                f"{args.rows:>9,} lignes | {export_format:<7} | {seconds:7.2f} s | "
+                f"brut {raw / 1_000_000:7.1f} Mo | gzip {compressed / 1_000_000:7.1f} Mo"
+            )
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""Benchmark de totals_by_period sur un historique synthétique.
+
+Mesure le temps d'un résumé mensuel lorsque l'historique de l'utilisateur
+grandit (100k → 1M dépenses) et lorsque la période s'élargit, afin de
+vérifier que le coût suit la taille de la période et non celle de
+l'historique. La requête historique (filtre de dates dans un CASE du SUM)
+est mesurée en parallèle à titre de comparaison.
+
+Usage :
+    python benchmarks/bench_summary_period.py [--rows 1000000] [--repeat 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from sqlalchemy import and_, case, create_engine, func, select, text  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+
+from app import category_tree, crud, models, rollups  # noqa: E402
+from app.database import Base  # noqa: E402
+
+USER_ID = 1
+CATEGORY_COUNT = 40
+HISTORY_END = datetime(2025, 1, 1)
+
+
+def populate(db_path: str, rows: int) -> None:
+    """Créer le schéma et insérer ``rows`` dépenses réparties sur 10 ans."""
+    sync_engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(sync_engine)
+    sync_engine.dispose()
+
+    rng = random.Random(42)
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "INSERT INTO users (id, username, email, hashed_password, is_active) VALUES (?, ?, ?, ?, 1)",
+        (USER_ID, "bench", "bench@example.com", "x"),
+    )
+    conn.executemany(
+        "INSERT INTO categories (id, name, user_id, full_path, depth) VALUES (?, ?, ?, ?, 0)",
+        [(i, f"Catégorie {i:02d}", USER_ID, f"Catégorie {i:02d}") for i in range(1, CATEGORY_COUNT + 1)],
+    )
+    span_seconds = int(timedelta(days=3650).total_seconds())
+    batch: list[tuple] = []
+    for _ in range(rows):
+        created_at = HISTORY_END - timedelta(seconds=rng.randrange(span_seconds))
+        batch.append(
+            (
+                rng.randint(1, CATEGORY_COUNT),
+                round(rng.uniform(1, 200), 2),
+                "EUR",
+                created_at.strftime("%Y-%m-%d %H:%M:%S.%f"),
+                USER_ID,
+            )
+        )
+        if len(batch) >= 50_000:
+            conn.executemany(
+                "INSERT INTO expenses (category_id, amount, currency, created_at, user_id) VALUES (?, ?, ?, ?, ?)",
+                batch,
+            )
+            batch.clear()
+    if batch:
+        conn.executemany(
+            "INSERT INTO expenses (category_id, amount, currency, created_at, user_id) VALUES (?, ?, ?, ?, ?)",
+            batch,
+        )
+    conn.commit()
+    conn.close()
+
+
+async def build_derived_tables(factory) -> None:
+    """Remplir la table de fermeture et les cumuls mensuels lus par totals_by_period.
+
+    Les dépenses sont insérées directement en SQL : sans ces tables, le
+    résumé lirait des cumuls vides.
+    """
+    async with factory() as session:
+        await category_tree.rebuild(session)
+        await rollups.rebuild(session, USER_ID)
+        await session.commit()
+        await session.execute(text("ANALYZE"))
+
+
+async def legacy_totals(session, start_date: datetime, end_date: datetime) -> dict[str, float]:
+    """Ancienne requête : jointure sur tout l'historique, filtre dans le CASE."""
+    total_case = case(
+        (
+            and_(
+                models.Expense.created_at >= start_date,
+                models.Expense.created_at < end_date + timedelta(days=1),
+            ),
+            models.Expense.amount,
+        ),
+        else_=0.0,
+    )
+    result = await session.execute(
+        select(models.Category.full_path, func.coalesce(func.sum(total_case), 0.0))
+        .outerjoin(models.Expense, models.Expense.category_id == models.Category.id)
+        .where(models.Category.user_id == USER_ID)
+        .group_by(models.Category.id)
+        .order_by(models.Category.name)
+    )
+    return {full_path: round(float(total), 2) for full_path, total in result.all()}
+
+
+async def check_totals(factory, start_date: datetime, end_date: datetime) -> None:
+    """Vérifier que les deux requêtes donnent les mêmes totaux avant de les chronométrer."""
+    async with factory() as session:
+        summary = await crud.totals_by_period(session, USER_ID, start_date=start_date, end_date=end_date)
+        expected = await legacy_totals(session, start_date, end_date)
+    assert summary.category_totals.keys() == expected.keys()
+    for full_path, total in expected.items():
+        assert abs(summary.category_totals[full_path] - total) < 0.01, full_path
+
+
+async def timed(factory, fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        async with factory() as session:
+            start = time.perf_counter()
+            await fn(session)
+            samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+async def run_case(rows: int, repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = str(Path(tmp) / "bench.db")
+        populate(db_path, rows)
+        engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+        factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+        await build_derived_tables(factory)
+
+        for days in (1, 31, 365):
+            end_date = HISTORY_END - timedelta(days=1)
+            start_date = end_date - timedelta(days=days - 1)
+            await check_totals(factory, start_date, end_date)
+            new_ms = await timed(
+                factory,
+                lambda s: crud.totals_by_period(s, USER_ID, start_date=start_date, end_date=end_date),
+                repeat,
+            )
+            legacy_ms = await timed(factory, lambda s: legacy_totals(s, start_date, end_date), repeat)
+            print(
+                f"{rows:>10,} dépenses | période {days:>3} j | "
+                f"totals_by_period {new_ms:8.2f} ms | ancienne requête {legacy_ms:8.2f} ms"
+            )
+        await engine.dispose()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=(__doc__ or "").splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for rows in sorted({max(args.rows // 10, 1), args.rows}):
+        await run_case(rows, args.repeat)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""Benchmark de l'export XLSX : classeur en mémoire contre write_only.
+
+Compare, pour un nombre croissant de lignes, l'ancien export (``Workbook()``
+classique sauvegardé dans un ``BytesIO`` sur la boucle d'événements) et
+``exports.write_xlsx`` (mode ``write_only``, threads de travail, fichier
+temporaire). Chaque mesure tourne dans un sous-processus dédié afin que le pic
+de RSS soit propre à la méthode mesurée. Le blocage maximal de la boucle
+d'événements est mesuré par une tâche témoin qui se réveille toutes les 10 ms.
+
+Usage :
+    python benchmarks/bench_xlsx_export.py [--rows 200000] [--batch 2000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from openpyxl import Workbook  # noqa: E402
+
+from app import exports  # noqa: E402
+from app.crud import EXPORT_HEADERS  # noqa: E402
+
+CATEGORY_COUNT = 40
+TICK = 0.01
+
+
+def synthetic_batches(rows: int, batch: int):
+    """Lots de lignes au format de ``crud._export_rows_query``."""
+    start = datetime(2020, 1, 1)
+    for offset in range(0, rows, batch):
+        yield [
+            (
+                f"Catégorie {index % CATEGORY_COUNT:02d}",
+                index,
+                Decimal(index % 20000) / 100,
+                f"Note {index}",
+                start + timedelta(minutes=index),
+            )
+            for index in range(offset, min(offset + batch, rows))
+        ]
+
+
+def category_totals() -> dict[str, float]:
+    return {f"Catégorie {index:02d}": 1000.0 for index in range(CATEGORY_COUNT)}
+
+
+async def legacy_export(rows: int, batch: int) -> int:
+    """Ancien chemin : une cellule objet par valeur, sauvegarde sur la boucle."""
+    workbook = Workbook()
+    summary_sheet = workbook.active
+    assert summary_sheet is not None
+    summary_sheet.title = "Résumé"
+    summary_sheet.append(["Catégorie", "Total (€)"])
+    for name, total in category_totals().items():
+        summary_sheet.append([name, total])
+    detail_sheet = workbook.create_sheet("Détails")
+    detail_sheet.append(EXPORT_HEADERS)
+    for rows_batch in synthetic_batches(rows, batch):
+        for name, expense_id, amount, note, created_at in rows_batch:
+            detail_sheet.append([name, expense_id, float(amount), note, created_at.isoformat()])
+        await asyncio.sleep(0)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return len(buffer.getvalue())
+
+
+async def write_only_export(rows: int, batch: int) -> int:
+    async def batches():
+        for rows_batch in synthetic_batches(rows, batch):
+            yield rows_batch
+
+    path = await exports.write_xlsx(category_totals(), EXPORT_HEADERS, batches())
+    size = 0
+    async for chunk in exports.stream_file(path):
+        size += len(chunk)
+    return size
+
+
+async def measure(mode: str, rows: int, batch: int) -> dict:
+    max_stall = 0.0
+    done = asyncio.Event()
+
+    async def watchdog() -> None:
+        nonlocal max_stall
+        while not done.is_set():
+            before = time.perf_counter()
+            await asyncio.sleep(TICK)
+            max_stall = max(max_stall, time.perf_counter() - before - TICK)
+
+    watcher = asyncio.create_task(watchdog())
+    start = time.perf_counter()
+    export = legacy_export if mode == "legacy" else write_only_export
+    size = await export(rows, batch)
+    elapsed = time.perf_counter() - start
+    done.set()
+    await watcher
+
+    return {
+        "mode": mode,
+        "rows": rows,
+        "seconds": elapsed,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "max_stall_ms": max_stall * 1000,
+        "bytes": size,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=(__doc__ or "").splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--batch", type=int, default=2000)
+    parser.add_argument("--mode", choices=["legacy", "write_only"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(asyncio.run(measure(args.mode, args.rows, args.batch))))
+        return
+
+    for rows in sorted({max(args.rows // 10, 1), args.rows}):
+        for mode in ("legacy", "write_only"):
+            output = subprocess.run(
+                [sys.executable, __file__, "--mode", mode, "--rows", str(rows), "--batch", str(args.batch)],
+                check=True,
+                capture_output=True,
+                text=True,
+                env={**os.environ, "PYTHONPATH": str(backend_dir)},
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(
+                f"{rows:>9,} lignes | {mode:<10} | {result['seconds']:7.2f} s | "
+                f"pic RSS {result['peak_rss_mb']:8.1f} Mo | "
+                f"blocage boucle max {result['max_stall_ms']:8.1f} ms | "
+                f"{result['bytes'] / 1_000_000:6.1f} Mo"
+            )
+
+
+if __name__ == "__main__":
+    main()
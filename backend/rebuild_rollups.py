@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Reconstruire ou vérifier la table expense_monthly_rollups.
+
+Usage :
+    python rebuild_rollups.py             # reconstruit les cumuls de tous les utilisateurs
+    python rebuild_rollups.py --user-id 3 # reconstruit les cumuls d'un utilisateur
+    python rebuild_rollups.py --verify    # compare les cumuls aux dépenses sans rien modifier
+"""
+
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+# Ajouter le répertoire backend au path
+backend_dir = Path(__file__).parent
+sys.path.insert(0, str(backend_dir))
+
+from app import rollups
+from app.database import AsyncSessionLocal
+
+
+async def run(user_id: int | None, verify_only: bool) -> int:
+    async with AsyncSessionLocal() as session:
+        if not verify_only:
+            print("🔄 Reconstruction des cumuls mensuels...")
+            written = await rollups.rebuild(session, user_id)
+            await session.commit()
+            print(f"✅ {written} lignes de cumul écrites")
+
+        print("🔍 Vérification des cumuls mensuels...")
+        mismatches = await rollups.verify(session, user_id)
+
+    if not mismatches:
+        print("✅ Les cumuls correspondent aux dépenses")
+        return 0
+
+    print(f"❌ {len(mismatches)} écart(s) détecté(s) :")
+    for mismatch in mismatches[:50]:
+        print(
+            f"   user={mismatch.user_id} category={mismatch.category_id} "
+            f"month={mismatch.month} currency={mismatch.currency} "
+            f"cumul={mismatch.rollup_total:.2f} ({mismatch.rollup_count}) "
+            f"réel={mismatch.actual_total:.2f} ({mismatch.actual_count})"
+        )
+    return 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Reconstruire ou vérifier les cumuls mensuels des dépenses")
+    parser.add_argument("--user-id", type=int, default=None, help="Limiter à un utilisateur")
+    parser.add_argument("--verify", action="store_true", help="Vérifier sans reconstruire")
+    args = parser.parse_args()
+    return asyncio.run(run(args.user_id, args.verify))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,6 +3,7 @@
 import asyncio
 import os
 import tempfile
+import uuid
 from pathlib import Path
 from typing import AsyncGenerator
 
@@ -11,6 +12,7 @@ import pytest_asyncio
 from httpx import AsyncClient
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
+from app import export_jobs, import_jobs
 from app.database import Base, get_session
 from app.rate_limit import reset_rate_limit_store
 from app.main import app
@@ -57,6 +59,9 @@ async def test_db():
                 raise
 
     app.dependency_overrides[get_session] = override_get_session
+    # Les exports en arrière-plan ouvrent leurs propres sessions
+    export_jobs.manager.session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+    import_jobs.manager.session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
 
     yield engine
 
@@ -81,6 +86,20 @@ async def db_session(test_db):
         yield session
 
 
+@pytest_asyncio.fixture
+async def auth_headers(client):
+    """Register and log in a fresh user, returning its Authorization header."""
+    username = f"user_{uuid.uuid4().hex[:12]}"
+    password = "StrongPassw0rd!"
+    await client.post(
+        "/auth/register",
+        json={"username": username, "email": f"{username}@example.com", "password": password},
+    )
+    reset_rate_limit_store()
+    login_response = await client.post("/auth/login", json={"username": username, "password": password})
+    return {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+
+
 @pytest.fixture(autouse=True)
 def clear_rate_limit_store():
     """Reset rate limiting between tests to avoid cross-test interference."""
@@ -1,9 +1,12 @@
 """Tests for category management functionality."""
 
+import asyncio
+
 import pytest
-from sqlalchemy import select
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
 
-from app import models
+from app import crud, models, schemas
 
 
 class TestCategoryAPI:
@@ -327,3 +330,261 @@ class TestCategoryAPI:
 
         assert response.status_code == 409
         assert "already exists" in response.json()["detail"]
+
+
+class TestCategoryClosure:
+    """Test closure table maintenance on category writes."""
+
+    async def _create(self, client, headers, name, parent_id=None):
+        payload = {"name": name}
+        if parent_id is not None:
+            payload["parent_id"] = parent_id
+        response = await client.post("/categories", json=payload, headers=headers)
+        assert response.status_code == 201
+        return response.json()["id"]
+
+    async def _links(self, db_session, category_ids):
+        result = await db_session.execute(
+            select(models.CategoryClosure).where(models.CategoryClosure.descendant_id.in_(category_ids))
+        )
+        return {(row.ancestor_id, row.descendant_id, row.depth) for row in result.scalars()}
+
+    @pytest.mark.asyncio
+    async def test_reparent_rewrites_subtree_links(self, client, auth_headers, db_session):
+        """Moving a category moves its whole subtree in the closure table."""
+        home = await self._create(client, auth_headers, "Home")
+        energy = await self._create(client, auth_headers, "Energy", home)
+        power = await self._create(client, auth_headers, "Power", energy)
+        bills = await self._create(client, auth_headers, "Bills")
+
+        assert await self._links(db_session, [power]) == {(power, power, 0), (energy, power, 1), (home, power, 2)}
+
+        response = await client.patch(f"/categories/{energy}", json={"parent_id": bills}, headers=auth_headers)
+        assert response.status_code == 200
+        assert response.json()["full_path"] == "Bills / Energy"
+
+        assert await self._links(db_session, [energy, power]) == {
+            (energy, energy, 0),
+            (bills, energy, 1),
+            (power, power, 0),
+            (energy, power, 1),
+            (bills, power, 2),
+        }
+        child = await client.get(f"/categories/{power}", headers=auth_headers)
+        assert child.json()["full_path"] == "Bills / Energy / Power"
+
+    @pytest.mark.asyncio
+    async def test_cannot_move_under_descendant(self, client, auth_headers):
+        """Reparenting a category under its own descendant is rejected."""
+        root = await self._create(client, auth_headers, "Root")
+        leaf = await self._create(client, auth_headers, "Leaf", root)
+
+        response = await client.patch(f"/categories/{root}", json={"parent_id": leaf}, headers=auth_headers)
+
+        assert response.status_code == 400
+
+    @pytest.mark.asyncio
+    async def test_delete_removes_subtree_links(self, client, auth_headers, db_session):
+        """Deleting a category drops its subtree, their expenses and closure rows only."""
+        root = await self._create(client, auth_headers, "Leisure")
+        child = await self._create(client, auth_headers, "Cinema", root)
+        other = await self._create(client, auth_headers, "Rent")
+        for category_id in (root, child, child, other):
+            await client.post("/expenses", json={"amount": 4, "category_id": category_id}, headers=auth_headers)
+
+        response = await client.delete(f"/categories/{root}", headers=auth_headers)
+
+        assert response.status_code == 204
+        assert await self._links(db_session, [root, child]) == set()
+        remaining = await db_session.execute(
+            select(models.Category.id).where(models.Category.id.in_([root, child, other]))
+        )
+        assert list(remaining.scalars()) == [other]
+        expenses = await db_session.execute(
+            select(models.Expense.category_id).where(models.Expense.category_id.in_([root, child, other]))
+        )
+        assert list(expenses.scalars()) == [other]
+
+    @pytest.mark.asyncio
+    async def test_rename_rewrites_stored_paths(self, client, auth_headers, db_session):
+        """Renaming a category rewrites the stored path of its subtree only."""
+        food = await self._create(client, auth_headers, "Food")
+        fruit = await self._create(client, auth_headers, "Fruit", food)
+        apple = await self._create(client, auth_headers, "Apple", fruit)
+        other = await self._create(client, auth_headers, "Fruitful")
+        expense = await client.post(
+            "/expenses", json={"amount": 3.5, "category_id": apple}, headers=auth_headers
+        )
+        assert expense.status_code == 201
+
+        response = await client.patch(f"/categories/{food}", json={"name": "Groceries"}, headers=auth_headers)
+        assert response.status_code == 200
+
+        result = await db_session.execute(
+            select(models.Category.id, models.Category.full_path, models.Category.depth)
+            .where(models.Category.id.in_([food, fruit, apple, other]))
+            .execution_options(populate_existing=True)
+        )
+        assert {row.id: (row.full_path, row.depth) for row in result} == {
+            food: ("Groceries", 0),
+            fruit: ("Groceries / Fruit", 1),
+            apple: ("Groceries / Fruit / Apple", 2),
+            other: ("Fruitful", 0),
+        }
+        listing = await client.get(f"/categories/{apple}/expenses", headers=auth_headers)
+        assert listing.json()["items"][0]["category_path"] == "Groceries / Fruit / Apple"
+
+
+class TestCategoryUniqueness:
+    """Test the unique index on (user, parent, lower(name))."""
+
+    @pytest.mark.asyncio
+    async def test_case_insensitive_duplicate_under_same_parent(self, client, auth_headers):
+        """Siblings cannot differ only by case; the same name under another parent is fine."""
+        root = (await client.post("/categories", json={"name": "Home"}, headers=auth_headers)).json()["id"]
+        first = await client.post("/categories", json={"name": "Rent", "parent_id": root}, headers=auth_headers)
+        duplicate = await client.post("/categories", json={"name": "RENT", "parent_id": root}, headers=auth_headers)
+        elsewhere = await client.post("/categories", json={"name": "rent"}, headers=auth_headers)
+
+        assert first.status_code == 201
+        assert first.json()["children"] == []
+        assert duplicate.status_code == 409
+        assert elsewhere.status_code == 201
+
+    @pytest.mark.asyncio
+    async def test_concurrent_creates_insert_one_row(self, client, auth_headers, test_db):
+        """Parallel creates of the same name yield one category and conflicts for the rest."""
+        user_id = (await client.get("/auth/me", headers=auth_headers)).json()["id"]
+        factory = async_sessionmaker(bind=test_db, expire_on_commit=False)
+
+        async def create(name: str) -> str:
+            async with factory() as session:
+                try:
+                    await crud.create_category(session, schemas.CategoryCreate(name=name), user_id)
+                    await session.commit()
+                    return "created"
+                except crud.CategoryNameConflictError:
+                    await session.rollback()
+                    return "conflict"
+
+        outcomes = await asyncio.gather(*(create(name) for name in ["Travel", "TRAVEL", "travel"] * 4))
+
+        assert sorted(outcomes) == ["conflict"] * 11 + ["created"]
+
+    @pytest.mark.asyncio
+    async def test_path_creation_reuses_concurrently_created_categories(self, client, auth_headers, test_db):
+        """Categories created after the import loaded its paths are reused, not a conflict."""
+        user_id = (await client.get("/auth/me", headers=auth_headers)).json()["id"]
+        factory = async_sessionmaker(bind=test_db, expire_on_commit=False)
+        async with factory() as session:
+            known = await crud.load_category_paths(session, user_id)
+
+        home = (await client.post("/categories", json={"name": "Home"}, headers=auth_headers)).json()["id"]
+        rent = (
+            await client.post("/categories", json={"name": "Rent", "parent_id": home}, headers=auth_headers)
+        ).json()["id"]
+
+        async with factory() as session:
+            await crud.create_category_paths(
+                session, user_id, [["HOME", "rent"], ["Home", "Water"], ["Garden"]], known
+            )
+            await session.commit()
+
+        assert known["home"] == (home, "Home")
+        assert known["home / rent"] == (rent, "Home / Rent")
+        assert known["home / water"][1] == "Home / Water"
+        assert known["garden"][1] == "Garden"
+        async with factory() as session:
+            water = await session.get(models.Category, known["home / water"][0])
+            assert water is not None
+            assert water.parent_id == home
+            count = await session.scalar(
+                select(func.count()).select_from(models.Category).where(models.Category.user_id == user_id)
+            )
+            assert count == 4
+
+
+class TestCategoryWriteRoundTrips:
+    """Count the statements sent to the database by category writes."""
+
+    @pytest.mark.asyncio
+    async def test_writes_use_single_statements(self, client, auth_headers, test_db, db_session):
+        user_id = (await client.get("/auth/me", headers=auth_headers)).json()["id"]
+        statements: list[str] = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(test_db.sync_engine, "before_cursor_execute", record)
+        try:
+            home = await crud.create_category(db_session, schemas.CategoryCreate(name="Home"), user_id)
+            # INSERT ... RETURNING puis la ligne de fermeture
+            assert len(statements) == 2
+
+            statements.clear()
+            rent = await crud.create_category(
+                db_session, schemas.CategoryCreate(name="Rent", parent_id=home.id), user_id
+            )
+            # Chemin du parent, INSERT ... RETURNING, fermeture propre et héritée
+            assert len(statements) == 4
+
+            statements.clear()
+            updated = await crud.update_category(
+                db_session, rent.id, schemas.CategoryUpdate(description="Mensuel"), user_id
+            )
+            assert updated is not None and updated.description == "Mensuel"
+            # Ligne actuelle, UPDATE, puis la réponse : la catégorie, son parent
+            # et ses enfants (aucun)
+            assert len(statements) == 5
+
+            statements.clear()
+            renamed = await crud.update_category(db_session, home.id, schemas.CategoryUpdate(name="House"), user_id)
+            assert renamed is not None and [child.full_path for child in renamed.children] == ["House / Rent"]
+            # Ligne actuelle, UPDATE, chemins de la sous-arborescence, puis la
+            # réponse : la catégorie et deux niveaux d'enfants
+            assert len(statements) == 6
+            # La réponse ne charge jamais les dépenses des catégories
+            assert not any("FROM expenses" in statement for statement in statements)
+        finally:
+            event.remove(test_db.sync_engine, "before_cursor_execute", record)
+        await db_session.rollback()
+
+
+class TestCategoryPathCache:
+    """Test the versioned per-user category map."""
+
+    @pytest.mark.asyncio
+    async def test_map_is_shared_and_follows_writes(self, client, auth_headers, test_db):
+        """One query per version: the session memo and process cache serve repeats."""
+        user_id = (await client.get("/auth/me", headers=auth_headers)).json()["id"]
+        factory = async_sessionmaker(bind=test_db, expire_on_commit=False)
+        statements: list[str] = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith("SELECT") and "FROM categories" in statement:
+                statements.append(statement)
+
+        event.listen(test_db.sync_engine, "before_cursor_execute", record)
+        try:
+            async with factory() as session:
+                assert await crud.category_paths(session, user_id) == {}
+                await crud.category_paths(session, user_id)
+            async with factory() as session:
+                await crud.category_paths(session, user_id)
+            assert len(statements) == 1
+
+            async with factory() as session:
+                food = await crud.create_category(session, schemas.CategoryCreate(name="Food"), user_id)
+                await session.commit()
+            async with factory() as session:
+                assert await crud.category_paths(session, user_id) == {food.id: "Food"}
+            assert len(statements) == 2
+
+            async with factory() as session:
+                await crud.create_category(session, schemas.CategoryCreate(name="Ghost"), user_id)
+                await crud.category_paths(session, user_id)
+                await session.rollback()
+            async with factory() as session:
+                assert await crud.category_paths(session, user_id) == {food.id: "Food"}
+        finally:
+            event.remove(test_db.sync_engine, "before_cursor_execute", record)
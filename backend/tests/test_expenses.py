@@ -1,10 +1,24 @@
 """Tests for expense management functionality."""
 
+import asyncio
+import io
+import json
+import random
+import tempfile
+
 import pytest
-from datetime import datetime
-from sqlalchemy import select
+from datetime import datetime, timedelta
+from httpx import ASGITransport, AsyncClient
+from openpyxl import Workbook, load_workbook
+from sqlalchemy import event, insert, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
-from app import models
+from app import category_tree, crud, export_jobs, import_jobs, models, rollups, schemas
+from app.database import Base
+from app.export_cache import ExportCache, data_version, export_cache
+from app.main import DownloadAwareGZipMiddleware
+from app.note_suggest import NoteSuggestIndex, UserNotes
 
 
 class TestExpenseAPI:
@@ -400,3 +414,966 @@ class TestExpenseAPI:
         # Verify all expenses are for the food category
         for expense in data:
             assert expense["category_id"] == food_category_id
+
+
+class TestExpensePagination:
+    """Test single round-trip pagination of expense listings."""
+
+    async def _create_expenses(self, client, headers, count):
+        category_response = await client.post("/categories", json={"name": "Paging"}, headers=headers)
+        category_id = category_response.json()["id"]
+        for index in range(count):
+            await client.post(
+                "/expenses",
+                json={"category_id": category_id, "amount": 10 + index, "created_at": f"2024-01-{index + 1:02d}T12:00:00"},
+                headers=headers,
+            )
+        return category_id
+
+    @pytest.mark.asyncio
+    async def test_search_returns_total_and_has_next(self, client, auth_headers):
+        """The total comes back with the page and has_next reflects remaining rows."""
+        await self._create_expenses(client, auth_headers, 5)
+
+        response = await client.get(
+            "/expenses",
+            params={"start_date": "2024-01-01", "end_date": "2024-01-31", "per_page": 2, "page": 2},
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["items"]) == 2
+        assert data["meta"]["total"] == 5
+        assert data["meta"]["has_next"] is True
+        assert data["meta"]["has_previous"] is True
+
+    @pytest.mark.asyncio
+    async def test_search_without_total(self, client, auth_headers):
+        """include_total=false skips counting but still paginates."""
+        await self._create_expenses(client, auth_headers, 3)
+
+        response = await client.get(
+            "/expenses",
+            params={
+                "start_date": "2024-01-01",
+                "end_date": "2024-01-31",
+                "per_page": 3,
+                "include_total": "false",
+            },
+            headers=auth_headers,
+        )
+
+        data = response.json()
+        assert len(data["items"]) == 3
+        assert data["meta"]["total"] is None
+        assert data["meta"]["has_next"] is False
+
+    @pytest.mark.asyncio
+    async def test_page_past_the_end_keeps_total(self, client, auth_headers):
+        """A page beyond the last row still reports the filtered total."""
+        category_id = await self._create_expenses(client, auth_headers, 2)
+
+        response = await client.get(
+            f"/categories/{category_id}/expenses",
+            params={"start_date": "2024-01-01", "end_date": "2024-01-31", "per_page": 2, "page": 3},
+            headers=auth_headers,
+        )
+
+        data = response.json()
+        assert data["items"] == []
+        assert data["meta"]["total"] == 2
+        assert data["meta"]["has_next"] is False
+
+
+
+class TestExpenseExport:
+    """Test the streaming expense export."""
+
+    @pytest.mark.asyncio
+    async def test_csv_export_is_not_capped(self, client, auth_headers, db_session):
+        """Every expense of the period is exported, beyond the old 10,000-row limit."""
+        response = await client.post("/categories", json={"name": "Bulk"}, headers=auth_headers)
+        category_id = response.json()["id"]
+        user_id = await db_session.scalar(
+            select(models.Category.user_id).where(models.Category.id == category_id)
+        )
+        await db_session.execute(
+            insert(models.Expense),
+            [
+                {
+                    "category_id": category_id,
+                    "user_id": user_id,
+                    "amount": 1,
+                    "currency": "EUR",
+                    "created_at": datetime(2024, 3, 1 + index % 28, 12, 0),
+                }
+                for index in range(10_050)
+            ],
+        )
+        await db_session.commit()
+
+        response = await client.get(
+            "/expenses/export",
+            params={"format": "csv", "start_date": "2024-03-01", "end_date": "2024-03-31"},
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        lines = response.text.splitlines()
+        assert lines[1] == "Bulk,10050.00 €"
+        detail_start = lines.index("Catégorie,ID,Montant,Note,Date,Devise")
+        assert len(lines) - detail_start - 1 == 10_050
+
+    @pytest.mark.asyncio
+    async def test_xlsx_export_streams_spooled_workbook(self, client, auth_headers, monkeypatch, tmp_path):
+        """The XLSX export is written to a spool file that is removed once sent."""
+        monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+        response = await client.post("/categories", json={"name": "Sheets"}, headers=auth_headers)
+        category_id = response.json()["id"]
+        await client.post(
+            "/expenses",
+            json={"category_id": category_id, "amount": 12.5, "note": "Paper", "created_at": "2024-04-02T09:00:00"},
+            headers=auth_headers,
+        )
+
+        response = await client.get(
+            "/expenses/export",
+            params={"format": "xlsx", "start_date": "2024-04-01", "end_date": "2024-04-30"},
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 200
+        workbook = load_workbook(io.BytesIO(response.content))
+        assert list(workbook["Résumé"].values)[1] == ("Sheets", 12.5)
+        assert list(workbook["Détails"].values)[1][2:4] == (12.5, "Paper")
+        assert list(tmp_path.iterdir()) == []
+
+
+class TestExportJobs:
+    """Test background export jobs."""
+
+    async def _wait_for(self, client, headers, job_id):
+        for _ in range(100):
+            response = await client.get(f"/expenses/export/jobs/{job_id}", headers=headers)
+            assert response.status_code == 200
+            if response.json()["status"] in ("done", "failed"):
+                return response.json()
+            await asyncio.sleep(0.02)
+        raise AssertionError("export job did not finish")
+
+    @pytest.mark.asyncio
+    async def test_job_runs_and_serves_ranges(self, client, auth_headers):
+        """A queued export reports progress and its file supports Range requests."""
+        response = await client.post("/categories", json={"name": "Jobs"}, headers=auth_headers)
+        category_id = response.json()["id"]
+        for day in (1, 2, 3):
+            await client.post(
+                "/expenses",
+                json={"category_id": category_id, "amount": day, "created_at": f"2024-05-0{day}T08:00:00"},
+                headers=auth_headers,
+            )
+
+        response = await client.post(
+            "/expenses/export/jobs",
+            json={"format": "csv", "start_date": "2024-05-01", "end_date": "2024-05-31"},
+            headers=auth_headers,
+        )
+        assert response.status_code == 202
+        job = await self._wait_for(client, auth_headers, response.json()["id"])
+
+        assert job["status"] == "done"
+        assert job["rows_total"] == 3
+        assert job["progress"] == 1.0
+        download = await client.get(job["download_url"], headers={**auth_headers, "Accept-Encoding": "gzip"})
+        assert download.status_code == 200
+        # Servi tel quel (pas de gzip ni d'en-tête Content-Encoding) pour que les plages restent valides
+        assert "content-encoding" not in download.headers
+        assert len(download.content) == job["size"]
+        assert download.text.splitlines()[1] == "Jobs,6.00 €"
+
+        partial = await client.get(job["download_url"], headers={**auth_headers, "Range": "bytes=0-6"})
+        assert partial.status_code == 206
+        assert partial.content == download.content[:7]
+
+    @pytest.mark.asyncio
+    async def test_downloads_bypass_gzip(self):
+        """Only export job downloads skip compression."""
+        async def large_body(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/csv")]})
+            await send({"type": "http.response.body", "body": b"a,b\n" * 1000})
+
+        transport = ASGITransport(app=DownloadAwareGZipMiddleware(large_body, minimum_size=500))
+        async with AsyncClient(transport=transport, base_url="http://testserver") as raw_client:
+            headers = {"Accept-Encoding": "gzip"}
+            download = await raw_client.get("/expenses/export/jobs/abc/download", headers=headers)
+            other = await raw_client.get("/expenses/export/jobs/abc", headers=headers)
+        assert "content-encoding" not in download.headers
+        assert len(download.content) == 4000
+        assert other.headers["content-encoding"] == "gzip"
+
+    @pytest.mark.asyncio
+    async def test_identical_jobs_are_deduplicated(self, client, auth_headers):
+        """An identical request while a job is in flight returns the same job."""
+        me = await client.get("/auth/me", headers=auth_headers)
+        user_id = me.json()["id"]
+
+        first = export_jobs.manager.submit(user_id, export_format="csv")
+        second = export_jobs.manager.submit(user_id, export_format="csv")
+        other = export_jobs.manager.submit(user_id, export_format="xlsx")
+
+        assert second is first
+        assert other is not first
+        assert first.task is not None and other.task is not None
+        await asyncio.gather(first.task, other.task)
+
+    @pytest.mark.asyncio
+    async def test_other_users_cannot_read_job(self, client, auth_headers):
+        """Job ids are scoped to their owner."""
+        job = export_jobs.manager.submit(-1, export_format="csv")
+        task = job.task
+        assert task is not None
+
+        response = await client.get(f"/expenses/export/jobs/{job.id}", headers=auth_headers)
+
+        assert response.status_code == 404
+        await task
+
+
+class TestExportCache:
+    """Test the on-disk export cache."""
+
+    @pytest.mark.asyncio
+    async def test_repeat_export_is_served_from_cache(self, client, auth_headers):
+        """Without writes in between, a repeat export reuses the file and its ETag."""
+        response = await client.post("/categories", json={"name": "Cached"}, headers=auth_headers)
+        category_id = response.json()["id"]
+        await client.post(
+            "/expenses",
+            json={"category_id": category_id, "amount": 4, "created_at": "2024-06-03T10:00:00"},
+            headers=auth_headers,
+        )
+        params = {"format": "csv", "start_date": "2024-06-01", "end_date": "2024-06-30"}
+
+        first = await client.get("/expenses/export", params=params, headers=auth_headers)
+        second = await client.get("/expenses/export", params=params, headers=auth_headers)
+
+        assert first.status_code == second.status_code == 200
+        assert second.headers["etag"] == first.headers["etag"]
+        assert second.content == first.content
+        assert export_cache.get(first.headers["etag"].strip('"')) is not None
+
+        not_modified = await client.get(
+            "/expenses/export", params=params, headers={**auth_headers, "If-None-Match": first.headers["etag"]}
+        )
+        assert not_modified.status_code == 304
+
+        await client.post(
+            "/expenses",
+            json={"category_id": category_id, "amount": 6, "created_at": "2024-06-04T10:00:00"},
+            headers=auth_headers,
+        )
+        third = await client.get(
+            "/expenses/export", params=params, headers={**auth_headers, "If-None-Match": first.headers["etag"]}
+        )
+        assert third.status_code == 200
+        assert third.headers["etag"] != first.headers["etag"]
+        assert third.text.splitlines()[1] == "Cached,10.00 €"
+
+    @pytest.mark.asyncio
+    async def test_data_version_changes_again_on_commit(self, client, auth_headers, db_session):
+        """An export stored between a write and its commit is not served after the commit."""
+        category_id = (await client.post("/categories", json={"name": "Commit"}, headers=auth_headers)).json()["id"]
+        user_id = (
+            await db_session.execute(select(models.Category.user_id).where(models.Category.id == category_id))
+        ).scalar_one()
+
+        before = data_version(user_id)
+        await crud.create_expense(db_session, schemas.ExpenseCreate(category_id=category_id, amount=3, currency="EUR"), user_id)
+        # Une exportation lancée ici lit encore les lignes d'avant l'écriture
+        pending = data_version(user_id)
+        await db_session.commit()
+
+        assert len({before, pending, data_version(user_id)}) == 3
+
+    @pytest.mark.asyncio
+    async def test_data_version_changes_again_when_a_rename_commits(self, client, auth_headers, db_session):
+        """Exported rows embed category paths: a rename committed after an export was stored invalidates it."""
+        category_id = (await client.post("/categories", json={"name": "Avant"}, headers=auth_headers)).json()["id"]
+        user_id = (
+            await db_session.execute(select(models.Category.user_id).where(models.Category.id == category_id))
+        ).scalar_one()
+
+        before = data_version(user_id)
+        await crud.update_category(db_session, category_id, schemas.CategoryUpdate(name="Après"), user_id)
+        # Une exportation lancée ici lit encore l'ancien chemin
+        pending = data_version(user_id)
+        await db_session.commit()
+
+        assert len({before, pending, data_version(user_id)}) == 3
+
+    @pytest.mark.asyncio
+    async def test_least_recently_used_files_are_evicted(self, tmp_path):
+        """The cache directory stays within its byte budget."""
+        cache = ExportCache(str(tmp_path), max_bytes=25)
+
+        async def chunks(payload):
+            yield payload
+
+        for key in ("a", "b"):
+            async for _ in cache.store(key, ".csv", chunks(b"x" * 10)):
+                pass
+        assert cache.get("a") is not None
+        async for _ in cache.store("c", ".csv", chunks(b"x" * 10)):
+            pass
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.get("c") is not None
+        assert cache.size == 20
+        assert sorted(path.name for path in tmp_path.iterdir()) == ["a.csv", "c.csv"]
+
+
+class TestColumnarExports:
+    """Test NDJSON and Arrow/Parquet exports."""
+
+    async def _seed(self, client, headers):
+        response = await client.post("/categories", json={"name": "Columns"}, headers=headers)
+        category_id = response.json()["id"]
+        for day, amount in ((1, "12.50"), (2, "7.25")):
+            await client.post(
+                "/expenses",
+                json={"category_id": category_id, "amount": amount, "note": f"n{day}", "created_at": f"2024-07-0{day}T09:30:00"},
+                headers=headers,
+            )
+
+    @pytest.mark.asyncio
+    async def test_ndjson_export(self, client, auth_headers):
+        """Each line is a JSON document produced by the database."""
+        await self._seed(client, auth_headers)
+
+        response = await client.get(
+            "/expenses/export",
+            params={"format": "ndjson", "start_date": "2024-07-01", "end_date": "2024-07-31"},
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        documents = [json.loads(line) for line in response.text.splitlines()]
+        assert [(doc["category"], doc["amount"], doc["note"]) for doc in documents] == [
+            ("Columns", 7.25, "n2"),
+            ("Columns", 12.5, "n1"),
+        ]
+        assert documents[0]["created_at"].startswith("2024-07-02T09:30:00")
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("export_format", ["arrow", "parquet"])
+    async def test_arrow_and_parquet_exports(self, client, auth_headers, export_format):
+        """Arrow IPC and Parquet exports carry typed columns."""
+        pa = pytest.importorskip("pyarrow")
+        pq = pytest.importorskip("pyarrow.parquet")
+        await self._seed(client, auth_headers)
+
+        response = await client.get(
+            "/expenses/export",
+            params={"format": export_format, "start_date": "2024-07-01", "end_date": "2024-07-31"},
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 200
+        if export_format == "parquet":
+            table = pq.read_table(pa.BufferReader(response.content))
+        else:
+            table = pa.ipc.open_stream(response.content).read_all()
+        assert table.column_names == ["category", "id", "amount", "note", "created_at", "currency"]
+        assert [str(value) for value in table.column("amount").to_pylist()] == ["7.25", "12.50"]
+        assert table.column("created_at").to_pylist()[0].isoformat() == "2024-07-02T09:30:00+00:00"
+
+
+class TestBulkExpenses:
+    """Test bulk expense creation."""
+
+    @pytest.mark.asyncio
+    async def test_bulk_create_reports_each_item(self, client, auth_headers):
+        """Valid items are inserted; invalid ones are reported without failing the batch."""
+        response = await client.post("/categories", json={"name": "Bulk import"}, headers=auth_headers)
+        category_id = response.json()["id"]
+
+        response = await client.post(
+            "/expenses/bulk",
+            json={
+                "items": [
+                    {"category_id": category_id, "amount": 10, "created_at": "2024-08-01T10:00:00"},
+                    {"category_id": category_id, "amount": -5},
+                    {"category_id": 999_999, "amount": 3},
+                    {"category_id": category_id, "amount": 2.5, "note": "no date"},
+                ]
+            },
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert (data["created"], data["failed"]) == (2, 2)
+        statuses = [(item["index"], item["status"]) for item in data["items"]]
+        assert statuses == [(0, "created"), (1, "error"), (2, "error"), (3, "created")]
+        assert data["items"][1]["error"].startswith("amount")
+        assert data["items"][2]["error"] == "Category not found"
+
+        summary = await client.get(
+            "/summary",
+            params={"start_date": "2024-08-01", "end_date": "2024-08-31"},
+            headers=auth_headers,
+        )
+        assert summary.json()["category_totals"]["Bulk import"] == 10.0
+
+    @pytest.mark.asyncio
+    async def test_bulk_create_large_batch(self, client, auth_headers):
+        """Batches larger than one multi-row INSERT page are inserted in full."""
+        response = await client.post("/categories", json={"name": "Big batch"}, headers=auth_headers)
+        category_id = response.json()["id"]
+        items = [
+            {"category_id": category_id, "amount": 1, "created_at": f"2024-09-{1 + index % 28:02d}T08:00:00"}
+            for index in range(2500)
+        ]
+
+        response = await client.post("/expenses/bulk", json={"items": items}, headers=auth_headers)
+
+        assert response.json()["created"] == 2500
+        ids = [item["id"] for item in response.json()["items"]]
+        assert len(set(ids)) == 2500
+        listing = await client.get(
+            f"/categories/{category_id}/expenses",
+            params={"start_date": "2024-09-01", "end_date": "2024-09-30", "per_page": 1},
+            headers=auth_headers,
+        )
+        assert listing.json()["meta"]["total"] == 2500
+
+
+class TestSetBasedExpenseWrites:
+    """Test filter-based deletion and recategorization."""
+
+    async def _setup(self, client, headers):
+        source = (await client.post("/categories", json={"name": "Ancienne"}, headers=headers)).json()["id"]
+        target = (await client.post("/categories", json={"name": "Nouvelle"}, headers=headers)).json()["id"]
+        items = [
+            {"category_id": source, "amount": 10, "created_at": "2024-10-05T08:00:00"},
+            {"category_id": source, "amount": 20, "created_at": "2024-10-20T08:00:00"},
+            {"category_id": source, "amount": 5, "created_at": "2024-11-02T08:00:00"},
+            {"category_id": target, "amount": 1, "created_at": "2024-10-07T08:00:00"},
+        ]
+        response = await client.post("/expenses/bulk", json={"items": items}, headers=headers)
+        return source, target, [item["id"] for item in response.json()["items"]]
+
+    async def _user_id(self, db_session, expense_id):
+        return (
+            await db_session.execute(select(models.Expense.user_id).where(models.Expense.id == expense_id))
+        ).scalar_one()
+
+    @pytest.mark.asyncio
+    async def test_recategorize_moves_matching_expenses(self, client, auth_headers, db_session):
+        """Only the expenses of the source category in the range move; rollups follow."""
+        source, target, ids = await self._setup(client, auth_headers)
+        user_id = await self._user_id(db_session, ids[0])
+
+        response = await client.post(
+            "/expenses/recategorize",
+            json={
+                "from_category_id": source,
+                "to_category_id": target,
+                "start_date": "2024-10-01",
+                "end_date": "2024-10-31",
+            },
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 200
+        assert response.json() == {"affected": 2}
+        summary = await client.get(
+            "/summary", params={"start_date": "2024-10-01", "end_date": "2024-10-31"}, headers=auth_headers
+        )
+        assert summary.json()["category_totals"] == {"Ancienne": 0.0, "Nouvelle": 31.0}
+        assert await rollups.verify(db_session, user_id) == []
+
+    @pytest.mark.asyncio
+    async def test_recategorize_to_unknown_category(self, client, auth_headers):
+        source, _, _ = await self._setup(client, auth_headers)
+        response = await client.post(
+            "/expenses/recategorize",
+            json={"from_category_id": source, "to_category_id": 999_999},
+            headers=auth_headers,
+        )
+        assert response.status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_delete_by_filter(self, client, auth_headers, db_session):
+        """DELETE /expenses removes the matching rows only and keeps rollups exact."""
+        source, target, ids = await self._setup(client, auth_headers)
+        user_id = await self._user_id(db_session, ids[0])
+
+        response = await client.delete(
+            "/expenses", params={"category_id": source, "end_date": "2024-10-31"}, headers=auth_headers
+        )
+
+        assert response.json() == {"affected": 2}
+        listing = await client.get(
+            "/expenses", params={"start_date": "2024-01-01", "end_date": "2024-12-31"}, headers=auth_headers
+        )
+        assert sorted(item["id"] for item in listing.json()["items"]) == sorted(ids[2:])
+        assert await rollups.verify(db_session, user_id) == []
+
+    @pytest.mark.asyncio
+    async def test_multi_year_writes_use_a_fixed_number_of_statements(
+        self, client, auth_headers, test_db, db_session
+    ):
+        """Rollup deltas come from RETURNING and are applied with one upsert, whatever the number of months."""
+        first = (await client.post("/categories", json={"name": "Années A"}, headers=auth_headers)).json()["id"]
+        second = (await client.post("/categories", json={"name": "Années B"}, headers=auth_headers)).json()["id"]
+        target = (await client.post("/categories", json={"name": "Années C"}, headers=auth_headers)).json()["id"]
+        items = [
+            {
+                "category_id": category_id,
+                "amount": 2,
+                "created_at": f"{2020 + month // 12}-{1 + month % 12:02d}-10T08:00:00",
+            }
+            for month in range(36)
+            for category_id in (first, second)
+        ]
+        response = await client.post("/expenses/bulk", json={"items": items}, headers=auth_headers)
+        user_id = await self._user_id(db_session, response.json()["items"][0]["id"])
+        await crud.category_paths(db_session, user_id)
+
+        statements: list[str] = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(test_db.sync_engine, "before_cursor_execute", record)
+        try:
+            moved = await crud.recategorize_expenses(
+                db_session, user_id, target, start_date=datetime(2020, 1, 1), end_date=datetime(2021, 12, 31)
+            )
+            # Catégories sources, un UPDATE ... RETURNING par source, l'upsert, la purge
+            assert (moved, len(statements)) == (48, 5)
+
+            statements.clear()
+            deleted = await crud.delete_expenses(db_session, user_id, start_date=datetime(2020, 1, 1))
+            # DELETE ... RETURNING, l'upsert, la purge
+            assert (deleted, len(statements)) == (72, 3)
+        finally:
+            event.remove(test_db.sync_engine, "before_cursor_execute", record)
+        await db_session.commit()
+        assert await rollups.verify(db_session, user_id) == []
+
+    @pytest.mark.asyncio
+    async def test_delete_requires_a_filter(self, client, auth_headers):
+        response = await client.delete("/expenses", headers=auth_headers)
+        assert response.status_code == 400
+
+
+class TestSubtreeFilters:
+    """Test include_descendants on search, summary and export."""
+
+    @pytest.mark.asyncio
+    async def test_parent_filter_includes_descendants(self, client, auth_headers):
+        home = (await client.post("/categories", json={"name": "Home"}, headers=auth_headers)).json()["id"]
+        rent = (
+            await client.post("/categories", json={"name": "Rent", "parent_id": home}, headers=auth_headers)
+        ).json()["id"]
+        power = (
+            await client.post("/categories", json={"name": "Power", "parent_id": rent}, headers=auth_headers)
+        ).json()["id"]
+        food = (await client.post("/categories", json={"name": "Food"}, headers=auth_headers)).json()["id"]
+        for category_id, amount in ((home, 1.0), (rent, 2.0), (power, 4.0), (food, 8.0)):
+            await client.post(
+                "/expenses",
+                json={"category_id": category_id, "amount": amount, "created_at": "2024-09-09T09:00:00"},
+                headers=auth_headers,
+            )
+        params = {"category_id": rent, "start_date": "2024-09-01", "end_date": "2024-09-30"}
+
+        exact = await client.get("/expenses", params=params, headers=auth_headers)
+        subtree = await client.get("/expenses", params={**params, "include_descendants": True}, headers=auth_headers)
+        assert [item["amount"] for item in exact.json()["items"]] == [2.0]
+        assert sorted(item["amount"] for item in subtree.json()["items"]) == [2.0, 4.0]
+
+        summary = await client.get(
+            "/summary", params={**params, "category_id": home, "include_descendants": True}, headers=auth_headers
+        )
+        assert summary.json()["category_totals"] == {"Home": 1.0, "Home / Rent": 2.0, "Home / Rent / Power": 4.0}
+
+        export = await client.get(
+            "/expenses/export", params={**params, "include_descendants": True}, headers=auth_headers
+        )
+        assert export.text.splitlines()[1:3] == ["Home / Rent,2.00 €", "Home / Rent / Power,4.00 €"]
+
+
+class TestNoteSearch:
+    """Test full-text search over expense notes."""
+
+    @pytest.mark.asyncio
+    async def test_search_ranks_and_combines_with_filters(self, client, auth_headers):
+        travel = (await client.post("/categories", json={"name": "Travel"}, headers=auth_headers)).json()["id"]
+        food = (await client.post("/categories", json={"name": "Food"}, headers=auth_headers)).json()["id"]
+        created = {}
+        for category_id, note, created_at in (
+            (travel, "Uber aéroport", "2024-02-01T08:00:00"),
+            (travel, "Uber Uber retour tardif", "2024-02-02T23:00:00"),
+            (food, "Uber Eats pizza", "2024-02-03T20:00:00"),
+            (travel, "Train Lyon", "2024-02-04T08:00:00"),
+        ):
+            response = await client.post(
+                "/expenses",
+                json={"category_id": category_id, "amount": 10, "note": note, "created_at": created_at},
+                headers=auth_headers,
+            )
+            created[note] = response.json()["id"]
+
+        async def search(**params):
+            response = await client.get("/expenses", params=params, headers=auth_headers)
+            assert response.status_code == 200
+            return response.json()
+
+        found = await search(q="uber")
+        # Rang BM25 d'abord : la note qui répète le terme sort en tête
+        assert [item["note"] for item in found["items"]][0] == "Uber Uber retour tardif"
+        assert found["meta"]["total"] == 3
+
+        assert [item["note"] for item in (await search(q="ube", category_id=food))["items"]] == ["Uber Eats pizza"]
+        # Accents ignorés, tous les mots requis, opérateurs neutralisés
+        assert [item["note"] for item in (await search(q="AEROPORT uber"))["items"]] == ["Uber aéroport"]
+        assert (await search(q='uber "NOT eats'))["meta"]["total"] == 0
+
+        page = await search(q="uber", per_page=2, page=2)
+        assert (len(page["items"]), page["meta"]["total"]) == (1, 3)
+
+        await client.patch(f"/expenses/{created['Train Lyon']}", json={"note": "Uber gare"}, headers=auth_headers)
+        await client.delete(f"/expenses/{created['Uber Eats pizza']}", headers=auth_headers)
+        notes = sorted(item["note"] for item in (await search(q="uber"))["items"])
+        assert notes == ["Uber Uber retour tardif", "Uber aéroport", "Uber gare"]
+
+    def test_postgresql_query_matches_unaccented_index(self):
+        """The tsquery is unaccented like the indexed tsvector, so accents are ignored there too."""
+        compiled = str(crud._note_matches("postgresql", ["aéroport"]).element.compile(dialect=postgresql.dialect()))
+
+        assert models.EXPENSE_NOTES_TSVECTOR in compiled
+        assert f"to_tsquery('simple'::regconfig, {models.EXPENSE_NOTES_UNACCENT}(" in compiled
+
+
+class TestAmountAndCategoryFilters:
+    """Test amount ranges, several categories and amount ordering on GET /expenses."""
+
+    @pytest.mark.asyncio
+    async def test_filters_and_sorts(self, client, auth_headers):
+        ids = {}
+        for name in ("Bus", "Taxi", "Cinéma"):
+            ids[name] = (await client.post("/categories", json={"name": name}, headers=auth_headers)).json()["id"]
+        for name, amount, created_at in (
+            ("Bus", 2.0, "2024-03-01T08:00:00"),
+            ("Taxi", 35.0, "2024-03-02T08:00:00"),
+            ("Taxi", 12.0, "2024-03-03T08:00:00"),
+            ("Cinéma", 12.0, "2024-03-04T08:00:00"),
+        ):
+            await client.post(
+                "/expenses",
+                json={"category_id": ids[name], "amount": amount, "created_at": created_at},
+                headers=auth_headers,
+            )
+
+        async def amounts(**params):
+            response = await client.get("/expenses", params=params, headers=auth_headers)
+            assert response.status_code == 200
+            return [item["amount"] for item in response.json()["items"]]
+
+        assert await amounts(category_id=[ids["Bus"], ids["Taxi"]]) == [12.0, 35.0, 2.0]
+        assert await amounts(category_id=[ids["Taxi"]], min_amount=20) == [35.0]
+        assert await amounts(min_amount=10, max_amount=12) == [12.0, 12.0]
+        assert await amounts(sort="amount_desc") == [35.0, 12.0, 12.0, 2.0]
+        assert await amounts(sort="amount_asc", category_id=[ids["Taxi"], ids["Cinéma"]]) == [12.0, 12.0, 35.0]
+        assert await amounts(sort="oldest", min_amount=5) == [35.0, 12.0, 12.0]
+
+        response = await client.get("/expenses", params={"min_amount": 10, "max_amount": 5}, headers=auth_headers)
+        assert response.status_code == 400
+
+    @pytest.mark.asyncio
+    async def test_every_filter_combination_uses_its_index(self, tmp_path):
+        """With statistics from ANALYZE, each filter set is served by the expected index."""
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'plans.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+        rng = random.Random(1)
+        async with factory() as session:
+            # Deux utilisateurs, 40 catégories et 20 000 dépenses sur trois ans
+            await session.execute(
+                insert(models.User),
+                [{"id": user_id, "username": f"plan{user_id}", "email": f"plan{user_id}@example.com",
+                  "hashed_password": "x"} for user_id in (1, 2)],
+            )
+            await session.execute(
+                insert(models.Category),
+                [{"id": category_id, "name": f"C{category_id}", "user_id": 1 + category_id % 2,
+                  "full_path": f"C{category_id}", "depth": 0} for category_id in range(1, 41)],
+            )
+            await category_tree.rebuild(session)
+            rows = []
+            for _ in range(20_000):
+                category_id = rng.randint(1, 40)
+                rows.append(
+                    {
+                        "category_id": category_id,
+                        "user_id": 1 + category_id % 2,
+                        "amount": round(rng.uniform(1, 200), 2),
+                        "currency": "EUR",
+                        "created_at": datetime(2022, 1, 1) + timedelta(minutes=rng.randrange(3 * 525_600)),
+                    }
+                )
+            await session.execute(insert(models.Expense), rows)
+            await session.commit()
+            await session.execute(text("ANALYZE"))
+
+            start, end = datetime(2024, 1, 1), datetime(2024, 2, 1)
+            expected = [
+                ({}, "idx_expenses_user_created"),
+                ({"category_id": 1}, "idx_expenses_user_category_created"),
+                # Pour une liste IN, ni l'un ni l'autre index de catégorie ne
+                # fournit l'ordre : (category_id, user_id) est équivalent
+                ({"category_id": [1, 3]}, "idx_expenses_category_user"),
+                ({"category_id": [1, 3], "start_date": start, "end_date": end}, "idx_expenses_user_category_created"),
+                ({"category_id": [1, 3], "include_descendants": True}, "idx_expenses_user_created"),
+                ({"start_date": start, "end_date": end}, "idx_expenses_user_created"),
+                ({"start_date": start, "sort": "oldest"}, "idx_expenses_user_created"),
+                ({"sort": "amount_desc"}, "idx_expenses_user_amount"),
+                ({"min_amount": 5, "max_amount": 10, "sort": "amount_desc"}, "idx_expenses_user_amount"),
+                ({"min_amount": 190, "max_amount": 195}, "idx_expenses_user_amount"),
+                # Borne peu sélective : parcourir par date jusqu'à la limite coûte moins
+                ({"min_amount": 5}, "idx_expenses_user_created"),
+            ]
+            dialect = engine.dialect
+            for filters, index_name in expected:
+                query = crud._expense_search_query(dialect.name, 1, **filters).limit(51)
+                sql = str(query.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+                plan = [row[3] for row in await session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+                # Un parcours sans index s'affiche « SCAN <table> » sans « USING »
+                assert not [step for step in plan if step.startswith("SCAN") and "USING" not in step], (filters, plan)
+                assert any(step.startswith(f"SEARCH expenses USING INDEX {index_name} ") for step in plan), (
+                    filters,
+                    plan,
+                )
+                if filters.get("sort") == "amount_desc" or not filters:
+                    # L'index fournit aussi l'ordre : pas de tri temporaire
+                    assert "USE TEMP B-TREE FOR ORDER BY" not in plan, (filters, plan)
+        await engine.dispose()
+
+
+class TestNoteSuggestions:
+    """Test note autocomplete and its in-memory prefix index."""
+
+    @pytest.mark.asyncio
+    async def test_suggestions_follow_writes(self, client, auth_headers):
+        category = (await client.post("/categories", json={"name": "Courses"}, headers=auth_headers)).json()["id"]
+
+        async def create(note):
+            response = await client.post(
+                "/expenses", json={"category_id": category, "amount": 5, "note": note}, headers=auth_headers
+            )
+            return response.json()["id"]
+
+        ids = {note: await create(note) for note in ("Carrefour", "Carrefour", "carrefour  ", "Casino", "Café du coin")}
+
+        async def suggest(prefix, **params):
+            response = await client.get(
+                "/expenses/notes/suggest", params={"prefix": prefix, **params}, headers=auth_headers
+            )
+            assert response.status_code == 200
+            return response.json()["suggestions"]
+
+        # Casse et espaces ignorés, graphie la plus fréquente affichée ; à fréquence égale, la plus courte
+        assert await suggest("CA") == ["Carrefour", "Casino", "Café du coin"]
+        assert await suggest("ca", limit=1) == ["Carrefour"]
+        assert await suggest("x") == []
+
+        # Index mis à jour par les écritures, sans reconstruction
+        casino = await create("Casino")
+        await create("Casino")
+        assert (await suggest("cas")) == ["Casino"]
+        assert (await suggest("ca"))[0] == "Casino"
+        await client.patch(f"/expenses/{casino}", json={"note": "Monoprix"}, headers=auth_headers)
+        await client.delete(f"/expenses/{ids['Café du coin']}", headers=auth_headers)
+        assert await suggest("mono") == ["Monoprix"]
+        assert await suggest("caf") == []
+
+        await client.request("DELETE", "/expenses", params={"category_id": category}, headers=auth_headers)
+        assert await suggest("") == []
+
+    def test_index_is_bounded_and_ignores_stale_builds(self):
+        index = NoteSuggestIndex(max_users=2)
+        for user_id in (1, 2):
+            index.store(user_id, UserNotes([("Loyer", 1)]), index.generation(user_id))
+        index.get(1)
+        index.store(3, UserNotes([]), index.generation(3))
+        # L'utilisateur le moins récemment servi est évincé
+        assert (index.get(1) is not None, index.get(2), index.get(3) is not None) == (True, None, True)
+
+        generation = index.generation(2)
+        index.apply(2, [("Loyer", 1)])
+        index.store(2, UserNotes([("Loyer", 1)]), generation)
+        assert index.get(2) is None
+
+        notes = index.get(1)
+        assert notes is not None
+        index.apply(1, [("loyer", 2), ("Loyer", -1)])
+        assert (len(notes), notes.suggest("LOY", 5)) == (1, ["loyer"])
+        index.apply(1, [("loyer", -2)])
+        assert len(notes) == 0
+
+
+class TestWriteRoundTrips:
+    """Count the statements sent to the database by single-expense writes."""
+
+    @pytest.mark.asyncio
+    async def test_writes_use_returning(self, client, auth_headers, test_db, db_session):
+        category = (await client.post("/categories", json={"name": "Comptée"}, headers=auth_headers)).json()
+        user_id = (
+            await db_session.execute(select(models.Category.user_id).where(models.Category.id == category["id"]))
+        ).scalar_one()
+        # Réchauffer le cache des chemins de catégories
+        await crud.category_paths(db_session, user_id)
+
+        statements: list[str] = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(test_db.sync_engine, "before_cursor_execute", record)
+        try:
+            created = await crud.create_expense(
+                db_session,
+                schemas.ExpenseCreate(
+                    category_id=category["id"], amount=12.5, currency="EUR", created_at=datetime(2024, 3, 4)
+                ),
+                user_id,
+            )
+            # INSERT ... RETURNING puis l'agrégat mensuel
+            assert len(statements) == 2
+            assert created.category_path == "Comptée"
+
+            statements.clear()
+            updated = await crud.update_expense(db_session, created.id, schemas.ExpenseUpdate(amount=20), user_id)
+            # Ancienne ligne, UPDATE ... RETURNING, delta de l'agrégat
+            assert len(statements) == 3
+            assert updated is not None and float(updated.amount) == 20
+
+            statements.clear()
+            assert await crud.delete_expense(db_session, created.id, user_id)
+            # DELETE ... RETURNING, agrégat décrémenté puis purgé s'il est vide
+            assert len(statements) == 3
+        finally:
+            event.remove(test_db.sync_engine, "before_cursor_execute", record)
+        await db_session.commit()
+        assert await rollups.verify(db_session, user_id) == []
+
+
+class TestExpenseImport:
+    """Test streaming CSV/XLSX imports."""
+
+    async def _wait_for(self, client, headers, job_id):
+        for _ in range(200):
+            response = await client.get(f"/expenses/import/jobs/{job_id}", headers=headers)
+            assert response.status_code == 200
+            if response.json()["status"] in ("done", "failed"):
+                return response.json()
+            await asyncio.sleep(0.02)
+        raise AssertionError("import job did not finish")
+
+    @pytest.mark.asyncio
+    async def test_csv_import_creates_categories_and_reports_errors(self, client, auth_headers, monkeypatch):
+        """Rows are inserted chunk by chunk, nested categories are created and bad rows reported."""
+        monkeypatch.setattr(import_jobs.manager, "chunk_size", 2)
+        response = await client.post("/categories", json={"name": "Maison"}, headers=auth_headers)
+        existing_id = response.json()["id"]
+
+        content = (
+            "Résumé\n"
+            "Maison,10.00 €\n"
+            "\n"
+            "Catégorie,ID,Montant,Note,Date\n"
+            "maison,1,\"12,50\",Loyer,2024-03-01T10:00:00\n"
+            "Loisirs / Cinéma,2,8.00,Séance,2024-03-02T20:00:00\n"
+            "Loisirs / Cinéma,3,abc,Invalide,2024-03-03T20:00:00\n"
+            ",4,5.00,Sans catégorie,\n"
+            "Sport / Piscine,5,-3,Négatif,\n"
+        )
+        response = await client.post(
+            "/expenses/import",
+            files={"file": ("depenses.csv", content.encode("utf-8"), "text/csv")},
+            headers=auth_headers,
+        )
+        assert response.status_code == 202
+        job = await self._wait_for(client, auth_headers, response.json()["id"])
+
+        assert job["status"] == "done"
+        assert job["progress"] == 1.0
+        assert (job["rows_processed"], job["rows_imported"], job["rows_failed"]) == (5, 2, 3)
+        assert job["categories_created"] == 2
+
+        expenses = (await client.get("/expenses", headers=auth_headers)).json()["items"]
+        by_note = {expense["note"]: expense for expense in expenses}
+        assert by_note["Loyer"]["category_id"] == existing_id
+        assert by_note["Loyer"]["amount"] == 12.5
+        assert by_note["Séance"]["category_path"] == "Loisirs / Cinéma"
+
+        categories = (await client.get("/categories", headers=auth_headers)).json()["items"]
+        loisirs = next(category for category in categories if category["name"] == "Loisirs")
+        assert [child["full_path"] for child in loisirs["children"]] == ["Loisirs / Cinéma"]
+        # Une ligne rejetée ne crée pas sa catégorie
+        assert {category["name"] for category in categories} == {"Maison", "Loisirs"}
+
+        report = await client.get(job["errors_url"], headers=auth_headers)
+        assert report.status_code == 200
+        lines = report.text.splitlines()
+        assert lines[0] == "Ligne,Erreur,Valeurs"
+        assert [line.split(",")[0] for line in lines[1:]] == ["7", "8", "9"]
+        assert "Missing category" in lines[2]
+
+    @pytest.mark.asyncio
+    async def test_xlsx_import_reads_details_sheet(self, client, auth_headers):
+        """An XLSX file is read in read-only mode from its "Détails" sheet."""
+        workbook = Workbook()
+        summary = workbook.active
+        assert summary is not None
+        summary.title = "Résumé"
+        summary.append(["Catégorie", "Total (€)"])
+        sheet = workbook.create_sheet("Détails")
+        sheet.append(["Catégorie", "ID", "Montant", "Note", "Date", "Devise"])
+        sheet.append(["Voyages", 1, 120.0, "Train", datetime(2024, 4, 1, 9, 0), "CHF"])
+        sheet.append(["Voyages / Hôtel", 2, 80.5, "Nuit", datetime(2024, 4, 1, 22, 0), None])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+
+        response = await client.post(
+            "/expenses/import",
+            files={"file": ("depenses.xlsx", buffer.getvalue(), "application/octet-stream")},
+            headers=auth_headers,
+        )
+        assert response.status_code == 202
+        job = await self._wait_for(client, auth_headers, response.json()["id"])
+
+        assert job["status"] == "done"
+        assert (job["rows_imported"], job["rows_failed"]) == (2, 0)
+        expenses = (await client.get("/expenses", headers=auth_headers)).json()["items"]
+        assert {(expense["category_path"], expense["currency"]) for expense in expenses} == {
+            ("Voyages", "CHF"),
+            ("Voyages / Hôtel", "EUR"),
+        }
+
+    @pytest.mark.asyncio
+    async def test_unsupported_file_is_rejected(self, client, auth_headers):
+        response = await client.post(
+            "/expenses/import",
+            files={"file": ("notes.pdf", b"%PDF-1.4", "application/pdf")},
+            headers=auth_headers,
+        )
+        assert response.status_code == 400
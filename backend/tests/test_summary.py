@@ -0,0 +1,458 @@
+"""Tests for expense summaries and monthly rollups."""
+
+import json
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import event, select
+
+from app import models, rollups
+
+
+class TestSummary:
+    """Test period summaries."""
+
+    @pytest.mark.asyncio
+    async def test_summary_filters_period_and_keeps_empty_categories(self, client, auth_headers):
+        """Only expenses inside the period count, and unused categories stay at zero."""
+        food = (await client.post("/categories", json={"name": "Food"}, headers=auth_headers)).json()["id"]
+        await client.post("/categories", json={"name": "Travel"}, headers=auth_headers)
+        for amount, created_at in ((12.5, "2024-03-05T10:00:00"), (7.5, "2024-03-31T23:00:00"), (99, "2024-04-01T08:00:00")):
+            await client.post(
+                "/expenses",
+                json={"category_id": food, "amount": amount, "created_at": created_at},
+                headers=auth_headers,
+            )
+
+        response = await client.get(
+            "/summary",
+            params={"start_date": "2024-03-01", "end_date": "2024-03-31"},
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"] == 20.0
+        assert data["category_totals"] == {"Food": 20.0, "Travel": 0.0}
+
+    @pytest.mark.asyncio
+    async def test_summary_combines_rollup_months_and_edge_days(self, client, auth_headers):
+        """A range spanning whole months and partial edges matches the raw expenses."""
+        food = (await client.post("/categories", json={"name": "Food"}, headers=auth_headers)).json()["id"]
+        expenses = [
+            (1.0, "2024-02-14T10:00:00"),  # avant la période
+            (2.0, "2024-02-15T00:00:00"),  # bordure de début
+            (4.0, "2024-03-10T12:00:00"),  # mois complet
+            (8.0, "2024-04-10T18:00:00"),  # bordure de fin
+            (16.0, "2024-04-11T00:00:00"),  # après la période
+        ]
+        for amount, created_at in expenses:
+            await client.post(
+                "/expenses",
+                json={"category_id": food, "amount": amount, "created_at": created_at},
+                headers=auth_headers,
+            )
+
+        response = await client.get(
+            "/summary",
+            params={"start_date": "2024-02-15", "end_date": "2024-04-10"},
+            headers=auth_headers,
+        )
+
+        assert response.json()["category_totals"] == {"Food": 14.0}
+
+
+class TestSummaryTree:
+    """Test the hierarchical summary."""
+
+    @pytest.mark.asyncio
+    async def test_parents_include_descendant_totals(self, client, auth_headers):
+        """Each node reports its own total, its subtree total and its share of the period."""
+        home = (await client.post("/categories", json={"name": "Home"}, headers=auth_headers)).json()["id"]
+        rent = (
+            await client.post("/categories", json={"name": "Rent", "parent_id": home}, headers=auth_headers)
+        ).json()["id"]
+        power = (
+            await client.post("/categories", json={"name": "Power", "parent_id": rent}, headers=auth_headers)
+        ).json()["id"]
+        food = (await client.post("/categories", json={"name": "Food"}, headers=auth_headers)).json()["id"]
+        for category_id, amount in ((home, 10.0), (rent, 50.0), (power, 15.0), (food, 25.0)):
+            await client.post(
+                "/expenses",
+                json={"category_id": category_id, "amount": amount, "created_at": "2024-03-10T10:00:00"},
+                headers=auth_headers,
+            )
+
+        response = await client.get(
+            "/summary/tree",
+            params={"start_date": "2024-03-01", "end_date": "2024-03-31"},
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"] == 100.0
+        food_node, home_node = data["categories"]
+        assert (food_node["name"], food_node["subtree_total"], food_node["percentage"]) == ("Food", 25.0, 25.0)
+        assert (home_node["own_total"], home_node["subtree_total"], home_node["percentage"]) == (10.0, 75.0, 75.0)
+        rent_node = home_node["children"][0]
+        assert (rent_node["own_total"], rent_node["subtree_total"]) == (50.0, 65.0)
+        assert rent_node["children"][0]["full_path"] == "Home / Rent / Power"
+
+        subtree = await client.get(
+            "/summary/tree",
+            params={"start_date": "2024-03-01", "end_date": "2024-03-31", "category_id": rent},
+            headers=auth_headers,
+        )
+        assert subtree.json()["total"] == 65.0
+        assert [node["name"] for node in subtree.json()["categories"]] == ["Rent"]
+
+
+class TestSummaryTimeseries:
+    """Test bucketed time series."""
+
+    async def _spend(self, client, headers, entries):
+        category = (await client.post("/categories", json={"name": "Food"}, headers=headers)).json()["id"]
+        for amount, created_at in entries:
+            await client.post(
+                "/expenses",
+                json={"category_id": category, "amount": amount, "created_at": created_at},
+                headers=headers,
+            )
+        return category
+
+    @pytest.mark.asyncio
+    async def test_daily_and_weekly_buckets_are_gap_filled(self, client, auth_headers):
+        await self._spend(
+            client,
+            auth_headers,
+            [(5.0, "2024-03-04T09:00:00"), (7.0, "2024-03-04T21:00:00"), (3.0, "2024-03-10T12:00:00")],
+        )
+        params = {"start_date": "2024-03-03", "end_date": "2024-03-11"}
+
+        daily = (
+            await client.get("/summary/timeseries", params={**params, "bucket": "day"}, headers=auth_headers)
+        ).json()
+        assert len(daily["points"]) == 9
+        assert daily["points"][0] == {"period": "2024-03-03", "total": 0.0, "count": 0}
+        assert daily["points"][1] == {"period": "2024-03-04", "total": 12.0, "count": 2}
+        assert daily["total"] == 15.0
+
+        weekly = (
+            await client.get("/summary/timeseries", params={**params, "bucket": "week"}, headers=auth_headers)
+        ).json()
+        # Les semaines commencent le lundi
+        assert [(point["period"], point["total"]) for point in weekly["points"]] == [
+            ("2024-02-26", 0.0),
+            ("2024-03-04", 15.0),
+            ("2024-03-11", 0.0),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_monthly_series_combines_rollups_and_edges(self, client, auth_headers):
+        await self._spend(
+            client,
+            auth_headers,
+            [
+                (1.0, "2024-01-10T10:00:00"),
+                (2.0, "2024-01-20T10:00:00"),
+                (4.0, "2024-02-10T10:00:00"),
+                (8.0, "2024-04-02T10:00:00"),
+            ],
+        )
+
+        response = await client.get(
+            "/summary/timeseries",
+            params={"bucket": "month", "start_date": "2024-01-15", "end_date": "2024-04-01"},
+            headers=auth_headers,
+        )
+
+        assert [(point["period"], point["total"]) for point in response.json()["points"]] == [
+            ("2024-01-01", 2.0),
+            ("2024-02-01", 4.0),
+            ("2024-03-01", 0.0),
+            ("2024-04-01", 0.0),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_max_points_downsamples_with_lttb(self, client, auth_headers):
+        pytest.importorskip("numpy")
+        await self._spend(client, auth_headers, [(500.0, "2024-06-15T10:00:00")])
+
+        response = await client.get(
+            "/summary/timeseries",
+            params={"bucket": "day", "start_date": "2024-01-01", "end_date": "2024-12-31", "max_points": 50},
+            headers=auth_headers,
+        )
+
+        data = response.json()
+        assert data["downsampled"] is True
+        assert len(data["points"]) == 50
+        # Le pic est conservé, ainsi que les extrémités de la série
+        assert {"period": "2024-06-15", "total": 500.0, "count": 1} in data["points"]
+        assert (data["points"][0]["period"], data["points"][-1]["period"]) == ("2024-01-01", "2024-12-31")
+
+
+class TestSummaryComparison:
+    """Test multi-period comparisons."""
+
+    @pytest.mark.asyncio
+    async def test_periods_are_compared_with_the_previous_one(self, client, auth_headers, test_db):
+        food = (await client.post("/categories", json={"name": "Food"}, headers=auth_headers)).json()["id"]
+        travel = (await client.post("/categories", json={"name": "Travel"}, headers=auth_headers)).json()["id"]
+        for category_id, amount, created_at in (
+            (food, 40.0, "2024-01-15T10:00:00"),
+            (food, 50.0, "2024-02-03T10:00:00"),
+            (travel, 30.0, "2024-02-20T10:00:00"),
+            (food, 9.0, "2024-03-01T10:00:00"),
+        ):
+            await client.post(
+                "/expenses",
+                json={"category_id": category_id, "amount": amount, "created_at": created_at},
+                headers=auth_headers,
+            )
+        payload = {
+            "periods": [
+                {"start_date": "2024-01-01", "end_date": "2024-01-31", "label": "janvier"},
+                {"start_date": "2024-02-01", "end_date": "2024-02-29", "label": "février"},
+                # Chevauche février : chaque période est comptée séparément
+                {"start_date": "2024-02-15", "end_date": "2024-03-10"},
+            ]
+        }
+
+        statements: list[str] = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if "expense" in statement:
+                statements.append(statement)
+
+        event.listen(test_db.sync_engine, "before_cursor_execute", record)
+        try:
+            response = await client.post("/summary/compare", json=payload, headers=auth_headers)
+        finally:
+            event.remove(test_db.sync_engine, "before_cursor_execute", record)
+
+        assert response.status_code == 200
+        assert len(statements) == 1
+        data = response.json()
+        periods = [(period["label"], period["total"], period["delta"], period["change_pct"]) for period in data["periods"]]
+        assert periods == [
+            ("janvier", 40.0, None, None),
+            ("février", 80.0, 40.0, 100.0),
+            ("2024-02-15 → 2024-03-10", 39.0, -41.0, -51.25),
+        ]
+        food_row, travel_row = data["categories"]
+        assert food_row == {
+            "category": "Food",
+            "totals": [40.0, 50.0, 9.0],
+            "deltas": [None, 10.0, -41.0],
+            "changes_pct": [None, 25.0, -82.0],
+        }
+        # Pas de variation en pourcentage depuis zéro
+        assert (travel_row["totals"], travel_row["changes_pct"]) == ([0.0, 30.0, 30.0], [None, None, 0.0])
+
+
+class TestCurrencySummaries:
+    """Test per-currency totals and conversion into a base currency."""
+
+    @pytest.fixture
+    def rates_file(self, tmp_path, monkeypatch):
+        path = tmp_path / "fx_rates.json"
+        path.write_text(json.dumps({"base": "EUR", "rates": {"USD": 0.5, "GBP": 2.0}}))
+        monkeypatch.setenv("FX_RATES_FILE", str(path))
+        return path
+
+    @pytest.mark.asyncio
+    async def test_summary_and_export_convert_into_base_currency(self, client, auth_headers, rates_file):
+        food = (await client.post("/categories", json={"name": "Food"}, headers=auth_headers)).json()["id"]
+        for amount, currency, created_at in (
+            (10.0, "EUR", "2024-05-02T10:00:00"),
+            (20.0, "USD", "2024-05-03T10:00:00"),
+            (4.0, "GBP", "2024-05-04T10:00:00"),
+            (100.0, "JPY", "2024-05-05T10:00:00"),
+        ):
+            await client.post(
+                "/expenses",
+                json={"category_id": food, "amount": amount, "currency": currency, "created_at": created_at},
+                headers=auth_headers,
+            )
+        params = {"start_date": "2024-05-01", "end_date": "2024-05-31"}
+
+        summary = (await client.get("/summary", params=params, headers=auth_headers)).json()
+        assert summary["base_currency"] == "EUR"
+        assert summary["currency_totals"] == {"EUR": 10.0, "GBP": 4.0, "JPY": 100.0, "USD": 20.0}
+        # Pas de taux pour le yen : exclu du total converti et signalé
+        assert summary["missing_rates"] == ["JPY"]
+        assert summary["category_totals"] == {"Food": 28.0}
+
+        in_usd = (
+            await client.get("/summary", params={**params, "base_currency": "USD"}, headers=auth_headers)
+        ).json()
+        assert in_usd["category_totals"] == {"Food": 56.0}
+
+        unknown = await client.get("/summary", params={**params, "base_currency": "CHF"}, headers=auth_headers)
+        assert unknown.status_code == 400
+
+        export = await client.get("/expenses/export", params={**params, "format": "csv"}, headers=auth_headers)
+        lines = export.text.splitlines()
+        assert lines[1] == "Food,28.00 €"
+        details = [line.split(",") for line in lines[lines.index("Catégorie,ID,Montant,Note,Date,Devise") + 1 :]]
+        assert sorted((row[2], row[5]) for row in details) == [
+            ("10.00", "EUR"), ("100.00", "JPY"), ("20.00", "USD"), ("4.00", "GBP")
+        ]
+
+
+    @pytest.mark.asyncio
+    async def test_tree_timeseries_and_comparison_convert_into_base_currency(
+        self, client, auth_headers, rates_file
+    ):
+        """The other summaries convert per currency and report missing rates like /summary."""
+        food = (await client.post("/categories", json={"name": "Food"}, headers=auth_headers)).json()["id"]
+        snacks = (
+            await client.post("/categories", json={"name": "Snacks", "parent_id": food}, headers=auth_headers)
+        ).json()["id"]
+        for category_id, amount, currency, created_at in (
+            (food, 10.0, "EUR", "2024-05-02T10:00:00"),
+            (snacks, 20.0, "USD", "2024-05-03T10:00:00"),
+            (snacks, 4.0, "GBP", "2024-06-10T10:00:00"),
+            (food, 100.0, "JPY", "2024-06-11T10:00:00"),
+        ):
+            await client.post(
+                "/expenses",
+                json={"category_id": category_id, "amount": amount, "currency": currency, "created_at": created_at},
+                headers=auth_headers,
+            )
+        # Mai partiel (dépenses brutes), juin complet (agrégats mensuels)
+        params = {"start_date": "2024-05-02", "end_date": "2024-06-30"}
+
+        tree = (await client.get("/summary/tree", params=params, headers=auth_headers)).json()
+        assert (tree["base_currency"], tree["missing_rates"], tree["total"]) == ("EUR", ["JPY"], 28.0)
+        [root] = tree["categories"]
+        assert (root["own_total"], root["subtree_total"]) == (10.0, 28.0)
+        assert root["children"][0]["own_total"] == 18.0
+        in_usd = (
+            await client.get("/summary/tree", params={**params, "base_currency": "USD"}, headers=auth_headers)
+        ).json()
+        assert in_usd["total"] == 56.0
+
+        series = (await client.get("/summary/timeseries", params=params, headers=auth_headers)).json()
+        assert series["missing_rates"] == ["JPY"]
+        assert [(point["total"], point["count"]) for point in series["points"]] == [(20.0, 2), (8.0, 2)]
+        unknown = await client.get(
+            "/summary/timeseries", params={**params, "base_currency": "CHF"}, headers=auth_headers
+        )
+        assert unknown.status_code == 400
+
+        response = await client.post(
+            "/summary/compare",
+            json={
+                "periods": [
+                    {"start_date": "2024-05-01T00:00:00", "end_date": "2024-05-31T00:00:00"},
+                    {"start_date": "2024-06-01T00:00:00", "end_date": "2024-06-30T00:00:00"},
+                ],
+                "base_currency": "USD",
+            },
+            headers=auth_headers,
+        )
+        comparison = response.json()
+        assert (comparison["base_currency"], comparison["missing_rates"]) == ("USD", ["JPY"])
+        assert [period["total"] for period in comparison["periods"]] == [40.0, 16.0]
+        assert {category["category"]: category["totals"] for category in comparison["categories"]} == {
+            "Food": [20.0, 0.0],
+            "Food / Snacks": [20.0, 16.0],
+        }
+
+
+class TestMonthlyRollups:
+    """Test that monthly rollups follow expense writes."""
+
+    @pytest.mark.asyncio
+    async def test_rollups_follow_create_update_and_delete(self, client, auth_headers, db_session):
+        """Moves across categories and months keep the rollup equal to the raw data."""
+        food = (await client.post("/categories", json={"name": "Food"}, headers=auth_headers)).json()["id"]
+        travel = (await client.post("/categories", json={"name": "Travel"}, headers=auth_headers)).json()["id"]
+
+        created = []
+        for amount, created_at in ((10.0, "2024-05-02T09:00:00"), (20.0, "2024-05-20T09:00:00"), (30.0, "2024-06-01T09:00:00")):
+            response = await client.post(
+                "/expenses",
+                json={"category_id": food, "amount": amount, "created_at": created_at},
+                headers=auth_headers,
+            )
+            created.append(response.json())
+
+        await client.patch(
+            f"/expenses/{created[0]['id']}",
+            json={"category_id": travel, "created_at": "2024-07-15T09:00:00", "amount": 12.0},
+            headers=auth_headers,
+        )
+        await client.delete(f"/expenses/{created[2]['id']}", headers=auth_headers)
+
+        user_id = (
+            await db_session.execute(select(models.Expense.user_id).where(models.Expense.id == created[1]["id"]))
+        ).scalar_one()
+        rows = (
+            await db_session.execute(
+                select(models.ExpenseMonthlyRollup).where(models.ExpenseMonthlyRollup.user_id == user_id)
+            )
+        ).scalars().all()
+
+        assert {(row.category_id, row.month.isoformat(), float(row.total), row.count) for row in rows} == {
+            (food, "2024-05-01", 20.0, 1),
+            (travel, "2024-07-01", 12.0, 1),
+        }
+        assert await rollups.verify(db_session, user_id) == []
+
+    def test_split_range_uses_utc_months(self):
+        """Bounds with a UTC offset are split on UTC month boundaries."""
+        paris = timezone(timedelta(hours=2))
+        start, end = datetime(2024, 3, 1, tzinfo=paris), datetime(2024, 4, 1, tzinfo=paris)
+        # 2024-02-29 22:00 UTC → 2024-03-31 22:00 UTC : aucun mois complet
+        assert rollups.split_range(start, end) == (
+            None,
+            [(datetime(2024, 2, 29, 22, tzinfo=timezone.utc), datetime(2024, 3, 31, 22, tzinfo=timezone.utc))],
+        )
+        months, edges = rollups.split_range(start, datetime(2024, 5, 1, 2, tzinfo=paris))
+        assert months == (date(2024, 3, 1), date(2024, 5, 1))
+        assert edges == [(datetime(2024, 2, 29, 22, tzinfo=timezone.utc), datetime(2024, 3, 1, tzinfo=timezone.utc))]
+
+    @pytest.mark.asyncio
+    async def test_offset_period_excludes_previous_month(self, client, auth_headers):
+        """A period given with a UTC offset does not read the previous month from the rollup."""
+        food = (await client.post("/categories", json={"name": "Food"}, headers=auth_headers)).json()["id"]
+        for amount, created_at in ((100.0, "2024-02-15T09:00:00"), (5.0, "2024-03-10T09:00:00")):
+            await client.post(
+                "/expenses",
+                json={"category_id": food, "amount": amount, "created_at": created_at},
+                headers=auth_headers,
+            )
+        response = await client.get(
+            "/summary",
+            params={"start_date": "2024-03-01T00:00:00+02:00", "end_date": "2024-03-31T00:00:00+02:00"},
+            headers=auth_headers,
+        )
+        assert response.json()["total"] == 5.0
+
+    @pytest.mark.asyncio
+    async def test_rebuild_restores_rollups(self, client, auth_headers, db_session):
+        """rebuild() recomputes rollups that drifted from the raw expenses."""
+        food = (await client.post("/categories", json={"name": "Food"}, headers=auth_headers)).json()["id"]
+        expense = (
+            await client.post(
+                "/expenses",
+                json={"category_id": food, "amount": 5.0, "created_at": "2024-08-08T08:00:00"},
+                headers=auth_headers,
+            )
+        ).json()
+        user_id = (
+            await db_session.execute(select(models.Expense.user_id).where(models.Expense.id == expense["id"]))
+        ).scalar_one()
+
+        await db_session.execute(
+            models.ExpenseMonthlyRollup.__table__.delete().where(models.ExpenseMonthlyRollup.user_id == user_id)
+        )
+        assert len(await rollups.verify(db_session, user_id)) == 1
+
+        assert await rollups.rebuild(db_session, user_id) == 1
+        assert await rollups.verify(db_session, user_id) == []
+        await db_session.rollback()